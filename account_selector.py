@@ -0,0 +1,132 @@
+import os
+import heapq
+from rate_limit import clock
+import config
+
+
+class AccountState:
+    __slots__ = ('account', 'latency', 'failures', 'sends', 'last_send', 'version')
+
+    def __init__(self, account):
+        self.account = account
+        self.latency = None     # EWMA of send latency (seconds)
+        self.failures = 0       # consecutive failures
+        self.sends = 0
+        self.last_send = 0.0
+        self.version = 0
+
+
+class AccountSelector:
+    """Weighted least-recently-used choice of the sending account.
+
+    Every group keeps a heap of its accounts ordered by
+    `last_send + latency * LATENCY_WEIGHT + failures * FAILURE_PENALTY`, so
+    the account that spoke longest ago wins unless it is slow or failing.
+    Accounts on cooldown (RateLimiter) or that spoke in the group less than
+    `min_gap` seconds ago are skipped. Updates push a new heap entry and
+    leave the old one to be dropped lazily, keeping selection O(log n).
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.states = {}
+        self.heaps = {}         # group -> [(priority, version, account)]
+        self.members = {}       # group -> set of accounts
+        self.min_gaps = {}      # group -> seconds
+        self.group_last = {}    # (account, group) -> time of last send there
+
+    def add(self, group, account, min_gap=None):
+        """Register an account as a sender for a group"""
+        self.min_gaps[group] = config.ACCOUNT_MIN_GAP if min_gap is None else min_gap
+        self.members.setdefault(group, set()).add(account)
+        state = self.states.get(account)
+        if state is None:
+            state = self.states[account] = AccountState(account)
+        heapq.heappush(self.heaps.setdefault(group, []), (self._priority(state), state.version, account))
+
+    def remove(self, group, account):
+        self.members.get(group, set()).discard(account)
+
+    def set_min_gap(self, group, min_gap=None):
+        self.min_gaps[group] = config.ACCOUNT_MIN_GAP if min_gap is None else min_gap
+
+    def _priority(self, state):
+        return (state.last_send
+                + (state.latency or 0.0) * config.LATENCY_WEIGHT
+                + state.failures * config.FAILURE_PENALTY)
+
+    def _update(self, state):
+        state.version += 1
+        entry = (self._priority(state), state.version, state.account)
+        for group, members in self.members.items():
+            if state.account in members:
+                heapq.heappush(self.heaps[group], entry)
+
+    def _gap_remaining(self, account, group, now):
+        last = self.group_last.get((account, group))
+        if last is None:
+            return 0.0
+        return max(0.0, last + self.min_gaps.get(group, 0) - now)
+
+    def select(self, group, chat, exclude=()):
+        """Best eligible account for the group, or None if all are cooling down / too recent"""
+        heap = self.heaps.get(group, [])
+        members = self.members.get(group, set())
+        now = clock()
+        skipped = []
+        chosen = None
+        while heap:
+            entry = heapq.heappop(heap)
+            _, version, account = entry
+            if account not in members or version != self.states[account].version:
+                continue  # stale entry
+            skipped.append(entry)
+            if account in exclude:
+                continue
+            if self.limiter.account_wait(account, chat) or self._gap_remaining(account, group, now):
+                continue
+            chosen = account
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    def next_available(self, group, chat):
+        """Seconds until some account of the group becomes eligible"""
+        now = clock()
+        waits = [max(self.limiter.account_wait(a, chat), self._gap_remaining(a, group, now))
+                 for a in self.members.get(group, ())]
+        return min(waits) if waits else None
+
+    def record_success(self, account, group, latency):
+        state = self.states[account]
+        state.latency = latency if state.latency is None else (
+            config.LATENCY_EWMA_ALPHA * latency + (1 - config.LATENCY_EWMA_ALPHA) * state.latency)
+        state.failures = 0
+        state.sends += 1
+        state.last_send = clock()
+        self.group_last[(account, group)] = state.last_send
+        self._update(state)
+
+    def record_failure(self, account):
+        state = self.states[account]
+        state.failures += 1
+        self._update(state)
+
+    def stats(self):
+        return {
+            os.path.basename(s.account).replace('.session', ''): {
+                'sends': s.sends,
+                'failures': s.failures,
+                'latency': s.latency,
+                'last_send': s.last_send,
+            }
+            for s in self.states.values()
+        }
+
+    def format_report(self):
+        lines = ["Accounts:"]
+        for name, s in sorted(self.stats().items()):
+            latency = f"{s['latency']:.2f}s" if s['latency'] is not None else "-"
+            lines.append(f"  {name}: {s['sends']} sends, latency {latency}, {s['failures']} consecutive failures")
+        return "\n".join(lines)
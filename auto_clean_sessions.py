@@ -1,8 +1,10 @@
 import os
 import asyncio
 from telethon import TelegramClient, errors
+import time
 import config
 import glob
+from proxy_manager import get_proxy_manager, proxy_dict
 
 async def check_and_clean(folder_name):
     session_dir = os.path.join(config.SESSIONS_DIR, folder_name)
@@ -16,21 +18,20 @@ async def check_and_clean(folder_name):
     for session_path in session_files:
         phone = os.path.basename(session_path).replace('.session', '')
         
-        # Use a random proxy
-        proxy = config.PROXY_LIST[0] 
-        proxy_dict = {
-            'proxy_type': proxy[0],
-            'addr': proxy[1],
-            'port': proxy[2],
-            'rdns': proxy[3],
-            'username': proxy[4],
-            'password': proxy[5]
-        }
+        # Healthiest proxy for this session
+        proxies = get_proxy_manager()
+        proxy = proxies.best(session_path)
 
-        client = TelegramClient(session_path, config.API_ID, config.API_HASH, proxy=proxy_dict)
+        client = TelegramClient(session_path, config.API_ID, config.API_HASH, proxy=proxy_dict(proxy))
         
         try:
-            await client.connect()
+            started = time.monotonic()
+            try:
+                await client.connect()
+            except (OSError, ConnectionError, asyncio.TimeoutError):
+                proxies.record_failure(proxy, session_path)
+                raise
+            proxies.record_success(proxy, time.monotonic() - started, session_path)
             if not await client.is_user_authorized():
                 print(f"[INVALID] {phone} - Not authorized. Deleting...")
                 await client.disconnect()
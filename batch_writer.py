@@ -0,0 +1,235 @@
+import os
+import io
+import csv
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import date
+import config
+
+_FLUSH = object()
+_CLOSE = object()
+
+# Every writer still open, closed (and flushed) at interpreter exit
+_open_writers = set()
+
+
+class BatchWriter:
+    """Append-only file writer that never blocks the caller.
+
+    write() only puts the item on a queue. A background thread collects
+    items and writes them in one go when `flush_rows` are waiting or
+    `flush_interval` seconds after the first one arrived, whichever comes
+    first. With `rotate_daily`, a path containing "{date}" gets today's date
+    filled in; any other path is renamed to name.<date>.ext when the day
+    changes. Everything queued is written on close() and at exit.
+    """
+
+    def __init__(self, path, flush_rows=None, flush_interval=None, rotate_daily=True):
+        self.path_template = path
+        self.flush_rows = flush_rows or config.WRITER_FLUSH_ROWS
+        self.flush_interval = flush_interval or config.WRITER_FLUSH_INTERVAL
+        self.rotate_daily = rotate_daily
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.path = None
+        self.day = None
+        self.written = 0
+        self.batches = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"writer:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+        _open_writers.add(self)
+
+    def write(self, item):
+        if not self._closed:
+            self.queue.put(item)
+
+    def flush(self):
+        """Ask the thread to write what it has now (does not wait)"""
+        self.queue.put(_FLUSH)
+
+    def close(self):
+        """Write everything still queued and stop the thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_CLOSE)
+        self._thread.join()
+        _open_writers.discard(self)
+
+    # -- background thread ---------------------------------------------------
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+            if item is not _FLUSH and item is not _CLOSE:
+                batch.append(item)
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.flush_rows:
+                    continue
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Warning: {self.path_template}: could not write {len(batch)} records: {e}",
+                          file=sys.__stderr__)
+                batch = []
+            if item is _CLOSE:
+                if self.file:
+                    self.file.close()
+                return
+
+    def _write_batch(self, batch):
+        f = self._current_file()
+        for item in batch:
+            self._write_item(f, item)
+        f.flush()
+        self.written += len(batch)
+        self.batches += 1
+
+    def _current_file(self):
+        today = date.today()
+        if self.file is not None and (not self.rotate_daily or today == self.day):
+            return self.file
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.rotate_daily and '{date}' in self.path_template:
+            self.path = self.path_template.format(date=today.strftime(config.WRITER_DATE_FORMAT))
+        else:
+            self.path = self.path_template
+            if self.rotate_daily and os.path.exists(self.path):
+                written_on = date.fromtimestamp(os.path.getmtime(self.path))
+                if written_on != today:
+                    stem, ext = os.path.splitext(self.path)
+                    os.replace(self.path, f"{stem}.{written_on.strftime(config.WRITER_DATE_FORMAT)}{ext}")
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = self._open(self.path)
+        self.day = today
+        if is_new:
+            self._start_file(self.file)
+        return self.file
+
+    def _open(self, path):
+        return open(path, 'a', encoding='utf-8')
+
+    def _start_file(self, f):
+        pass
+
+    def _write_item(self, f, item):
+        f.write(item)
+
+
+class CsvWriter(BatchWriter):
+    """BatchWriter for CSV rows (dicts); a new or empty file gets the header first"""
+
+    def __init__(self, path, fieldnames, **kwargs):
+        self.fieldnames = fieldnames
+        super().__init__(path, **kwargs)
+
+    def _open(self, path):
+        f = open(path, 'a', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction='ignore')
+        return f
+
+    def _start_file(self, f):
+        self._csv.writeheader()
+
+    def _write_item(self, f, item):
+        self._csv.writerow(item)
+
+
+class BatchedLogHandler(logging.Handler):
+    """logging handler that hands formatted lines to a BatchWriter (replaces FileHandler)"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__()
+        self.writer = BatchWriter(path, **kwargs)
+
+    def emit(self, record):
+        try:
+            self.writer.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+class _StreamTarget(BatchWriter):
+    """BatchWriter that writes to an already open stream instead of a file"""
+
+    def __init__(self, stream, **kwargs):
+        self.stream = stream
+        super().__init__(getattr(stream, 'name', '<stream>'), rotate_daily=False, **kwargs)
+
+    def _current_file(self):
+        return self.stream
+
+
+class BufferedStdout(io.TextIOBase):
+    """Stand-in for sys.stdout: print() queues text instead of writing to the console.
+
+    The console (and, with `log_path`, a daily-rotated log file) is written
+    from a background thread in batches. close() flushes and puts the
+    original sys.stdout back.
+    """
+
+    def __init__(self, log_path=None, flush_interval=None):
+        self.original = sys.stdout
+        self.console = _StreamTarget(self.original, flush_interval=flush_interval)
+        self.log = BatchWriter(log_path, flush_interval=flush_interval) if log_path else None
+
+    @property
+    def encoding(self):
+        return getattr(self.original, 'encoding', 'utf-8')
+
+    def write(self, s):
+        self.console.write(s)
+        if self.log:
+            self.log.write(s)
+        return len(s)
+
+    def flush(self):
+        self.console.flush()
+        if self.log:
+            self.log.flush()
+
+    def reconfigure(self, **kwargs):
+        pass  # the real stream is written by the background thread
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        if sys.stdout is self:
+            sys.stdout = self.original
+        self.console.close()
+        if self.log:
+            self.log.close()
+        super().close()
+
+
+def buffer_stdout(log_path=None):
+    """Route print() through a BufferedStdout until its close()"""
+    stream = BufferedStdout(log_path)
+    sys.stdout = stream
+    return stream
+
+
+@atexit.register
+def _close_all():
+    for writer in list(_open_writers):
+        writer.close()
@@ -0,0 +1,195 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import config
+import sender
+from scheduler import SendScheduler
+from virtual_clock import run_virtual
+from fake_telegram import FakeBehavior, fake_sender
+
+# Sessions per group folder; bigger runs get more groups rather than one huge group
+SESSIONS_PER_GROUP = 100
+MEDIA_EVERY = 5                # every 5th CSV row is a media message
+MEDIA_SIZE = 64 * 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark sender.main against fake sessions on a virtual clock')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help='Session counts to run')
+    parser.add_argument('--rows', type=int, default=200, help='CSV rows per group')
+    parser.add_argument('--min-interval', type=float, default=5, help='Group min_interval (virtual seconds)')
+    parser.add_argument('--max-interval', type=float, default=10, help='Group max_interval (virtual seconds)')
+    parser.add_argument('--latency', type=float, nargs=2, default=[0.05, 0.3], help='Fake RPC latency range')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--baseline', help='Compare against a previous --json output; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression (0.2 = 20%%)')
+    parser.add_argument('--verbose', action='store_true', help="Show sender's own output")
+    return parser.parse_args()
+
+
+def write_fixture(root, sessions, rows, min_interval, max_interval):
+    """Session folders, CSVs and group_config.json for `sessions` fake accounts"""
+    sessions_dir = os.path.join(root, 'sessions')
+    media_dir = os.path.join(root, 'media')
+    os.makedirs(media_dir)
+    with open(os.path.join(media_dir, 'bench.jpg'), 'wb') as f:
+        f.write(os.urandom(MEDIA_SIZE))
+
+    groups = []
+    for g in range(max(1, -(-sessions // SESSIONS_PER_GROUP))):
+        folder = f"bench{g}"
+        os.makedirs(os.path.join(sessions_dir, folder))
+        for s in range(min(SESSIONS_PER_GROUP, sessions - g * SESSIONS_PER_GROUP)):
+            open(os.path.join(sessions_dir, folder, f"+1000{g:03d}{s:04d}.session"), 'w').close()
+        csv_file = os.path.join(root, f"{folder}.csv")
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['type', 'content', 'media_file'])
+            for i in range(rows):
+                if i % MEDIA_EVERY == MEDIA_EVERY - 1:
+                    writer.writerow(['photo', f"bench photo {i}", 'bench.jpg'])
+                else:
+                    writer.writerow(['text', f"bench message {i}", ''])
+        groups.append({'group_link': f"https://t.me/bench_group_{g}", 'topic_id': 1, 'session_folder': folder,
+                       'csv_file': csv_file, 'media_base_dir': media_dir,
+                       'min_interval': min_interval, 'max_interval': max_interval})
+    config_file = os.path.join(root, 'group_config.json')
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(groups, f)
+    return sessions_dir, config_file, groups
+
+
+class BenchScheduler(SendScheduler):
+    """SendScheduler that remembers itself and when dispatching started"""
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = None
+        BenchScheduler.instances.append(self)
+
+    async def run(self, stop_when_idle=True):
+        self.started = (self._now(), time.perf_counter(), tracemalloc.get_traced_memory()[0])
+        return await super().run(stop_when_idle)
+
+
+def run_size(sessions, args):
+    """One sender.main run with `sessions` fake accounts. Returns a result dict."""
+    behavior = FakeBehavior(latency=tuple(args.latency), failure_rate=args.failure_rate,
+                            flood_rate=args.flood_rate, disconnect_rate=args.disconnect_rate, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='bench_sender_') as root:
+        sessions_dir, config_file, groups = write_fixture(root, sessions, args.rows,
+                                                          args.min_interval, args.max_interval)
+
+        saved = (config.SESSIONS_DIR, config.GROUP_CONFIG_FILE, sender.SendScheduler, sys.argv)
+        config.SESSIONS_DIR, config.GROUP_CONFIG_FILE = sessions_dir, config_file
+        sender.SendScheduler = BenchScheduler
+        sys.argv = ['sender.py', '--reset-cursor']
+        BenchScheduler.instances.clear()
+        # sender.main() reconfigures stdout, so silence it with a real text file rather than StringIO
+        devnull = None if args.verbose else open(os.devnull, 'w', encoding='utf-8')
+        output = contextlib.redirect_stdout(devnull) if devnull else contextlib.nullcontext()
+        try:
+            with fake_sender(os.path.join(root, 'sandbox'), behavior), output:
+                tracemalloc.start()
+                base_memory = tracemalloc.get_traced_memory()[0]
+                wall_start = time.perf_counter()
+                _, virtual_elapsed = run_virtual(sender.main())
+                wall = time.perf_counter() - wall_start
+                tracemalloc.stop()
+        finally:
+            config.SESSIONS_DIR, config.GROUP_CONFIG_FILE, sender.SendScheduler, sys.argv = saved
+            if devnull:
+                devnull.close()
+
+    scheduler = BenchScheduler.instances[-1]
+    v_start, w_start, setup_memory = scheduler.started
+    drifts = [d for stats in scheduler.drift.values() for d in stats.recent]
+    drifts.sort()
+    sends = len(behavior.sent)
+    send_span = virtual_elapsed - v_start
+    return {
+        'sessions': sessions,
+        'groups': len(groups),
+        'sends': sends,
+        'virtual_seconds': round(virtual_elapsed, 1),
+        'sends_per_hour': round(sends / send_span * 3600, 1) if send_span > 0 else 0.0,
+        'startup_virtual': round(v_start, 2),
+        'startup_wall': round(w_start - wall_start, 3),
+        'wall_seconds': round(wall, 3),
+        'wall_ms_per_send': round(wall * 1000 / sends, 3) if sends else 0.0,
+        'memory_per_session_kb': round((setup_memory - base_memory) / 1024 / sessions, 1),
+        'drift_p95': round(drifts[min(len(drifts) - 1, int(len(drifts) * 0.95))], 3) if drifts else 0.0,
+        'drift_max': round(drifts[-1], 3) if drifts else 0.0,
+        'rpc_calls': sum(behavior.calls.values()),
+    }
+
+
+def format_results(results):
+    header = (f"{'sessions':>8} {'groups':>6} {'sends':>6} {'sends/h':>9} {'startup':>8} "
+              f"{'wall':>7} {'ms/send':>8} {'KB/sess':>8} {'drift p95':>9} {'max':>7}")
+    lines = [header, '-' * len(header)]
+    for r in results:
+        lines.append(f"{r['sessions']:>8} {r['groups']:>6} {r['sends']:>6} {r['sends_per_hour']:>9.1f} "
+                     f"{r['startup_virtual']:>7.1f}s {r['wall_seconds']:>6.2f}s {r['wall_ms_per_send']:>8.3f} "
+                     f"{r['memory_per_session_kb']:>8.1f} {r['drift_p95']:>8.2f}s {r['drift_max']:>6.2f}s")
+    return "\n".join(lines)
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a baseline run, as printable strings"""
+    previous = {r['sessions']: r for r in baseline}
+    problems = []
+    # (field, True if higher is better)
+    checks = [('sends_per_hour', True), ('startup_virtual', False), ('wall_ms_per_send', False),
+              ('memory_per_session_kb', False), ('drift_p95', False)]
+    for r in results:
+        old = previous.get(r['sessions'])
+        if not old:
+            continue
+        for field, higher_is_better in checks:
+            before, after = old[field], r[field]
+            if higher_is_better:
+                bad = after < before * (1 - tolerance)
+            else:
+                # Small absolute values are noise: allow 0.5 units of slack on top
+                bad = after > before * (1 + tolerance) + 0.5
+            if bad:
+                problems.append(f"{r['sessions']} sessions: {field} {before} -> {after}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    results = []
+    for size in args.sizes:
+        print(f"Running {size} sessions...")
+        results.append(run_size(size, args))
+    print()
+    print(format_results(results))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        if problems:
+            print("\nRegressions:")
+            for p in problems:
+                print(f"  {p}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -1,131 +1,115 @@
 import os
 import asyncio
-from telethon import TelegramClient, functions
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.tl.functions.messages import GetDiscussionMessageRequest
-from dotenv import load_dotenv
+import argparse
 import time
+from telethon import errors
+from telethon.tl.functions.channels import GetParticipantRequest
+from telethon.tl.types import InputPeerSelf
+import config
+from sender import race_connect, get_peer_cache, get_session_files, load_group_config
+from proxy_manager import get_proxy_manager
+from membership_ledger import get_ledger, ensure_joined, JOINED, BANNED, PENDING, TOO_MANY
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='批量核对账号入群状态并刷新入群记录')
+    parser.add_argument('--folder', type=str, help='只核对 sessions 下的这个目录（默认: group_config 里的全部条目）')
+    parser.add_argument('--group', type=str, help='群组链接（与 --folder 一起使用）')
+    parser.add_argument('--topic', type=int, help='同时检查能否访问该 Topic')
+    parser.add_argument('--no-join', action='store_true', help='只核对，不尝试加入')
+    parser.add_argument('--concurrency', type=int, help='同时核对的账号数')
+    return parser.parse_args()
+
+
+def audit_targets(args):
+    """(session_folder, group_link, topic_id) to audit"""
+    if args.folder:
+        if not args.group:
+            raise SystemExit("--folder 需要同时指定 --group")
+        return [(args.folder, args.group, args.topic)]
+    targets = []
+    for item in load_group_config().values():
+        targets.append((item['session_folder'], item['group_link'], item.get('topic_id')))
+    return targets
+
+
+async def check_membership(session_path, group_link, topic_id, join=True):
+    """核对单个账号的入群状态，写入入群记录。返回 (状态, 说明)"""
+    name = os.path.basename(session_path)
+    ledger = get_ledger()
+    client, _ = await race_connect(session_path, get_proxy_manager().ordered(session_path))
+    if not client:
+        return None, "连接失败/未授权"
 
-# 加载环境变量
-load_dotenv()
-
-# 配置
-API_ID = os.getenv("API_ID")
-API_HASH = os.getenv("API_HASH")
-TARGET_GROUP = "https://t.me/hopper_global"  # 主群组链接
-TOPIC_ID = 1  # topic ID
-SESSIONS_DIR = "hecai"
-
-# 代理配置
-PROXY_CONFIG = {
-    'proxy_type': 'socks5',
-    'addr': '45.252.58.93',
-    'port': 6722,
-    'username': 'Maomaomao77',
-    'password': 'Maomaomao77'
-}
-
-async def check_membership(session_file):
-    """检查单个账号的群组成员身份，如果未加入则尝试加入"""
-    session_path = os.path.join(SESSIONS_DIR, session_file.replace('.session', ''))
-    client = TelegramClient(session_path, API_ID, API_HASH, proxy=PROXY_CONFIG)
-    
     try:
-        await client.connect()
-        if not await client.is_user_authorized():
-            print(f"[未授权] {session_file}")
-            return False
-            
-        me = await client.get_me()
-        print(f"\n检查账号: {me.first_name} (@{me.username})")
-        
+        channel = await get_peer_cache(session_path).resolve(client, group_link)
         try:
-            # 先获取主群组
-            channel = await client.get_entity(TARGET_GROUP)
-            
+            await client(GetParticipantRequest(channel, InputPeerSelf()))
+            status = JOINED
+            ledger.record(session_path, group_link, status)
+        except errors.UserNotParticipantError:
+            if not join:
+                ledger.invalidate(session_path, group_link)
+                return None, "未加入群组"
+            print(f"[!] {name} - 未加入群组，正在尝试加入...")
+            status = await ensure_joined(client, session_path, group_link, channel, ledger, refresh=True)
+        except (errors.ChannelPrivateError, errors.UserBannedInChannelError) as e:
+            status = BANNED
+            ledger.record(session_path, group_link, status, type(e).__name__)
+
+        note = ""
+        if status == JOINED and topic_id:
+            # 尝试访问指定的topic
             try:
-                # 检查是否在群组中
-                participant = await client.get_participants(channel, limit=1)
-                print(f"[✓] {session_file} - 已在主群组中")
-                
-                # 尝试访问指定的topic
-                try:
-                    # 获取topic消息
-                    message = await client.get_messages(channel, ids=TOPIC_ID)
-                    if message:
-                        print(f"[✓] {session_file} - 可以访问Topic {TOPIC_ID}")
-                        return True
-                    else:
-                        print(f"[!] {session_file} - 无法访问Topic {TOPIC_ID}")
-                        return False
-                except Exception as topic_error:
-                    print(f"[✗] {session_file} - 访问Topic失败: {str(topic_error)}")
-                    return False
-                    
-            except Exception:
-                print(f"[!] {session_file} - 未加入群组，正在尝试加入...")
-                try:
-                    await client(JoinChannelRequest(channel))
-                    print(f"[✓] {session_file} - 成功加入群组")
-                    # 等待一下再检查topic访问权限
-                    await asyncio.sleep(2)
-                    try:
-                        message = await client.get_messages(channel, ids=TOPIC_ID)
-                        if message:
-                            print(f"[✓] {session_file} - 可以访问Topic {TOPIC_ID}")
-                            return True
-                        else:
-                            print(f"[!] {session_file} - 无法访问Topic {TOPIC_ID}")
-                            return False
-                    except Exception as topic_error:
-                        print(f"[✗] {session_file} - 访问Topic失败: {str(topic_error)}")
-                        return False
-                except Exception as join_error:
-                    print(f"[✗] {session_file} - 加入群组失败: {str(join_error)}")
-                    return False
-                    
-        except Exception as e:
-            print(f"[错误] {session_file} - 获取群组信息失败: {str(e)}")
-            return False
-            
+                message = await client.get_messages(channel, ids=topic_id)
+                note = f"可以访问Topic {topic_id}" if message else f"无法访问Topic {topic_id}"
+            except Exception as topic_error:
+                note = f"访问Topic失败: {topic_error}"
+        return status, note
+
+    except errors.FloodWaitError as e:
+        return None, f"FloodWait {e.seconds}s，稍后重试"
     except Exception as e:
-        print(f"[错误] {session_file} - 连接失败: {str(e)}")
-        return False
+        return None, f"获取群组信息失败: {e}"
     finally:
         try:
             await client.disconnect()
         except:
             pass
 
+
 async def main():
-    # 获取所有session文件
-    session_files = [f for f in os.listdir(SESSIONS_DIR) if f.endswith('.session')]
-    
-    if not session_files:
-        print(f"在 {SESSIONS_DIR} 目录中没有找到session文件")
-        return
-        
-    print(f"找到 {len(session_files)} 个session文件")
-    print("-" * 50)
-    
-    # 检查结果统计
-    total = len(session_files)
-    success = 0
-    failed = 0
-    
-    # 检查每个session
-    for session_file in session_files:
-        if await check_membership(session_file):
-            success += 1
-        else:
-            failed += 1
+    args = parse_args()
+    semaphore = asyncio.Semaphore(args.concurrency or config.MEMBERSHIP_AUDIT_CONCURRENCY)
+    counts = {JOINED: 0, PENDING: 0, TOO_MANY: 0, BANNED: 0, None: 0}
+
+    for session_folder, group_link, topic_id in audit_targets(args):
+        session_files = get_session_files(session_folder)
+        if not session_files:
+            continue
+        print(f"\n核对 {session_folder} -> {group_link}: {len(session_files)} 个session文件")
         print("-" * 50)
-    
+
+        async def bounded(session_path):
+            async with semaphore:
+                status, note = await check_membership(session_path, group_link, topic_id, join=not args.no_join)
+            mark = {JOINED: "✓", PENDING: "…", TOO_MANY: "…", BANNED: "✗"}.get(status, "!")
+            print(f"[{mark}] {os.path.basename(session_path)} - {status or '未知'} {note}".rstrip())
+            return status
+
+        start = time.monotonic()
+        for status in await asyncio.gather(*(bounded(f) for f in session_files)):
+            counts[status] += 1
+        print(f"用时 {time.monotonic() - start:.1f}s")
+
     # 打印统计结果
     print("\n检查完成!")
-    print(f"总计: {total} 个账号")
-    print(f"已加入群组并可以访问Topic: {success} 个")
-    print(f"未加入群组或无法访问Topic: {failed} 个")
+    print(f"已加入: {counts[JOINED]} 个")
+    print(f"待审核: {counts[PENDING]} 个")
+    print(f"加入的群组过多（稍后重试）: {counts[TOO_MANY]} 个")
+    print(f"被封禁/无法加入: {counts[BANNED]} 个")
+    print(f"未核对成功: {counts[None]} 个")
+    print(get_proxy_manager().format_report())
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,293 @@
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from telethon import functions
+import config
+from metrics import get_metrics
+
+
+class PooledClient:
+    """A connected client plus its keep-alive / reconnect bookkeeping"""
+
+    def __init__(self, session_path, client):
+        self.session_path = session_path
+        self.name = os.path.basename(session_path).replace('.session', '')
+        self.client = client
+        self.reconnects = 0
+        self.connect_times = []      # seconds from drop detected -> connected again
+        self.last_ping = None
+        self.down_since = None
+        self.connected = asyncio.Event()
+        self.connected.set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+
+class ClientPool:
+    """Keeps every session's connection alive and hands out connected clients.
+
+    Each client gets a background task that pings it every KEEPALIVE_INTERVAL
+    seconds. When a ping fails (or a caller reports a failure) the task
+    reconnects with exponential backoff, so the send path never pays for a
+    cold MTProto handshake itself. With `connect`, every reconnect builds a
+    new client with it (sender races the proxies again) instead of reusing
+    the old connection settings.
+    """
+
+    def __init__(self, keepalive_interval=None, ping_timeout=None,
+                 backoff_base=None, backoff_max=None, connect=None, reconnect_timeout=None):
+        self.keepalive_interval = keepalive_interval or config.KEEPALIVE_INTERVAL
+        self.ping_timeout = ping_timeout or config.KEEPALIVE_TIMEOUT
+        self.backoff_base = backoff_base or config.RECONNECT_BACKOFF_BASE
+        self.backoff_max = backoff_max or config.RECONNECT_BACKOFF_MAX
+        # async connect(session_path) -> connected client or None; None = reconnect the same client
+        self.connect = connect
+        self.reconnect_timeout = reconnect_timeout or config.RECONNECT_TIMEOUT
+        self.entries = {}
+
+    def add(self, session_path, client):
+        """Register an already-connected client and start keeping it alive"""
+        entry = PooledClient(session_path, client)
+        self.entries[session_path] = entry
+        entry.task = asyncio.create_task(self._keepalive(entry))
+        return entry
+
+    async def acquire(self, session_path, timeout=30):
+        """Return a connected client for the session, or None if it stays down"""
+        entry = self.entries.get(session_path)
+        if entry is None:
+            return None
+        if not entry.client.is_connected():
+            self._mark_down(entry)
+        if not entry.connected.is_set():
+            try:
+                await asyncio.wait_for(entry.connected.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return entry.client
+
+    def report_failure(self, session_path):
+        """A send failed: have the keep-alive task verify the connection right away"""
+        entry = self.entries.get(session_path)
+        if entry is not None:
+            entry.wakeup.set()
+
+    def _mark_down(self, entry):
+        if entry.connected.is_set():
+            entry.connected.clear()
+            entry.down_since = time.monotonic()
+        entry.wakeup.set()
+
+    async def _ping(self, entry):
+        ping = functions.PingRequest(ping_id=random.getrandbits(63))
+        await asyncio.wait_for(entry.client(ping), self.ping_timeout)
+        entry.last_ping = time.monotonic()
+
+    async def _keepalive(self, entry):
+        while True:
+            try:
+                await asyncio.wait_for(entry.wakeup.wait(), self.keepalive_interval)
+            except asyncio.TimeoutError:
+                pass
+            entry.wakeup.clear()
+
+            if entry.client.is_connected():
+                try:
+                    await self._ping(entry)
+                    continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[pool] Ping failed for {entry.name}: {e}")
+
+            self._mark_down(entry)
+            entry.wakeup.clear()
+            await self._reconnect(entry)
+
+    async def _reconnect(self, entry):
+        delay = self.backoff_base
+        while True:
+            try:
+                try:
+                    await entry.client.disconnect()
+                except Exception:
+                    pass
+                if self.connect is None:
+                    await asyncio.wait_for(entry.client.connect(), self.reconnect_timeout)
+                else:
+                    # Fresh client through the best proxy right now: the old one's proxy may be dead
+                    client = await asyncio.wait_for(self.connect(entry.session_path), self.reconnect_timeout)
+                    if client is None:
+                        raise ConnectionError("no proxy could connect")
+                    entry.client = client
+                await self._ping(entry)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                wait = random.uniform(delay / 2, delay)
+                print(f"[pool] Reconnect failed for {entry.name}: {e}. Retrying in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.backoff_max)
+
+        entry.reconnects += 1
+        get_metrics().inc('tg_reconnects_total')
+        if entry.down_since is not None:
+            entry.connect_times.append(time.monotonic() - entry.down_since)
+            entry.down_since = None
+        entry.connected.set()
+
+    def stats(self):
+        """Per-session reconnect counts and time-to-connected figures"""
+        result = {}
+        for entry in self.entries.values():
+            times = entry.connect_times
+            result[entry.name] = {
+                'connected': entry.connected.is_set(),
+                'reconnects': entry.reconnects,
+                'last_time_to_connected': times[-1] if times else None,
+                'avg_time_to_connected': sum(times) / len(times) if times else None,
+            }
+        return result
+
+    def format_report(self):
+        lines = []
+        for name, s in sorted(self.stats().items()):
+            avg = f"{s['avg_time_to_connected']:.2f}s" if s['avg_time_to_connected'] is not None else "-"
+            last = f"{s['last_time_to_connected']:.2f}s" if s['last_time_to_connected'] is not None else "-"
+            state = "up" if s['connected'] else "down"
+            lines.append(f"  {name}: {state}, reconnects={s['reconnects']}, last={last}, avg={avg}")
+        return "\n".join(lines)
+
+    async def remove(self, session_path):
+        """Stop keeping a session alive and disconnect it"""
+        entry = self.entries.pop(session_path, None)
+        if entry is None:
+            return
+        if entry.task:
+            entry.task.cancel()
+            try:
+                await entry.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        try:
+            await entry.client.disconnect()
+        except Exception:
+            pass
+
+    async def close(self):
+        """Stop keep-alive tasks and disconnect every client"""
+        for entry in self.entries.values():
+            if entry.task:
+                entry.task.cancel()
+        for entry in self.entries.values():
+            if entry.task:
+                try:
+                    await entry.task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            try:
+                await entry.client.disconnect()
+            except Exception:
+                pass
+        self.entries.clear()
+
+
+class _CachedClient:
+    def __init__(self):
+        self.client = None
+        self.lock = asyncio.Lock()
+        self.users = 0          # requests holding or waiting for the lock
+        self.last_used = time.monotonic()
+
+
+class LruClientPool:
+    """Connected clients for short request/response work (web_manager), reused between calls.
+
+    `connect(session_path)` is awaited on a miss and must return a connected
+    client. At most `max_size` clients stay connected; the least recently
+    used idle one is disconnected first, and run_evictor() drops clients idle
+    for longer than `idle_timeout`. session() holds a per-session lock, so two
+    requests never drive the same account at once.
+    """
+
+    def __init__(self, connect, max_size=None, idle_timeout=None):
+        self.connect = connect
+        self.max_size = max_size or config.WEB_CLIENT_POOL_SIZE
+        self.idle_timeout = idle_timeout or config.WEB_CLIENT_IDLE_TIMEOUT
+        self.entries = OrderedDict()   # session_path -> _CachedClient, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @asynccontextmanager
+    async def session(self, session_path):
+        """Connected client for the session, held exclusively until the block ends.
+
+        An exception escaping the block disconnects the client: its state is
+        unknown, so the next call starts from a fresh connection.
+        """
+        entry = self.entries.get(session_path)
+        if entry is None:
+            entry = self.entries[session_path] = _CachedClient()
+        self.entries.move_to_end(session_path)
+        entry.users += 1
+        try:
+            async with entry.lock:
+                if entry.client is not None and not entry.client.is_connected():
+                    await self._disconnect(entry)
+                if entry.client is None:
+                    self.misses += 1
+                    entry.client = await self.connect(session_path)
+                else:
+                    self.hits += 1
+                try:
+                    yield entry.client
+                except BaseException:
+                    await self._disconnect(entry)
+                    raise
+                finally:
+                    entry.last_used = time.monotonic()
+        finally:
+            entry.users -= 1
+            if entry.client is None and not entry.users and self.entries.get(session_path) is entry:
+                del self.entries[session_path]
+        await self._evict(lambda e: len(self.entries) > self.max_size)
+
+    async def _disconnect(self, entry):
+        client, entry.client = entry.client, None
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def _evict(self, should_evict):
+        """Disconnect unused clients, oldest first, while should_evict(entry) says so"""
+        for session_path, entry in list(self.entries.items()):
+            if entry.users or not should_evict(entry):
+                continue
+            del self.entries[session_path]
+            self.evictions += 1
+            await self._disconnect(entry)
+
+    async def run_evictor(self):
+        """Background task: disconnect clients nobody used for `idle_timeout` seconds"""
+        while True:
+            await asyncio.sleep(max(1, self.idle_timeout / 4))
+            now = time.monotonic()
+            await self._evict(lambda e: now - e.last_used > self.idle_timeout)
+
+    def stats(self):
+        return {'connected': sum(1 for e in self.entries.values() if e.client is not None),
+                'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    async def close(self):
+        """Disconnect every client"""
+        for entry in list(self.entries.values()):
+            await self._disconnect(entry)
+        self.entries.clear()
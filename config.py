@@ -21,6 +21,125 @@ REACTION_EMOJIS = ['👍', '🔥', '🎉', '😂']
 PROXY_LIST = [
     ("socks5", "50.3.54.17", 443, True, "VYHMOLXmzmCy", "X9FgH374SH"),
     ("socks5", "66.93.164.245", 50101, True, "zhouyunhua0628", "pzBLnbDWjs"),
+    # 原先写在 monitor_new_members.py / get_latest_messages.py 里的代理
+    ("socks5", "119.42.39.170", 5798, True, "Maomaomao77", "Maomaomao77"),
+    ("socks5", "86.38.26.189", 6354, True, "binghua99", "binghua99"),
+    ("socks5", "198.105.111.87", 6765, True, "binghua99", "binghua99"),
+    ("socks5", "185.236.95.32", 5993, True, "binghua99", "binghua99"),
 ]
 
 
+
+# 连接池配置（sender 保持长连接）
+KEEPALIVE_INTERVAL = 45        # 心跳间隔（秒）
+KEEPALIVE_TIMEOUT = 10         # 单次心跳超时（秒）
+RECONNECT_BACKOFF_BASE = 2     # 重连退避起始值（秒）
+RECONNECT_BACKOFF_MAX = 120    # 重连退避上限（秒）
+RECONNECT_TIMEOUT = 60         # 单次重连（重新竞速所有代理）的超时（秒）
+
+# web_manager 复用已连接的客户端（LRU），避免每次扫描/修改都重新握手
+WEB_CLIENT_POOL_SIZE = 20      # 最多保持连接的账号数，超出时断开最久未用的
+WEB_CLIENT_IDLE_TIMEOUT = 300  # 闲置多久后断开（秒）
+WEB_SCAN_CONCURRENCY = 8       # /api/folders/{name}/scan 同时扫描的账号数
+
+# 启动时并发初始化 session
+BOOTSTRAP_CONCURRENCY = 10     # 同时连接的 session 数量上限
+BOOTSTRAP_TIMEOUT = 120        # 单个 session 连接 + 入群的总时限（秒），超时记为失败
+PROXY_RACE_DELAY = 3           # 上一个代理多久没连上就并行尝试下一个（秒）
+PROXY_CONNECT_TIMEOUT = 20     # 单个代理连接的超时（秒），超时记为该代理失败
+CONNECT_RETRIES = 2            # Telethon 内部重试次数（不能无限，否则死代理永远不会报错）
+
+# 已上传媒体缓存目录（每个账号一个 json，按文件内容哈希复用 InputPhoto/InputDocument）
+MEDIA_CACHE_DIR = ".cache/media"
+
+# 超过该大小的 CSV 改为按需读取（基于 <csv>.idx 字节偏移索引 + mmap）
+STREAM_CSV_MIN_BYTES = 512 * 1024
+
+# 运行状态目录（发送进度等）
+STATE_DIR = ".state"
+CURSOR_FILE = "cursors.json"
+CURSOR_FLUSH_EVERY = 5         # 累计多少次进度更新写一次盘
+CURSOR_FLUSH_INTERVAL = 60     # 或距离上次写盘超过多少秒
+
+# 全局发送调度
+MAX_CONCURRENT_SENDS = 8       # 同时进行中的发送数量上限
+MIN_DISPATCH_GAP = 0           # 任意两次发送之间的最小间隔（秒），0 表示不限速
+STATUS_REPORT_INTERVAL = 600   # 调度漂移报告间隔（秒）
+
+# 发送限速（令牌桶）与 FloodWait 冷却
+ACCOUNT_SENDS_PER_MINUTE = 6   # 单个账号每分钟最多发送条数
+CHAT_SENDS_PER_MINUTE = 20     # 单个群每分钟最多发送条数
+RATE_LIMIT_BURST = 3           # 令牌桶容量（允许的突发条数）
+FLOOD_DEFAULT_COOLDOWN = 300   # FloodError 未给出等待时间时的冷却（秒）
+
+# 发送账号选择（加权最久未使用）
+ACCOUNT_MIN_GAP = 0            # 同一账号在同一群再次发言的最小间隔（秒），0 = 不限制；按群在 group_config 里用 min_account_gap 开启
+LATENCY_WEIGHT = 30            # 每秒发送延迟折算的排序惩罚（秒）
+FAILURE_PENALTY = 900          # 每次连续失败折算的排序惩罚（秒）
+LATENCY_EWMA_ALPHA = 0.3
+
+# 多进程分片（sender.py --shards N）
+SHARD_STATUS_INTERVAL = 30     # 子进程写状态文件的间隔（秒）
+SHARD_RESTART_DELAY = 5        # 子进程崩溃后重启的起始等待（秒）
+
+# 账号身份缓存（<session>.identity.json），超过该时间才重新 get_me（秒）
+IDENTITY_MAX_AGE = 7 * 24 * 3600
+
+# 已解析群组 peer 缓存（每个账号一个 json：channel_id + access_hash）
+PEER_CACHE_DIR = ".cache/peers"
+PEER_CACHE_MAX_AGE = 7 * 24 * 3600   # 超过该时间重新解析（秒）
+
+# 代理健康管理（所有脚本共用 proxy_manager）
+PROXY_STATE_FILE = "proxy_health.db"   # STATE_DIR 下的 SQLite，所有进程共用
+PROXY_SAVE_INTERVAL = 5        # 代理健康最多多久写一次库并读回其他进程的更新（秒）
+PROXY_EWMA_ALPHA = 0.3
+PROXY_UNKNOWN_LATENCY = 3      # 未测过的代理按该延迟排序（秒）
+PROXY_FAILURE_PENALTY = 10     # 每次连续失败折算的排序惩罚（秒）
+PROXY_BREAKER_THRESHOLD = 3    # 连续失败多少次后熔断
+PROXY_BREAKER_COOLDOWN = 600   # 熔断时长（秒），之后放行一次试探
+
+# 入群记录（每个账号一个 json：joined / pending / banned + 检查时间）
+MEMBERSHIP_DIR = ".state/membership"
+MEMBERSHIP_MAX_AGE = 3 * 24 * 3600        # 超过该时间启动时重新确认（秒）
+MEMBERSHIP_PENDING_RECHECK = 3600         # 待审核 / 加入群组过多的记录多久重新检查（秒）
+MEMBERSHIP_AUDIT_CONCURRENCY = 10         # check_group_membership 批量核对并发数
+
+# 运行指标（sender / 监控脚本写入 SQLite，web_manager 在 /metrics 输出）
+METRICS_DB = ".state/metrics.db"
+METRICS_FLUSH_INTERVAL = 15    # 内存中的计数多久写一次库（秒）
+
+# 运行中检测 group_config.json 的修改并热加载（秒），0 表示关闭
+CONFIG_WATCH_INTERVAL = 10
+
+# 日志 / 记录写入（后台线程批量写盘，按天切分）
+WRITER_FLUSH_ROWS = 200        # 攒够多少条写一次
+WRITER_FLUSH_INTERVAL = 2      # 最多等待多久写一次（秒）
+WRITER_DATE_FORMAT = "%Y%m%d"  # 按天切分的文件名日期格式
+SENDER_LOG_FILE = "logs/sender.log"
+
+# sender.py --simulate 输出的发送时间线目录
+SIMULATION_DIR = "simulations"
+
+# 媒体预处理（media_prep.py：图片压缩缩放、视频缩略图/属性，按内容哈希缓存）
+# 需要 Pillow（图片）和 ffmpeg/ffprobe（视频），缺少时原样发送
+PREPARED_MEDIA_DIR = ".cache/prepared"
+PHOTO_MAX_SIDE = 2560          # Telegram 图片显示的最大边长（像素），更大的会被缩小
+PHOTO_JPEG_QUALITY = 87
+VIDEO_MAX_BITRATE = 2500000    # 超过该码率（bit/s）的视频重新编码
+VIDEO_MAX_SIDE = 1280          # 重新编码时的最大边长（像素）
+VIDEO_THUMB_SIDE = 320         # 视频缩略图最大边长（Telegram 上限 320）
+MEDIA_PREP_WORKERS = 2         # sender 后台预处理的进程数（离线 python media_prep.py 默认用全部 CPU）
+MEDIA_PREP_BACKGROUND = True   # sender 启动时在后台预处理各群的 media_base_dir
+
+# web_manager 账号信息缓存（扫描结果存 SQLite，/api/sessions 直接读取）
+SESSION_INFO_DB = ".state/sessions.db"
+SESSION_INFO_MAX_AGE = 24 * 3600   # 超过该时间视为过期，可在后台重新扫描（秒）
+
+# web_manager 账号文件目录索引：最多每隔多久检查一次目录是否有变化（秒）
+CATALOG_CHECK_INTERVAL = 2
+
+# web_manager 头像：后台下载原图，进程池生成小缩略图（带 ETag / immutable 缓存头）
+PHOTOS_DIR = "static/photos"
+THUMBS_DIR = "static/thumbs"
+THUMBNAIL_SIDE = 160           # 缩略图最大边长（像素）
+THUMBNAIL_WORKERS = 2          # 生成缩略图的进程数
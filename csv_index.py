@@ -0,0 +1,123 @@
+import os
+import io
+import csv
+import struct
+from array import array
+
+INDEX_SUFFIX = '.idx'
+_MAGIC = b'CSVIDX1\0'
+_HEADER = struct.Struct('<8sqqq')   # magic, mtime_ns, size, number of offsets
+
+
+def _scan_offsets(path):
+    """Byte offset of every CSV record start (header included), plus the end offset.
+
+    A newline only ends a record when we're outside a quoted field, so
+    multi-line messages stay one record.
+    """
+    offsets = array('Q')
+    pos = 0
+    in_quotes = False
+    with open(path, 'rb') as f:
+        for line in f:
+            if not in_quotes:
+                offsets.append(pos)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            pos += len(line)
+    offsets.append(pos)
+    return offsets
+
+
+class CsvIndex:
+    """Random access to the rows of a CSV file through a byte-offset index.
+
+    The index is built once and cached next to the CSV (`<csv>.idx`); it is
+    rebuilt whenever the CSV's mtime or size changes. The CSV is re-stat'ed
+    before every read, since our scripts rewrite message CSVs in place while
+    the sender runs. Rows are read on demand with seek+read (a file cut short
+    under us gives a short read, not a crash), so nothing but the offsets
+    stays in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.version = 0        # bumped whenever the CSV changed and was re-indexed
+        self._file = None
+        self._open(os.stat(path))
+
+    def _open(self, st):
+        offsets = self._load(st)
+        self.rebuilt = offsets is None
+        if offsets is None:
+            offsets = _scan_offsets(self.path)
+        self.offsets = offsets
+        if self.rebuilt:
+            self._save(st)
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, 'rb')
+        self._stat = (st.st_mtime_ns, st.st_size)
+        self.version += 1
+        self.header = self._read(0) if len(self.offsets) > 1 else []
+
+    def refresh(self):
+        """Re-index if the CSV changed since it was indexed. Returns True if it did."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False  # being replaced right now: keep the old index until it's back
+        if (st.st_mtime_ns, st.st_size) == self._stat:
+            return False
+        self._open(st)
+        return True
+
+    def _load(self, st):
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, mtime_ns, size, count = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or mtime_ns != st.st_mtime_ns or size != st.st_size:
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read(count * offsets.itemsize))
+                return offsets if len(offsets) == count else None
+        except (OSError, struct.error):
+            return None
+
+    def _save(self, st):
+        tmp = self.index_path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, st.st_mtime_ns, st.st_size, len(self.offsets)))
+                f.write(self.offsets.tobytes())
+            os.replace(tmp, self.index_path)
+        except OSError:
+            # Read-only checkout: keep the in-memory index, rebuild next start
+            pass
+
+    def _read(self, record):
+        start = self.offsets[record]
+        self._file.seek(start)
+        raw = self._file.read(self.offsets[record + 1] - start)
+        text = raw.decode('utf-8-sig' if record == 0 else 'utf-8')
+        return next(csv.reader(io.StringIO(text, newline='')), [])
+
+    def __len__(self):
+        """Number of data rows (header excluded)"""
+        return max(len(self.offsets) - 2, 0)
+
+    def __iter__(self):
+        """Every data row in order, in one pass over the current index"""
+        for record in range(1, len(self.offsets) - 1):
+            yield self._read(record)
+
+    def row(self, n):
+        """Parsed data row n (0-based, header excluded) in O(1)"""
+        self.refresh()
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        return self._read(n + 1)
+
+    def close(self):
+        self._file.close()
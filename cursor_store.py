@@ -0,0 +1,76 @@
+import os
+import glob
+import json
+import time
+import config
+
+
+def cursor_key(group_link, topic_id, csv_file):
+    """Identify one config entry: the same CSV can feed several groups/topics"""
+    return f"{group_link}|{topic_id}|{csv_file}"
+
+
+class CursorStore:
+    """Durable "next row to send" per config entry.
+
+    Positions are kept in memory and written to one small JSON file in
+    batches (every `flush_every` updates or `flush_interval` seconds, and on
+    shutdown). Writes go to a temp file that is fsync'ed and renamed over the
+    old one, so a crash never leaves a half-written file.
+    """
+
+    def __init__(self, path=None, flush_every=None, flush_interval=None):
+        self.path = path or os.path.join(config.STATE_DIR, config.CURSOR_FILE)
+        self.flush_every = flush_every or config.CURSOR_FLUSH_EVERY
+        self.flush_interval = flush_interval or config.CURSOR_FLUSH_INTERVAL
+        self.own = self._read(self.path)     # what this store writes back
+        self.cursors = self._load()           # merged view used for lookups
+        self.dirty = 0
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        # Sharded runs write one file per shard (cursors.shard0.json, ...). Read all
+        # of them, newest last, so positions survive changing the shard count.
+        stem = os.path.splitext(config.CURSOR_FILE)[0]
+        paths = glob.glob(os.path.join(os.path.dirname(self.path) or '.', f"{stem}*.json"))
+        cursors = {}
+        for path in sorted(paths, key=os.path.getmtime):
+            cursors.update(self._read(path))
+        return cursors
+
+    def get(self, key, default=0):
+        return self.cursors.get(key, default)
+
+    def set(self, key, row):
+        if self.cursors.get(key) == row:
+            return
+        self.cursors[key] = row
+        self.own[key] = row
+        self.dirty += 1
+        if self.dirty >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def reset(self, key):
+        self.set(key, 0)
+        self.flush()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.own, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.dirty = 0
+        self.last_flush = time.monotonic()
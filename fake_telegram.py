@@ -0,0 +1,243 @@
+import os
+import random
+import asyncio
+import itertools
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+from telethon import errors
+from telethon.tl.types import (InputPeerChannel, InputPhoto, InputDocument,
+                               MessageMediaDocument, Document, DocumentAttributeFilename)
+import config
+
+
+class FakeBehavior:
+    """Knobs (and counters) shared by every FakeTelegramClient of one run.
+
+    latency         (min, max) seconds per RPC, or a callable returning seconds
+    failure_rate    chance an RPC fails with a generic RPCError
+    flood_rate      chance a send raises FloodWaitError(flood_seconds)
+    disconnect_rate chance an RPC drops the connection (ConnectionError)
+    connect_failure_rate  chance connect() fails (dead proxy)
+    upload_rate     bytes/second for send_file/upload_file; None = latency only
+    """
+
+    def __init__(self, latency=(0.05, 0.3), failure_rate=0.0, flood_rate=0.0, flood_seconds=(5, 60),
+                 disconnect_rate=0.0, connect_failure_rate=0.0, authorized=True, upload_rate=None,
+                 seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.disconnect_rate = disconnect_rate
+        self.connect_failure_rate = connect_failure_rate
+        self.authorized = authorized
+        self.upload_rate = upload_rate
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.sent = []              # (loop time, session, chat, kind, bytes uploaded)
+        self.uploaded_bytes = 0
+        self.peer_names = {}        # channel_id -> the link it was resolved from
+
+    def count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def latency_for(self):
+        if callable(self.latency):
+            return self.latency()
+        low, high = self.latency
+        return self.random.uniform(low, high)
+
+    def roll(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+
+class FakeTelegramClient:
+    """In-process stand-in for TelegramClient with the surface this repo uses.
+
+    Nothing touches the network: every call sleeps for the configured latency
+    (on whatever clock the loop has, see virtual_clock) and may raise the
+    injected errors. Swap it in with `sender.TelegramClient = FakeTelegramClient`
+    after setting `FakeTelegramClient.behavior`.
+    """
+
+    behavior = FakeBehavior()
+    _ids = itertools.count(1000)
+
+    def __init__(self, session, api_id=None, api_hash=None, proxy=None, **kwargs):
+        self.session = session
+        self.proxy = proxy
+        self.connected = False
+        name = os.path.basename(str(session))
+        self.name = name[:-len('.session')] if name.endswith('.session') else name
+        self.user_id = next(self._ids)
+
+    async def _rpc(self, method, send=False):
+        b = self.behavior
+        b.count(method)
+        if not self.connected:
+            raise ConnectionError("Cannot send requests while disconnected")
+        await asyncio.sleep(b.latency_for())
+        if b.roll(b.disconnect_rate):
+            self.connected = False
+            raise ConnectionError("Connection reset by fake server")
+        if send and b.roll(b.flood_rate):
+            raise errors.FloodWaitError(request=None, capture=b.random.randint(*b.flood_seconds))
+        if b.roll(b.failure_rate):
+            raise errors.RPCError(None, 'FAKE_FAILURE', 500)
+
+    # -- connection ---------------------------------------------------------
+    async def connect(self):
+        b = self.behavior
+        b.count('connect')
+        await asyncio.sleep(b.latency_for())
+        if b.roll(b.connect_failure_rate):
+            raise ConnectionError("Fake proxy refused the connection")
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def is_user_authorized(self):
+        await self._rpc('is_user_authorized')
+        return self.behavior.authorized
+
+    async def get_me(self):
+        await self._rpc('get_me')
+        if not self.behavior.authorized:
+            return None
+        return SimpleNamespace(id=self.user_id, username=f"fake_{self.name}", first_name=self.name,
+                               last_name='', phone=self.name, bot=False)
+
+    # -- entities -----------------------------------------------------------
+    async def get_input_entity(self, peer):
+        await self._rpc('get_input_entity')
+        channel_id = zlib.crc32(str(peer).encode())
+        self.behavior.peer_names[channel_id] = str(peer)
+        return InputPeerChannel(channel_id=channel_id, access_hash=self.user_id)
+
+    async def get_entity(self, peer):
+        entity = await self.get_input_entity(peer)
+        username = str(peer).rsplit('/', 1)[-1].lstrip('@')
+        return SimpleNamespace(id=entity.channel_id, username=username, title=username)
+
+    async def __call__(self, request):
+        await self._rpc(type(request).__name__)
+        return SimpleNamespace()
+
+    # -- messages -----------------------------------------------------------
+    def _record(self, entity, kind, size=0):
+        b = self.behavior
+        chat = getattr(entity, 'channel_id', entity)
+        b.sent.append((asyncio.get_running_loop().time(), self.name, chat, kind, size))
+        return SimpleNamespace(id=len(b.sent), media=None)
+
+    async def send_message(self, entity, message, **kwargs):
+        await self._rpc('send_message', send=True)
+        return self._record(entity, 'text')
+
+    async def _transfer(self, file):
+        """Upload time for a local file; cached InputPhoto/InputDocument cost nothing"""
+        if isinstance(file, (InputPhoto, InputDocument)):
+            return 0
+        size = os.path.getsize(file)
+        if self.behavior.upload_rate:
+            await asyncio.sleep(size / self.behavior.upload_rate)
+        self.behavior.uploaded_bytes += size
+        return size
+
+    async def upload_file(self, file, **kwargs):
+        await self._rpc('upload_file')
+        await self._transfer(file)
+        return SimpleNamespace(id=next(self._ids), name=os.path.basename(file))
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        await self._rpc('send_file', send=True)
+        size = await self._transfer(file)
+        message = self._record(entity, 'media', size)
+        if size:
+            # Looks like a fresh upload so media_cache can store and reuse it
+            message.media = MessageMediaDocument(document=Document(
+                id=next(self._ids), access_hash=self.user_id, file_reference=b'fake', date=None,
+                mime_type='application/octet-stream', size=size, dc_id=1,
+                attributes=[DocumentAttributeFilename(os.path.basename(file))]))
+        return message
+
+    async def iter_messages(self, entity, limit=20, **kwargs):
+        await self._rpc('iter_messages')
+        for i in range(limit or 0):
+            yield SimpleNamespace(id=i + 1, text=f"fake message {i + 1}", media=None, sender=None,
+                                  date=None, sender_id=None)
+
+    async def get_messages(self, entity, limit=None, ids=None, **kwargs):
+        if ids is not None:
+            await self._rpc('get_messages')
+            return SimpleNamespace(id=ids, text='', media=None)
+        return [m async for m in self.iter_messages(entity, limit=limit)]
+
+
+async def _unsaved_identity(client, session_path, max_age=None, refresh=False):
+    """get_identity() without writing <session>.identity.json next to real sessions"""
+    from identity_cache import Identity
+    me = await client.get_me()
+    if me is None:
+        return None
+    return Identity(me.id, me.username, me.first_name, me.last_name, me.phone, 0)
+
+
+@contextmanager
+def fake_sender(state_dir, behavior=None):
+    """Run sender against FakeTelegramClient with every persisted file under `state_dir`.
+
+    Cursors, caches, the membership ledger, proxy health and metrics go to
+    the sandbox, so benchmarks and simulations never touch production state.
+    Yields the FakeBehavior in use.
+    """
+    import sender
+    import metrics
+    import media_prep
+    import proxy_manager
+    import membership_ledger
+
+    overrides = {
+        'STATE_DIR': os.path.join(state_dir, 'state'),
+        'MEDIA_CACHE_DIR': os.path.join(state_dir, 'media'),
+        'PREPARED_MEDIA_DIR': os.path.join(state_dir, 'prepared'),
+        'PEER_CACHE_DIR': os.path.join(state_dir, 'peers'),
+        'MEMBERSHIP_DIR': os.path.join(state_dir, 'membership'),
+        'METRICS_DB': os.path.join(state_dir, 'metrics.db'),
+        'SENDER_LOG_FILE': os.path.join(state_dir, 'sender.log'),
+    }
+    saved = {name: getattr(config, name) for name in overrides}
+    saved_client, saved_identity = sender.TelegramClient, sender.get_identity
+
+    def reset():
+        sender.media_caches.clear()
+        sender.peer_caches.clear()
+        if media_prep._preparer is not None:
+            media_prep._preparer.close()
+        media_prep._preparer = None
+        proxy_manager._manager = None
+        membership_ledger._ledger = None
+        if metrics._metrics is not None:
+            metrics._metrics.flush()
+            metrics._metrics.close()
+            metrics._metrics.dirty = False  # its atexit flush would hit a deleted sandbox
+        metrics._metrics = None
+
+    FakeTelegramClient.behavior = behavior or FakeBehavior()
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    sender.TelegramClient = FakeTelegramClient
+    sender.get_identity = _unsaved_identity
+    reset()
+    try:
+        yield FakeTelegramClient.behavior
+    finally:
+        reset()
+        sender.TelegramClient, sender.get_identity = saved_client, saved_identity
+        for name, value in saved.items():
+            setattr(config, name, value)
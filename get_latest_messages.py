@@ -1,5 +1,4 @@
 from telethon import TelegramClient, events, functions, types
-import csv
 from datetime import datetime
 import asyncio
 import os
@@ -7,6 +6,11 @@ from dotenv import load_dotenv
 import emoji
 from pathlib import Path
 import logging
+import time
+from identity_cache import get_identity
+from metrics import get_metrics
+from batch_writer import CsvWriter, BatchedLogHandler
+from proxy_manager import get_proxy_manager, proxy_key
 
 # 配置日志
 logging.basicConfig(
@@ -14,7 +18,7 @@ logging.basicConfig(
     format='%(message)s',  # 简化日志格式
     handlers=[
         logging.StreamHandler(),
-        logging.FileHandler('telegram_download.log')  # 同时保存到文件
+        BatchedLogHandler('telegram_download.log')  # 同时保存到文件（后台批量写入）
     ]
 )
 
@@ -47,34 +51,6 @@ SOURCE_GROUPS = [
 # CSV表头配置
 CSV_HEADERS = ['timestamp', 'group_name', 'username', 'message_type', 'message_content', 'media_path']
 
-# 添加代理列表配置
-PROXY_LIST = [
-    {
-        'proxy_type': 'socks5',
-        'addr': '119.42.39.170',
-        'port': 5798,
-        'username': 'Maomaomao77',
-        'password': 'Maomaomao77'
-    },
-    {
-        'addr': "86.38.26.189",
-        'port': 6354,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    },
-    {
-        'addr': "198.105.111.87",
-        'port': 6765,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    },
-    {
-        'addr': "185.236.95.32",
-        'port': 5993,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    }
-]
 
 def sanitize_filename(filename):
     """清理文件名，移除非法字符"""
@@ -128,15 +104,15 @@ async def get_message_content(message):
         return 'text', message.message
     return 'unknown', ''
 
+# 话术库文件供 sender 使用，保持单个文件不按天切分；后台线程批量写入
+csv_writer = None
+
 async def save_to_csv(data):
-    """保存数据到CSV文件"""
-    file_exists = os.path.exists(CSV_FILE)
-    
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(data)
+    """保存数据到CSV文件（放入写入队列）"""
+    global csv_writer
+    if csv_writer is None:
+        csv_writer = CsvWriter(CSV_FILE, CSV_HEADERS, rotate_daily=False)
+    csv_writer.write(data)
 
 async def process_messages(client, group):
     """处理群组消息"""
@@ -186,6 +162,7 @@ async def process_messages(client, group):
                 
                 # 保存到CSV
                 await save_to_csv(message_data)
+                get_metrics().inc('tg_messages_seen_total', script='get_latest_messages', group=group)
                 
             except Exception as e:
                 logging.error(f"处理消息时出错: {str(e)}")
@@ -213,21 +190,28 @@ async def try_connect_with_proxy(session_path, proxy_config):
     client = TelegramClient(session_path, api_id, api_hash, proxy=proxy_config)
     
     try:
-        logging.info(f"正在尝试使用代理 {proxy_config['addr']}:{proxy_config['port']} 连接...")
-        await client.connect()
+        logging.info(f"正在尝试使用代理 {proxy_key(proxy_config)} 连接...")
+        proxies = get_proxy_manager()
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception:
+            proxies.record_failure(proxy_config, session_path)
+            raise
+        proxies.record_success(proxy_config, time.monotonic() - started, session_path)
         
         if await client.is_user_authorized():
-            me = await client.get_me()
-            logging.info(f"[成功] 使用代理 {proxy_config['addr']} 连接成功!")
+            me = await get_identity(client, session_path)
+            logging.info(f"[成功] 使用代理 {proxy_key(proxy_config)} 连接成功!")
             logging.info(f"       账号: {me.first_name} (@{me.username})")
             return client
         
         await client.disconnect()
-        logging.error(f"[失败] 使用代理 {proxy_config['addr']} 连接失败: 未授权")
+        logging.error(f"[失败] 使用代理 {proxy_key(proxy_config)} 连接失败: 未授权")
         return None
         
     except Exception as e:
-        logging.error(f"[失败] 使用代理 {proxy_config['addr']} 连接失败: {str(e)}")
+        logging.error(f"[失败] 使用代理 {proxy_key(proxy_config)} 连接失败: {str(e)}")
         try:
             await client.disconnect()
         except:
@@ -246,9 +230,9 @@ async def main():
     session_path = os.path.join(SESSIONS_DIR, session_files[0][:-8])
     logging.info(f"使用 session 文件: {session_files[0]}")
     
-    # 尝试所有代理
+    # 按健康度尝试代理（config.PROXY_LIST，粘性 + 最低延迟优先）
     client = None
-    for proxy in PROXY_LIST:
+    for proxy in get_proxy_manager().ordered(session_path):
         client = await try_connect_with_proxy(session_path, proxy)
         if client:
             break
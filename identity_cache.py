@@ -0,0 +1,61 @@
+import os
+import json
+import time
+from collections import namedtuple
+import config
+
+# Who a session belongs to, as last reported by get_me()
+Identity = namedtuple('Identity', ['id', 'username', 'first_name', 'last_name', 'phone', 'fetched_at'])
+
+
+def identity_path(session_path):
+    """<session>.identity.json next to the .session file"""
+    base = session_path[:-len('.session')] if session_path.endswith('.session') else session_path
+    return base + '.identity.json'
+
+
+def load_identity(session_path, max_age=None):
+    """Cached identity, or None if missing or older than `max_age` seconds"""
+    try:
+        with open(identity_path(session_path), 'r', encoding='utf-8') as f:
+            identity = Identity(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+    if max_age is not None and time.time() - identity.fetched_at > max_age:
+        return None
+    return identity
+
+
+def save_identity(session_path, me):
+    """Store the result of get_me() for the session and return it as an Identity"""
+    identity = Identity(me.id, me.username, me.first_name, me.last_name, me.phone, time.time())
+    path = identity_path(session_path)
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(identity._asdict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: could not cache identity for {os.path.basename(session_path)}: {e}")
+    return identity
+
+
+async def get_identity(client, session_path, max_age=None, refresh=False):
+    """Identity from the cache, calling get_me() only when it is missing or stale"""
+    if max_age is None:
+        max_age = config.IDENTITY_MAX_AGE
+    if not refresh:
+        identity = load_identity(session_path, max_age)
+        if identity is not None:
+            return identity
+    me = await client.get_me()
+    if me is None:
+        return None  # not authorized
+    return save_identity(session_path, me)
+
+
+def describe(identity):
+    """Short label for log lines"""
+    if identity is None:
+        return "Unknown User"
+    return f"{identity.first_name} (@{identity.username} ID:{identity.id})"
@@ -0,0 +1,133 @@
+import os
+import json
+import hashlib
+import time
+import asyncio
+from telethon import errors, utils
+from telethon.tl.types import InputPhoto, InputDocument, MessageMediaPhoto, MessageMediaDocument
+import config
+from metrics import get_metrics
+
+# (path, size, mtime_ns) -> sha256, shared by every account in the process
+_hash_memo = {}
+
+
+def file_digest(path):
+    """Content hash of a media file, computed once per file version"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _hash_memo[key] = digest
+    return digest
+
+
+async def file_digest_async(path):
+    """file_digest for the send path: a file not hashed yet is hashed in a thread, not on the event loop"""
+    st = os.stat(path)
+    digest = _hash_memo.get((os.path.abspath(path), st.st_size, st.st_mtime_ns))
+    if digest is None:
+        digest = await asyncio.to_thread(file_digest, path)
+    return digest
+
+
+class MediaCache:
+    """Per-account cache of already uploaded photos/documents, keyed by content hash.
+
+    Entries are persisted to MEDIA_CACHE_DIR/<account>.json so they survive
+    restarts. A cached entry is sent as InputPhoto/InputDocument instead of
+    uploading the file again.
+    """
+
+    def __init__(self, account, cache_dir=None):
+        self.account = account
+        self.cache_dir = cache_dir or config.MEDIA_CACHE_DIR
+        self.path = os.path.join(self.cache_dir, f"{account}.json")
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+    def lookup(self, file_path):
+        """Return an InputPhoto/InputDocument for the file if it was uploaded before"""
+        entry = self.entries.get(file_digest(file_path))
+        if not entry:
+            return None
+        cls = InputPhoto if entry['kind'] == 'photo' else InputDocument
+        return cls(id=entry['id'], access_hash=entry['access_hash'],
+                   file_reference=bytes.fromhex(entry['file_reference']))
+
+    def store(self, file_path, message):
+        """Remember the media Telegram returned for a freshly uploaded file"""
+        media = getattr(message, 'media', None)
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            kind, ref = 'photo', utils.get_input_photo(media.photo)
+        elif isinstance(media, MessageMediaDocument) and media.document:
+            kind, ref = 'document', utils.get_input_document(media.document)
+        else:
+            return
+        self.entries[file_digest(file_path)] = {
+            'kind': kind,
+            'id': ref.id,
+            'access_hash': ref.access_hash,
+            'file_reference': ref.file_reference.hex(),
+        }
+        self._save()
+
+    def invalidate(self, file_path):
+        if self.entries.pop(file_digest(file_path), None) is not None:
+            self._save()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'refreshes': self.refreshes,
+                'entries': len(self.entries)}
+
+
+async def send_cached_file(client, cache, entity, file_path, **kwargs):
+    """send_file that reuses a previous upload of the same content when possible"""
+    if cache is None:
+        return await _upload(client, entity, file_path, **kwargs)
+
+    # Hash once off the event loop; lookup/store/invalidate then hit the memo
+    await file_digest_async(file_path)
+    cached = cache.lookup(file_path)
+    if cached is not None:
+        try:
+            message = await client.send_file(entity, cached, **kwargs)
+            cache.hits += 1
+            return message
+        except (errors.FileReferenceExpiredError, errors.FileIdInvalidError, errors.MediaEmptyError):
+            # Reference went stale: fall through to a fresh upload
+            cache.refreshes += 1
+            cache.invalidate(file_path)
+
+    cache.misses += 1
+    message = await _upload(client, entity, file_path, **kwargs)
+    cache.store(file_path, message)
+    return message
+
+
+async def _upload(client, entity, file_path, **kwargs):
+    started = time.monotonic()
+    message = await client.send_file(entity, file_path, **kwargs)
+    get_metrics().observe('tg_upload_seconds', time.monotonic() - started)
+    return message
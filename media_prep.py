@@ -0,0 +1,410 @@
+import os
+import sys
+import json
+import glob
+import shutil
+import asyncio
+import sqlite3
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from telethon.tl.types import DocumentAttributeVideo
+import config
+from media_cache import file_digest, file_digest_async
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: photos are sent as-is without Pillow
+    Image = ImageOps = None
+
+# .webp is left out on purpose: ours are (animated) stickers and must be sent untouched
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.mkv', '.webm', '.avi')
+
+# Bump when the output format changes so old variants are rebuilt
+PREP_VERSION = 1
+
+# Corpora prepared by `python media_prep.py` when no folders are given
+DEFAULT_CORPORA = ['messages/*/media', 'GenesisScript/media', 'Hopper/media']
+
+
+def media_kind(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PHOTO_EXTENSIONS:
+        return 'photo'
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def tools_available(kind):
+    """Whether this machine can preprocess `kind` (Pillow for photos, ffmpeg/ffprobe for videos)"""
+    if kind == 'photo':
+        return Image is not None
+    if kind == 'video':
+        return bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+    return False
+
+
+def current_settings():
+    return {
+        'photo_max_side': config.PHOTO_MAX_SIDE,
+        'photo_quality': config.PHOTO_JPEG_QUALITY,
+        'video_max_bitrate': config.VIDEO_MAX_BITRATE,
+        'video_max_side': config.VIDEO_MAX_SIDE,
+        'thumb_side': config.VIDEO_THUMB_SIDE,
+    }
+
+
+# -- worker side (runs in the process pool) ---------------------------------
+
+def _prepare_photo(src, out_dir, digest, settings):
+    """Resize to PHOTO_MAX_SIDE and recompress as JPEG; keep it only if it is smaller"""
+    dst = os.path.join(out_dir, f"{digest}.jpg")
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        side = settings['photo_max_side']
+        img.thumbnail((side, side), Image.LANCZOS)
+        img.save(dst + '.tmp', 'JPEG', quality=settings['photo_quality'], optimize=True, progressive=True)
+    size = os.path.getsize(dst + '.tmp')
+    if size >= os.path.getsize(src):
+        os.remove(dst + '.tmp')
+        return {'file': None, 'bytes': os.path.getsize(src)}
+    os.replace(dst + '.tmp', dst)
+    return {'file': os.path.basename(dst), 'bytes': size}
+
+
+def _probe(src):
+    out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                          '-show_entries', 'stream=width,height,duration:format=duration,bit_rate',
+                          '-of', 'json', src], capture_output=True, text=True, check=True).stdout
+    info = json.loads(out)
+    stream = (info.get('streams') or [{}])[0]
+    fmt = info.get('format') or {}
+    duration = float(stream.get('duration') or fmt.get('duration') or 0)
+    return {'duration': duration, 'w': int(stream.get('width') or 0), 'h': int(stream.get('height') or 0),
+            'bit_rate': int(fmt.get('bit_rate') or 0)}
+
+
+def _ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', *args], capture_output=True, check=True)
+
+
+def _prepare_video(src, out_dir, digest, settings):
+    """Thumbnail + DocumentAttributeVideo values; re-encode if the bitrate is above VIDEO_MAX_BITRATE"""
+    probe = _probe(src)
+    result = {'file': None, 'bytes': os.path.getsize(src), 'duration': probe['duration'],
+              'w': probe['w'], 'h': probe['h'], 'thumb': None}
+
+    if probe['bit_rate'] > settings['video_max_bitrate']:
+        dst = os.path.join(out_dir, f"{digest}.mp4")
+        side = settings['video_max_side']
+        rate = settings['video_max_bitrate']
+        _ffmpeg('-i', src, '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '26',
+                '-maxrate', str(rate), '-bufsize', str(rate * 2),
+                '-vf', f"scale='min({side},iw)':'min({side},ih)':force_original_aspect_ratio=decrease:"
+                       f"force_divisible_by=2",
+                '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', '-f', 'mp4', dst + '.tmp')
+        if os.path.getsize(dst + '.tmp') < result['bytes']:
+            os.replace(dst + '.tmp', dst)
+            result.update(_probe(dst))
+            result.pop('bit_rate')
+            result['file'] = os.path.basename(dst)
+            result['bytes'] = os.path.getsize(dst)
+            src = dst
+        else:
+            os.remove(dst + '.tmp')
+
+    thumb = os.path.join(out_dir, f"{digest}.thumb.jpg")
+    side = settings['thumb_side']
+    _ffmpeg('-ss', str(min(1.0, probe['duration'] / 2)), '-i', src, '-frames:v', '1',
+            '-vf', f"scale='min({side},iw)':'min({side},ih)':force_original_aspect_ratio=decrease",
+            '-q:v', '4', '-f', 'image2', thumb + '.tmp')
+    os.replace(thumb + '.tmp', thumb)
+    result['thumb'] = os.path.basename(thumb)
+    return result
+
+
+def make_thumbnail(src, dst_stem, side, quality=80):
+    """Small square-bounded WebP of an image (worker side). Without Pillow the
+    original is copied as <dst_stem>.jpg instead. Returns the path written."""
+    os.makedirs(os.path.dirname(dst_stem) or '.', exist_ok=True)
+    if Image is None:
+        dst = dst_stem + '.jpg'
+        shutil.copyfile(src, dst + '.tmp')
+    else:
+        dst = dst_stem + '.webp'
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            img.thumbnail((side, side), Image.LANCZOS)
+            img.save(dst + '.tmp', 'WEBP', quality=quality, method=4)
+    os.replace(dst + '.tmp', dst)
+    return dst
+
+
+def prepare_file(src, kind, out_dir, digest, settings):
+    """Build the optimized variant of one file. Returns the manifest entry (never raises)."""
+    os.makedirs(out_dir, exist_ok=True)
+    entry = {'kind': kind, 'version': PREP_VERSION, 'settings': settings, 'source_bytes': os.path.getsize(src)}
+    try:
+        if kind == 'photo':
+            entry.update(_prepare_photo(src, out_dir, digest, settings))
+        else:
+            entry.update(_prepare_video(src, out_dir, digest, settings))
+    except Exception as e:
+        # Remembered so a broken file isn't retried on every start; sent as-is
+        entry.update({'file': None, 'bytes': entry['source_bytes'], 'error': str(e)[:200]})
+    return entry
+
+
+# -- main process -------------------------------------------------------------
+
+class MediaPreparer:
+    """Content-hash keyed store of preprocessed media variants.
+
+    PREPARED_MEDIA_DIR/manifest.db (SQLite, shared by the offline run and
+    every shard) maps the sha256 of an original file to its variant (a smaller JPEG, a re-encoded MP4) plus video thumbnail and
+    attributes. Variants are built in a process pool, either offline with
+    `python media_prep.py` or in the background by sender. variant() is
+    what the send path calls; anything not prepared yet is sent as-is.
+    """
+
+    def __init__(self, cache_dir=None, workers=None):
+        self.cache_dir = cache_dir or config.PREPARED_MEDIA_DIR
+        self.path = os.path.join(self.cache_dir, 'manifest.db')
+        self.workers = workers or config.MEDIA_PREP_WORKERS
+        self._db = None
+        self.entries = self._load()
+        self.pending = set()
+        self.tasks = set()
+        self._executor = None
+
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS variants (digest TEXT PRIMARY KEY, entry TEXT)")
+        return self._db
+
+    def _load(self):
+        try:
+            rows = self._connection().execute("SELECT digest, entry FROM variants").fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: could not read media manifest: {e}")
+            return {}
+        return {digest: json.loads(entry) for digest, entry in rows}
+
+    def _save(self, digests):
+        """Store the entries of `digests` and pick up what other processes added meanwhile"""
+        try:
+            with self._connection() as db:
+                db.executemany("INSERT OR REPLACE INTO variants (digest, entry) VALUES (?, ?)",
+                               [(d, json.dumps(self.entries[d])) for d in digests])
+        except sqlite3.Error as e:
+            print(f"Warning: could not save media manifest: {e}")
+            return
+        self.entries.update(self._load())
+
+    def _entry(self, digest):
+        """Manifest entry for `digest`, asking the database when another process may have added it"""
+        entry = self.entries.get(digest)
+        if entry is None:
+            try:
+                row = self._connection().execute("SELECT entry FROM variants WHERE digest = ?", (digest,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row:
+                entry = self.entries[digest] = json.loads(row[0])
+        return entry
+
+    def is_current(self, digest):
+        entry = self.entries.get(digest)
+        return (entry is not None and entry.get('version') == PREP_VERSION
+                and entry.get('settings') == current_settings())
+
+    def _output(self, name):
+        if not name:
+            return None
+        path = os.path.join(self.cache_dir, name)
+        return path if os.path.exists(path) else None
+
+    async def variant(self, file_path, message_kind):
+        """(path to send, extra send_file kwargs) for a planned media message"""
+        kind = media_kind(file_path)
+        # Only rows sent as what the file is get the prepared copy; a 'file' row asked for the original bytes
+        if kind is None or message_kind != kind:
+            return file_path, {}
+        # First sight of a big video: hashed in a thread so other groups keep sending
+        entry = self._entry(await file_digest_async(file_path))
+        if not entry:
+            return file_path, {}
+        send_path = self._output(entry.get('file')) or file_path
+        if kind != 'video' or not entry.get('w'):
+            return send_path, {}
+        extra = {
+            'attributes': [DocumentAttributeVideo(duration=entry['duration'], w=entry['w'], h=entry['h'],
+                                                  supports_streaming=True)],
+            'supports_streaming': True,
+        }
+        thumb = self._output(entry.get('thumb'))
+        if thumb:
+            extra['thumb'] = thumb
+        return send_path, extra
+
+    def _jobs(self, paths, force=False):
+        """(path, kind, digest) for every file that has a tool available and no current variant"""
+        for path in paths:
+            kind = media_kind(path)
+            if not tools_available(kind):
+                continue
+            digest = file_digest(path)
+            if digest in self.pending or (not force and self.is_current(digest)):
+                continue
+            yield path, kind, digest
+
+    def prepare(self, paths, workers=None, force=False, progress=None):
+        """Prepare `paths` now (offline CLI). Returns {path: entry} for every path with an entry."""
+        settings = current_settings()
+        jobs = list(self._jobs(paths, force))
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {executor.submit(prepare_file, path, kind, self.cache_dir, digest, settings): digest
+                       for path, kind, digest in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                self.entries[futures[future]] = future.result()
+                if progress:
+                    progress(done, len(jobs))
+        if jobs:
+            self._save([digest for _, _, digest in jobs])
+        results = {}
+        for path in paths:
+            if media_kind(path):
+                entry = self.entries.get(file_digest(path))
+                if entry:
+                    results[path] = entry
+        return results
+
+    def prepare_in_background(self, paths):
+        """Start preparing `paths` in the process pool without waiting (sender startup)"""
+        paths = [p for p in paths if tools_available(media_kind(p))]
+        if not paths:
+            return None
+        task = asyncio.create_task(self._prepare_async(paths))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _prepare_async(self, paths):
+        loop = asyncio.get_running_loop()
+        # Hashing big videos would block the event loop: do it in a thread
+        await loop.run_in_executor(None, lambda: [file_digest(p) for p in paths])
+        jobs = list(self._jobs(paths))
+        if not jobs:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        settings = current_settings()
+
+        async def one(path, kind, digest):
+            self.pending.add(digest)
+            try:
+                self.entries[digest] = await loop.run_in_executor(
+                    self._executor, prepare_file, path, kind, self.cache_dir, digest, settings)
+                self._save([digest])
+            finally:
+                self.pending.discard(digest)
+
+        await asyncio.gather(*(one(*job) for job in jobs))
+        saved = sum(self.entries[d]['source_bytes'] - self.entries[d]['bytes'] for _, _, d in jobs)
+        print(f"Media prep: {len(jobs)} files prepared, {saved / 1e6:.1f} MB saved per upload")
+
+    def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_preparer = None
+
+
+def get_preparer():
+    """The process-wide MediaPreparer"""
+    global _preparer
+    if _preparer is None:
+        _preparer = MediaPreparer()
+    return _preparer
+
+
+def list_media(folder):
+    """Every photo/video file under `folder`"""
+    found = []
+    for root, _, files in os.walk(folder):
+        found.extend(os.path.join(root, name) for name in sorted(files) if media_kind(name))
+    return found
+
+
+def format_savings(corpus, results, total):
+    original = sum(e['source_bytes'] for e in results.values())
+    prepared = sum(e['bytes'] for e in results.values())
+    optimized = sum(1 for e in results.values() if e.get('file'))
+    thumbs = sum(1 for e in results.values() if e.get('thumb'))
+    failed = sum(1 for e in results.values() if e.get('error'))
+    saved = original - prepared
+    percent = saved * 100 / original if original else 0
+    line = (f"{corpus}: {len(results)} files, {original / 1e6:.1f} MB -> {prepared / 1e6:.1f} MB "
+            f"(saved {saved / 1e6:.1f} MB, {percent:.0f}%), {optimized} optimized, {thumbs} thumbnails")
+    if failed:
+        line += f", {failed} failed"
+    if total > len(results):
+        line += f", {total - len(results)} not prepared"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preprocess media (photo recompression, video thumbnails) '
+                                                 'and report the bytes saved per corpus')
+    parser.add_argument('folders', nargs='*', help=f"Media folders (default: {', '.join(DEFAULT_CORPORA)})")
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all CPUs)')
+    parser.add_argument('--force', action='store_true', help='Rebuild variants that are already cached')
+    args = parser.parse_args()
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    for kind in ('photo', 'video'):
+        if not tools_available(kind):
+            tool = 'Pillow' if kind == 'photo' else 'ffmpeg/ffprobe'
+            print(f"{tool} not found: {kind}s will be sent as-is")
+
+    folders = args.folders or sorted(d for pattern in DEFAULT_CORPORA
+                                     for d in glob.glob(os.path.join(config.BASE_DIR, pattern)))
+    preparer = MediaPreparer()
+    lines = []
+    for folder in folders:
+        files = list_media(folder)
+        corpus = os.path.relpath(folder, config.BASE_DIR)
+        print(f"{corpus}: {len(files)} media files")
+
+        def progress(done, total):
+            if done % 10 == 0 or done == total:
+                print(f"  {done}/{total} prepared")
+
+        results = preparer.prepare(files, workers=args.workers, force=args.force, progress=progress)
+        lines.append(format_savings(corpus, results, len(files)))
+
+    print("\nBytes saved per upload:")
+    for line in lines:
+        print(f"  {line}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+from telethon import errors
+from telethon.tl.functions.channels import JoinChannelRequest
+import config
+
+JOINED = 'joined'
+BANNED = 'banned'
+PENDING = 'pending'   # join request sent, waiting for an admin
+TOO_MANY = 'too_many_channels'   # account is in too many channels; may join once it leaves some
+
+
+class MembershipLedger:
+    """Persisted "is this account in that group" per (session, group).
+
+    One JSON file per account under MEMBERSHIP_DIR (accounts never share a
+    file, so sharded processes don't step on each other). An entry is
+    trusted for MEMBERSHIP_MAX_AGE seconds; pending and too-many-channels
+    entries are re-checked after MEMBERSHIP_PENDING_RECHECK. Only missing or stale entries cost a
+    join/verify RPC at startup.
+    """
+
+    def __init__(self, ledger_dir=None, max_age=None, pending_recheck=None):
+        self.ledger_dir = ledger_dir or config.MEMBERSHIP_DIR
+        self.max_age = config.MEMBERSHIP_MAX_AGE if max_age is None else max_age
+        self.pending_recheck = config.MEMBERSHIP_PENDING_RECHECK if pending_recheck is None else pending_recheck
+        self.accounts = {}
+        self.hits = 0
+        self.checks = 0
+
+    @staticmethod
+    def _account(session_path):
+        name = os.path.basename(session_path)
+        return name[:-len('.session')] if name.endswith('.session') else name
+
+    def _path(self, account):
+        return os.path.join(self.ledger_dir, f"{account}.json")
+
+    def _entries(self, account):
+        entries = self.accounts.get(account)
+        if entries is None:
+            try:
+                with open(self._path(account), 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            self.accounts[account] = entries
+        return entries
+
+    def _save(self, account):
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        path = self._path(account)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.accounts[account], f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def get(self, session_path, group_link):
+        """Ledger entry {'status', 'checked_at', 'error'} or None if missing"""
+        return self._entries(self._account(session_path)).get(group_link)
+
+    def is_fresh(self, entry):
+        if entry is None:
+            return False
+        max_age = self.pending_recheck if entry['status'] in (PENDING, TOO_MANY) else self.max_age
+        return time.time() - entry['checked_at'] <= max_age
+
+    def fresh_status(self, session_path, group_link):
+        """Status if the entry can be trusted, else None"""
+        entry = self.get(session_path, group_link)
+        return entry['status'] if self.is_fresh(entry) else None
+
+    def record(self, session_path, group_link, status, error=None):
+        account = self._account(session_path)
+        self._entries(account)[group_link] = {
+            'status': status,
+            'checked_at': time.time(),
+            'error': error,
+        }
+        self._save(account)
+
+    def invalidate(self, session_path, group_link):
+        account = self._account(session_path)
+        if self._entries(account).pop(group_link, None) is not None:
+            self._save(account)
+
+    def counts(self):
+        counts = {JOINED: 0, BANNED: 0, PENDING: 0, TOO_MANY: 0}
+        for entries in self.accounts.values():
+            for entry in entries.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+    def format_report(self):
+        c = self.counts()
+        return (f"Membership ledger: {self.hits} trusted, {self.checks} checked "
+                f"({c[JOINED]} joined, {c[PENDING]} pending, {c[TOO_MANY]} in too many channels, "
+                f"{c[BANNED]} banned)")
+
+
+async def ensure_joined(client, session_path, group_link, peer, ledger, refresh=False):
+    """Join (or confirm membership in) a group unless the ledger already knows.
+
+    Returns the membership status. FloodWait is raised and nothing is recorded,
+    so the next start tries again.
+    """
+    if not refresh:
+        status = ledger.fresh_status(session_path, group_link)
+        if status is not None:
+            ledger.hits += 1
+            return status
+
+    ledger.checks += 1
+    error = None
+    try:
+        # Joining a group we're already in just returns the channel again
+        await client(JoinChannelRequest(peer))
+        status = JOINED
+    except errors.UserAlreadyParticipantError:
+        status = JOINED
+    except errors.InviteRequestSentError:
+        status = PENDING
+    except errors.ChannelsTooMuchError as e:
+        # A limit of the account, not a ban from this group: retried after the pending recheck
+        status = TOO_MANY
+        error = type(e).__name__
+    except (errors.ChannelPrivateError, errors.UserBannedInChannelError, errors.UserDeactivatedError) as e:
+        status = BANNED
+        error = type(e).__name__
+    ledger.record(session_path, group_link, status, error)
+    return status
+
+
+_ledger = None
+
+
+def get_ledger():
+    """Process-wide MembershipLedger"""
+    global _ledger
+    if _ledger is None:
+        _ledger = MembershipLedger()
+    return _ledger
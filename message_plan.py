@@ -0,0 +1,240 @@
+import os
+import csv
+from bisect import bisect_left
+from collections import namedtuple, Counter
+from csv_index import CsvIndex
+import config
+
+# Header variants seen in our scripts (compared lowercased/stripped):
+#   id,date,type,content,media_file                        (messages/SuperExCN)
+#   ID,Date,Type,Content,Unnamed: 4                        (messages/SuperExGlobal)
+#   ...,message_type,message_content,media_path            (GenesisScript, Hopper, MemeCore, 话术)
+TYPE_COLUMNS = ('type', 'message_type', 'msg_type')
+TEXT_COLUMNS = ('content', 'message_content', 'text', 'message')
+MEDIA_COLUMNS = ('media_file', 'media_path')
+
+MEDIA_TYPES = ('photo', 'video', 'file')
+SUPPORTED_TYPES = ('text',) + MEDIA_TYPES
+
+# One compiled, ready-to-send CSV row. `row` is the 0-based data row in the CSV.
+PlannedMessage = namedtuple('PlannedMessage', ['row', 'kind', 'text', 'media_path'])
+
+
+class BrokenRow(Exception):
+    """A CSV row that can't be sent"""
+
+
+def _find_column(header, candidates):
+    lowered = [str(h).strip().lower() for h in header]
+    for name in candidates:
+        if name in lowered:
+            return lowered.index(name)
+    return None
+
+
+class RowCompiler:
+    """Turns raw CSV rows into PlannedMessage records for one CSV layout"""
+
+    def __init__(self, header, media_base_dir=None):
+        self.type_idx = _find_column(header, TYPE_COLUMNS)
+        self.text_idx = _find_column(header, TEXT_COLUMNS)
+        self.media_idx = _find_column(header, MEDIA_COLUMNS)
+        self.media_base_dir = media_base_dir
+        self._exists = {}
+
+    @staticmethod
+    def _cell(row, idx):
+        if idx is None or idx >= len(row):
+            return None
+        value = row[idx].strip()
+        return value or None
+
+    def _resolve_media(self, media_path_raw):
+        if os.path.isabs(media_path_raw):
+            candidates = [media_path_raw]
+        else:
+            clean_path = media_path_raw.lstrip('/\\')
+            candidates = []
+            if self.media_base_dir:
+                candidates.append(os.path.join(self.media_base_dir, clean_path))
+            candidates.append(os.path.join(config.BASE_DIR, clean_path))
+        for p in candidates:
+            exists = self._exists.get(p)
+            if exists is None:
+                exists = self._exists[p] = os.path.exists(p)
+            if exists:
+                return os.path.abspath(p)
+        return None
+
+    def compile(self, row_number, row):
+        """Compile one row, raising BrokenRow with the reason if it can't be sent"""
+        kind = (self._cell(row, self.type_idx) or 'text').lower()
+        text = self._cell(row, self.text_idx)
+
+        if kind == 'text':
+            if not text:
+                raise BrokenRow('empty text')
+            return PlannedMessage(row_number, kind, text, None)
+
+        if kind not in MEDIA_TYPES:
+            raise BrokenRow(f"unsupported type '{kind}'")
+
+        media_path_raw = self._cell(row, self.media_idx)
+        # Fallback: if the media column is empty, content that looks like a path is the media
+        if not media_path_raw and text and ('/' in text or '.' in text):
+            media_path_raw, text = text, None
+        if not media_path_raw:
+            raise BrokenRow('missing media path')
+        # Avoid sending the path as a caption if they are identical
+        if text and text == media_path_raw:
+            text = None
+
+        full_path = self._resolve_media(media_path_raw)
+        if not full_path:
+            raise BrokenRow(f"media file not found: {media_path_raw}")
+        return PlannedMessage(row_number, kind, text, full_path)
+
+
+def format_broken(head, broken, examples=5):
+    """`head` plus a summary of the (row_number, reason) pairs in `broken` and a few examples"""
+    if not broken:
+        return f"{head}, no broken rows"
+    reasons = Counter(reason.split(':')[0] for _, reason in broken)
+    summary = ", ".join(f"{count} {reason}" for reason, count in reasons.most_common())
+    lines = [f"{head}, {len(broken)} broken rows ({summary})"]
+    for row_number, reason in broken[:examples]:
+        lines.append(f"  row {row_number}: {reason}")
+    if len(broken) > examples:
+        lines.append(f"  ... and {len(broken) - examples} more")
+    return "\n".join(lines)
+
+
+class MessagePlan:
+    """All sendable messages of one CSV, compiled once at load time"""
+
+    def __init__(self, csv_file, messages, broken, row_count):
+        self.csv_file = csv_file
+        self.messages = messages
+        self.broken = broken      # list of (row_number, reason)
+        self.row_count = row_count
+        self._rows = [m.row for m in messages]
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def iter_from(self, row):
+        """Sendable messages starting at CSV data row `row`"""
+        for i in range(bisect_left(self._rows, row), len(self.messages)):
+            yield self.messages[i]
+
+    def format_report(self, examples=5):
+        """One-shot startup summary of rows that will be skipped"""
+        name = os.path.basename(self.csv_file)
+        return format_broken(f"{name}: {len(self.messages)} messages", self.broken, examples)
+
+    def close(self):
+        pass
+
+
+class StreamingMessagePlan:
+    """Lazily compiled plan for large CSVs, backed by a cached byte-offset index.
+
+    Only the row offsets live in memory; each row is read and compiled when it
+    is about to be sent. Every row is compiled once at load (and after the CSV
+    changes) so broken rows are reported up front like MessagePlan does; only
+    their row numbers are kept.
+    """
+
+    def __init__(self, csv_file, media_base_dir=None):
+        self.csv_file = csv_file
+        self.media_base_dir = media_base_dir
+        self.index = CsvIndex(csv_file)
+        self._indexed()
+
+    def _indexed(self):
+        # (Re)start from the current index: the CSV may have been rewritten in place
+        self.version = self.index.version
+        self.compiler = RowCompiler(self.index.header, self.media_base_dir)
+        self.broken = []
+        for row, raw in enumerate(self.index):
+            try:
+                self.compiler.compile(row, raw)
+            except BrokenRow as e:
+                self.broken.append((row, str(e)))
+        self._skip = {row for row, _ in self.broken}
+
+    @property
+    def row_count(self):
+        return len(self.index)
+
+    def __len__(self):
+        return self.row_count
+
+    def get(self, row):
+        """Compiled message for data row `row`, or None if the row is broken or gone"""
+        self.index.refresh()
+        if self.index.version != self.version:
+            self._indexed()
+            print(f"{os.path.basename(self.csv_file)} changed on disk, re-indexed: {self.format_report()}")
+        if row in self._skip:
+            return None
+        try:
+            return self.compiler.compile(row, self.index.row(row))
+        except IndexError:
+            return None  # the CSV shrank under us
+        except BrokenRow as e:
+            # Was fine at load (e.g. its media file was deleted since): report it once
+            self._skip.add(row)
+            self.broken.append((row, str(e)))
+            print(f"{os.path.basename(self.csv_file)}: skipping row {row}: {e}")
+            return None
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, row):
+        n = max(row, 0)
+        while n < self.row_count:
+            message = self.get(n)
+            if message is not None:
+                yield message
+            n += 1
+
+    def format_report(self, examples=5):
+        name = os.path.basename(self.csv_file)
+        source = "index rebuilt" if self.index.rebuilt else "index cached"
+        sendable = self.row_count - len(self.broken)
+        return format_broken(f"{name}: {sendable} messages, streamed on demand ({source})", self.broken, examples)
+
+    def close(self):
+        self.index.close()
+
+
+def load_message_plan(csv_file, media_base_dir=None):
+    """Eager plan for normal scripts, streaming plan once a CSV passes STREAM_CSV_MIN_BYTES"""
+    if os.path.getsize(csv_file) >= config.STREAM_CSV_MIN_BYTES:
+        return StreamingMessagePlan(csv_file, media_base_dir)
+    return compile_csv(csv_file, media_base_dir)
+
+
+def compile_csv(csv_file, media_base_dir=None):
+    """Read a message CSV and compile every row into a MessagePlan"""
+    messages = []
+    broken = []
+    row_number = -1
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        compiler = RowCompiler(header, media_base_dir)
+        for row_number, row in enumerate(reader):
+            try:
+                messages.append(compiler.compile(row_number, row))
+            except BrokenRow as e:
+                broken.append((row_number, str(e)))
+    return MessagePlan(csv_file, messages, broken, row_number + 1)
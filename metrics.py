@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import sqlite3
+from bisect import bisect_left
+import config
+
+# name -> (type, help). Anything recorded must be listed here.
+METRICS = {
+    'tg_sends_total': ('counter', 'Messages sent, by group/account/type/result'),
+    'tg_send_seconds': ('histogram', 'Time to send one message (resolve + send/upload)'),
+    'tg_upload_seconds': ('histogram', 'Time to upload a media file (cache misses only)'),
+    'tg_reconnects_total': ('counter', 'Connections re-established by the client pool'),
+    'tg_flood_waits_total': ('counter', 'FloodWait/SlowModeWait errors, by kind'),
+    'tg_flood_wait_seconds_total': ('counter', 'Cooldown seconds imposed by flood errors'),
+    'tg_queue_depth': ('gauge', 'Jobs waiting in the send scheduler'),
+    'tg_event_loop_lag_seconds': ('histogram', 'How late the event loop wakes up a 1s sleep'),
+    'tg_messages_seen_total': ('counter', 'Messages seen by monitors/scrapers, by script and group'),
+    'tg_members_seen_total': ('counter', 'Members recorded by monitors/scrapers, by script and group'),
+}
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """In-process counters/gauges/histograms, periodically copied to SQLite.
+
+    Recording only touches a dict, so it costs nothing on the send path.
+    flush() writes the current totals for this `source` (script name, plus
+    the shard number for sharded senders) into a WAL-mode SQLite file that
+    web_manager reads for /metrics. Each source overwrites its own rows, so
+    a restarted process simply starts its counters from zero again.
+    """
+
+    def __init__(self, source, db_path=None, buckets=DEFAULT_BUCKETS):
+        self.source = source
+        self.db_path = db_path or config.METRICS_DB
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}   # key -> [bucket counts..., +Inf], sum, count
+        self.dirty = False
+        self._db = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+        self.dirty = True
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, _labels_key(labels))] = value
+        self.dirty = True
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        h[0][bisect_left(self.buckets, value)] += 1
+        h[1] += value
+        h[2] += 1
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        rows = []
+        now = time.time()
+        for (name, labels), value in self.counters.items():
+            rows.append((self.source, name, json.dumps(labels), value, None, now))
+        for (name, labels), value in self.gauges.items():
+            rows.append((self.source, name, json.dumps(labels), value, None, now))
+        for (name, labels), (counts, total, count) in self.histograms.items():
+            data = json.dumps({'buckets': list(self.buckets), 'counts': counts, 'sum': total, 'count': count})
+            rows.append((self.source, name, json.dumps(labels), count, data, now))
+        try:
+            # One connection for the life of the process; opening one per flush costs more than the write
+            if self._db is None:
+                self._db = connect(self.db_path)
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO metrics (source, name, labels, value, histogram, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.dirty = False
+        except sqlite3.Error as e:
+            print(f"Warning: could not write metrics: {e}")
+            self.close()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def run_flusher(self, interval=None):
+        """Flush every `interval` seconds until cancelled"""
+        interval = interval or config.METRICS_FLUSH_INTERVAL
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self.flush()
+        finally:
+            self.flush()
+
+    async def watch_loop_lag(self, interval=1.0):
+        """Record how late the event loop wakes us up (a blocked loop delays every send)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.observe('tg_event_loop_lag_seconds', max(0.0, loop.time() - start - interval))
+
+
+def connect(db_path=None):
+    db_path = db_path or config.METRICS_DB
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    db = sqlite3.connect(db_path, timeout=5)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS metrics ("
+               "source TEXT, name TEXT, labels TEXT, value REAL, histogram TEXT, updated_at REAL, "
+               "PRIMARY KEY (source, name, labels))")
+    return db
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus(db_path=None):
+    """All sources' metrics in the Prometheus text exposition format"""
+    db = connect(db_path)
+    try:
+        rows = db.execute("SELECT source, name, labels, value, histogram FROM metrics "
+                          "ORDER BY name, source, labels").fetchall()
+    finally:
+        db.close()
+    lines = []
+    current = None
+    for source, name, labels, value, histogram in rows:
+        kind, help_text = METRICS.get(name, ('untyped', ''))
+        if name != current:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            current = name
+        labels = [('source', source)] + [tuple(p) for p in json.loads(labels)]
+        if histogram is None:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        h = json.loads(histogram)
+        cumulative = 0
+        for bound, count in zip(h['buckets'] + ['+Inf'], h['counts']):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(h['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_metrics = None
+
+
+def get_metrics(source=None):
+    """Process-wide Metrics. The first call names the source (default: script name)."""
+    global _metrics
+    if _metrics is None:
+        if source is None:
+            source = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        _metrics = Metrics(source)
+        # Short scripts never run the flusher: write what they recorded on exit
+        atexit.register(_metrics.flush)
+    return _metrics
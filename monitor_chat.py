@@ -3,16 +3,18 @@ from datetime import datetime
 import asyncio
 import os
 import logging
-import csv
 from dotenv import load_dotenv
 import random
+from identity_cache import get_identity
+from metrics import get_metrics
+from batch_writer import CsvWriter, BatchedLogHandler
 
 # 配置日志
 logging.basicConfig(
     level=logging.INFO, 
     format='%(asctime)s - %(levelname)s: %(message)s',
     handlers=[
-        logging.FileHandler('telegram_monitor.log', encoding='utf-8'),
+        BatchedLogHandler('telegram_monitor.log'),
         logging.StreamHandler()
     ]
 )
@@ -47,8 +49,7 @@ async def join_group(client, group):
         
         try:
             # 尝试获取自己的成员信息
-            me = await client.get_me()
-            await client.get_permissions(entity, me)
+            await client.get_permissions(entity, 'me')
             logger.info(f"已经是群组成员: {group}")
             return True, False  # 成功，但不是新加入
             
@@ -76,36 +77,27 @@ async def join_group(client, group):
         logger.error(f"处理群组 {group} 时出错: {str(e)}")
         return False, False
 
+# 定义CSV表头
+CSV_FIELDS = ['timestamp', 'user_id', 'username', 'first_name', 'last_name', 'source_group', 'message']
+# 每天一个文件 active_users_YYYYMMDD.csv，后台线程批量写入，不阻塞事件循环
+csv_writer = None
+
 async def save_user_data(user_data):
-    """保存用户数据到CSV文件"""
+    """保存用户数据到CSV文件（放入写入队列）"""
+    global csv_writer
     try:
-        date_str = datetime.now().strftime('%Y%m%d')
-        filename = os.path.join(MONITORED_DIR, f'active_users_{date_str}.csv')
-        
-        # 定义CSV表头
-        fieldnames = ['timestamp', 'user_id', 'username', 'first_name', 'last_name', 'source_group', 'message']
-        
-        # 如果文件不存在，创建文件并写入表头
-        file_exists = os.path.exists(filename)
-        
-        with open(filename, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            
-            if not file_exists:
-                writer.writeheader()
-            
-            # 写入数据
-            writer.writerow({
-                'timestamp': user_data['timestamp'],
-                'user_id': user_data['user_id'],
-                'username': user_data['username'],
-                'first_name': user_data['first_name'],
-                'last_name': user_data['last_name'],
-                'source_group': user_data['source_group'],
-                'message': user_data['message_text']
-            })
-            
-        logger.info(f"已保存用户消息到 {filename}")
+        if csv_writer is None:
+            csv_writer = CsvWriter(os.path.join(MONITORED_DIR, 'active_users_{date}.csv'), CSV_FIELDS)
+        csv_writer.write({
+            'timestamp': user_data['timestamp'],
+            'user_id': user_data['user_id'],
+            'username': user_data['username'],
+            'first_name': user_data['first_name'],
+            'last_name': user_data['last_name'],
+            'source_group': user_data['source_group'],
+            'message': user_data['message_text']
+        })
+        logger.info(f"已记录用户消息: @{user_data['username']} ({user_data['source_group']})")
         
     except Exception as e:
         logger.error(f"保存数据失败: {e}")
@@ -125,9 +117,10 @@ async def main():
     
     client = TelegramClient(session_path, api_id, api_hash)
     
+    background = []
     try:
         await client.start()
-        me = await client.get_me()
+        me = await get_identity(client, session_path)
         logger.info(f"已登录账号: {me.first_name} (@{me.username})")
 
         # 依次检查和加入源群组
@@ -170,6 +163,7 @@ async def main():
                 
                 # 保存户数据
                 await save_user_data(user_data)
+                get_metrics().inc('tg_messages_seen_total', script='monitor_chat', group=source_group)
                 
             except Exception as e:
                 logger.error(f"处理消息事件时出错: {str(e)}")
@@ -179,11 +173,19 @@ async def main():
         for group in SOURCE_GROUPS:
             logger.info(f"- {group}")
             
+        # 指标定期写入 METRICS_DB，web_manager 的 /metrics 读取
+        metrics = get_metrics()
+        background += [asyncio.create_task(metrics.run_flusher()),
+                       asyncio.create_task(metrics.watch_loop_lag())]
         await client.run_until_disconnected()
         
     except Exception as e:
         logger.error(f"运行出错: {str(e)}")
     finally:
+        # 停止后台任务；run_flusher 退出时会最后写一次指标
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
         await client.disconnect()
 
 if __name__ == '__main__':
@@ -2,13 +2,17 @@ from telethon import TelegramClient, events
 from telethon.tl.types import User, Channel, PeerChannel
 from telethon.tl.functions.channels import GetParticipantsRequest
 from telethon.tl.types import ChannelParticipantsRecent
-import csv
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import logging
 import asyncio
 from telethon.tl.functions.channels import JoinChannelRequest
+import time
+from identity_cache import get_identity
+from metrics import get_metrics
+from batch_writer import CsvWriter, BatchedLogHandler
+from proxy_manager import get_proxy_manager, proxy_key
 
 # 配置日志
 logging.basicConfig(
@@ -16,7 +20,7 @@ logging.basicConfig(
     format='%(asctime)s - %(message)s',
     handlers=[
         logging.StreamHandler(),
-        logging.FileHandler('member_monitor.log')
+        BatchedLogHandler('member_monitor.log')
     ]
 )
 
@@ -30,73 +34,51 @@ TARGET_GROUP = "@fw147group"  # 替换为你要监控的群组链接
 SESSIONS_DIR = "sessions"
 CSV_FILE = "new_members.csv"
 
-# 代理列表配置
-PROXY_LIST = [
-    {
-        'proxy_type': 'socks5',
-        'addr': '119.42.39.170',
-        'port': 5798,
-        'username': 'Maomaomao77',
-        'password': 'Maomaomao77'
-    },
-    {
-        'addr': "86.38.26.189",
-        'port': 6354,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    },
-    {
-        'addr': "198.105.111.87",
-        'port': 6765,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    },
-    {
-        'addr': "185.236.95.32",
-        'port': 5993,
-        'username': 'binghua99',
-        'password': 'binghua99'
-    }
-]
 
 async def try_connect_with_proxy(session_path, proxy_config):
     """尝试使用特定代理连接"""
     client = TelegramClient(session_path, API_ID, API_HASH, proxy=proxy_config)
     
     try:
-        logging.info(f"正在尝试使用代理 {proxy_config['addr']}:{proxy_config['port']} 连接...")
-        await client.connect()
+        logging.info(f"正在尝试使用代理 {proxy_key(proxy_config)} 连接...")
+        proxies = get_proxy_manager()
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception:
+            proxies.record_failure(proxy_config, session_path)
+            raise
+        proxies.record_success(proxy_config, time.monotonic() - started, session_path)
         
         if await client.is_user_authorized():
-            me = await client.get_me()
-            logging.info(f"[成功] 使用代理 {proxy_config['addr']} 连接成功!")
+            me = await get_identity(client, session_path)
+            logging.info(f"[成功] 使用代理 {proxy_key(proxy_config)} 连接成功!")
             logging.info(f"       账号: {me.first_name} (@{me.username})")
             return client
         
         await client.disconnect()
-        logging.error(f"[失败] 使用代理 {proxy_config['addr']} 连接失败: 未授权")
+        logging.error(f"[失败] 使用代理 {proxy_key(proxy_config)} 连接失败: 未授权")
         return None
         
     except Exception as e:
-        logging.error(f"[失败] 使用代理 {proxy_config['addr']} 连接失败: {str(e)}")
+        logging.error(f"[失败] 使用代理 {proxy_key(proxy_config)} 连接失败: {str(e)}")
         try:
             await client.disconnect()
         except:
             pass
         return None
 
+# 更新字段列表，添加 join_type
+CSV_FIELDS = ['timestamp', 'user_id', 'username', 'first_name', 'last_name', 'join_type']
+# 后台线程批量写入，按天切分，不阻塞事件循环
+csv_writer = None
+
 def save_to_csv(user_data):
-    """保存用户数据到CSV文件"""
-    file_exists = os.path.exists(CSV_FILE)
-    
-    # 更新字段列表，添加 join_type
-    fieldnames = ['timestamp', 'user_id', 'username', 'first_name', 'last_name', 'join_type']
-    
-    with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(user_data)
+    """保存用户数据到CSV文件（放入写入队列）"""
+    global csv_writer
+    if csv_writer is None:
+        csv_writer = CsvWriter(CSV_FILE, CSV_FIELDS)
+    csv_writer.write(user_data)
 
 async def join_group(client, group_link):
     """尝试加入群组"""
@@ -122,9 +104,9 @@ async def main():
     session_path = os.path.join(SESSIONS_DIR, session_files[0][:-8])
     logging.info(f"使用 session 文件: {session_files[0]}")
     
-    # 尝试所有代理
+    # 按健康度尝试代理（config.PROXY_LIST，粘性 + 最低延迟优先）
     client = None
-    for proxy in PROXY_LIST:
+    for proxy in get_proxy_manager().ordered(session_path):
         client = await try_connect_with_proxy(session_path, proxy)
         if client:
             break
@@ -133,6 +115,7 @@ async def main():
         logging.error("所有代理均连接失败!")
         return
 
+    background = []
     try:
         # 先尝试加入群组
         if not await join_group(client, TARGET_GROUP):
@@ -200,6 +183,7 @@ async def main():
                             'join_type': event_type
                         }
                         save_to_csv(user_data)
+                        get_metrics().inc('tg_members_seen_total', script='monitor_new_members', group=TARGET_GROUP)
                         logging.info("[成功] 已记录新成员信息到 CSV")
                     else:
                         logging.info("[跳过] 忽略非目标群组事件")
@@ -218,12 +202,20 @@ async def main():
         logging.info(f"[信息] 新成员信息将保存到: {os.path.abspath(CSV_FILE)}")
         logging.info("[等待] 等待新成员加入事件...")
         
+        # 指标定期写入 METRICS_DB，web_manager 的 /metrics 读取
+        metrics = get_metrics()
+        background += [asyncio.create_task(metrics.run_flusher()),
+                       asyncio.create_task(metrics.watch_loop_lag())]
         await client.run_until_disconnected()
         
     except Exception as e:
         logging.error(f"运行出错: {str(e)}")
         logging.error("错误详情: ", exc_info=True)
     finally:
+        # 停止后台任务；run_flusher 退出时会最后写一次指标
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
         await client.disconnect()
 
 if __name__ == '__main__':
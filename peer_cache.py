@@ -0,0 +1,66 @@
+import os
+import json
+import time
+from telethon.tl.types import InputPeerChannel
+import config
+
+
+class PeerCache:
+    """Per-account cache of resolved group links -> InputPeerChannel (id + access_hash).
+
+    access_hash is only valid for the account that resolved it, so there is
+    one file per account under PEER_CACHE_DIR. Entries older than
+    PEER_CACHE_MAX_AGE are resolved again; everything else is used directly,
+    so steady-state sends never trigger a ResolveUsername call.
+    """
+
+    def __init__(self, account, cache_dir=None, max_age=None):
+        self.account = account
+        self.cache_dir = cache_dir or config.PEER_CACHE_DIR
+        self.max_age = config.PEER_CACHE_MAX_AGE if max_age is None else max_age
+        self.path = os.path.join(self.cache_dir, f"{account}.json")
+        self.hits = 0
+        self.resolves = 0
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, link):
+        """Cached peer for the link, or None if missing or stale"""
+        entry = self.entries.get(link)
+        if not entry or time.time() - entry['resolved_at'] > self.max_age:
+            return None
+        return InputPeerChannel(channel_id=entry['channel_id'], access_hash=entry['access_hash'])
+
+    async def resolve(self, client, link):
+        """Peer for the link, resolving (and caching) it only on a miss"""
+        peer = self.get(link)
+        if peer is not None:
+            self.hits += 1
+            return peer
+        self.resolves += 1
+        peer = await client.get_input_entity(link)
+        if isinstance(peer, InputPeerChannel):
+            self.entries[link] = {
+                'channel_id': peer.channel_id,
+                'access_hash': peer.access_hash,
+                'resolved_at': time.time(),
+            }
+            self._save()
+        return peer
+
+    def invalidate(self, link):
+        if self.entries.pop(link, None) is not None:
+            self._save()
@@ -0,0 +1,226 @@
+import os
+import time
+import atexit
+import sqlite3
+import config
+
+
+def proxy_key(proxy):
+    """'addr:port' for a Telethon proxy tuple ("socks5", addr, port, rdns, user, pass)"""
+    return f"{proxy[1]}:{proxy[2]}"
+
+
+def proxy_dict(proxy):
+    """Same proxy in Telethon's dict form, for scripts that use it"""
+    return {
+        'proxy_type': proxy[0],
+        'addr': proxy[1],
+        'port': proxy[2],
+        'rdns': proxy[3],
+        'username': proxy[4],
+        'password': proxy[5],
+    }
+
+
+def _session_key(session_path):
+    name = os.path.basename(session_path)
+    return name[:-len('.session')] if name.endswith('.session') else name
+
+
+def connect(db_path):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    db = sqlite3.connect(db_path, timeout=5)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS proxies (key TEXT PRIMARY KEY, latency REAL, failures INTEGER, "
+               "successes INTEGER, total_failures INTEGER, open_until REAL)")
+    db.execute("CREATE TABLE IF NOT EXISTS sticky (session TEXT PRIMARY KEY, proxy TEXT)")
+    return db
+
+
+class ProxyHealth:
+    __slots__ = ('latency', 'failures', 'successes', 'total_failures', 'open_until')
+
+    def __init__(self, latency=None, failures=0, successes=0, total_failures=0, open_until=0.0):
+        self.latency = latency              # EWMA connect latency (seconds)
+        self.failures = failures            # consecutive failures
+        self.successes = successes
+        self.total_failures = total_failures
+        self.open_until = open_until        # circuit breaker open until this wall-clock time
+
+
+class ProxyManager:
+    """Health-scored proxy choice shared by every script.
+
+    Keeps an EWMA of connect latency and failure counts per proxy. After
+    PROXY_BREAKER_THRESHOLD consecutive failures a proxy's breaker opens and
+    it is skipped for PROXY_BREAKER_COOLDOWN seconds, then gets one trial
+    connect again. A session sticks to the last proxy that worked for it.
+
+    State lives in a SQLite file under STATE_DIR that every shard, monitor
+    and web_manager share. Changes are written at most every
+    PROXY_SAVE_INTERVAL seconds (and at exit): only the proxies and sessions
+    this process touched are written, success/failure totals are added to
+    what's on disk, and everything else is re-read, so processes learn from
+    each other instead of overwriting each other.
+    """
+
+    def __init__(self, proxies=None, db_path=None):
+        self.proxies = list(config.PROXY_LIST if proxies is None else proxies)
+        self.db_path = db_path or os.path.join(config.STATE_DIR, config.PROXY_STATE_FILE)
+        self.health = {proxy_key(p): ProxyHealth() for p in self.proxies}
+        self.sticky = {}
+        self._dirty = set()         # proxies changed here since the last save
+        self._totals = {}           # proxy -> [successes, failures] not written yet
+        self._sticky_changes = {}   # session -> proxy key, None = forget
+        self._saved = time.monotonic()
+        self._db = None
+        self._load()
+
+    def _connection(self):
+        # One connection for the life of the process, like metrics
+        if self._db is None:
+            self._db = connect(self.db_path)
+        return self._db
+
+    def _load(self):
+        """Adopt the shared state for everything this process hasn't changed since its last save"""
+        try:
+            db = self._connection()
+            proxies = db.execute("SELECT * FROM proxies").fetchall()
+            sticky = db.execute("SELECT session, proxy FROM sticky").fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: could not read proxy health: {e}")
+            self.close()
+            return
+        for key, latency, failures, successes, total_failures, open_until in proxies:
+            if key in self.health and key not in self._dirty:
+                pending = self._totals.get(key, (0, 0))
+                self.health[key] = ProxyHealth(latency, failures, successes + pending[0],
+                                               total_failures + pending[1], open_until)
+        self.sticky = {s: k for s, k in sticky if k in self.health}
+        for session, key in self._sticky_changes.items():
+            if key is None:
+                self.sticky.pop(session, None)
+            else:
+                self.sticky[session] = key
+
+    def save(self, force=False):
+        """Write this process's changes and pick up the other processes' (debounced)"""
+        if not force and time.monotonic() - self._saved < config.PROXY_SAVE_INTERVAL:
+            return
+        self._saved = time.monotonic()
+        try:
+            db = self._connection()
+            with db:
+                for key in self._dirty:
+                    h = self.health[key]
+                    successes, failures = self._totals.get(key, (0, 0))
+                    db.execute("INSERT INTO proxies (key, latency, failures, successes, total_failures, open_until) "
+                               "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                               "latency = excluded.latency, failures = excluded.failures, "
+                               "successes = successes + excluded.successes, "
+                               "total_failures = total_failures + excluded.total_failures, "
+                               "open_until = excluded.open_until",
+                               (key, h.latency, h.failures, successes, failures, h.open_until))
+                for session, key in self._sticky_changes.items():
+                    if key is None:
+                        db.execute("DELETE FROM sticky WHERE session = ?", (session,))
+                    else:
+                        db.execute("INSERT OR REPLACE INTO sticky (session, proxy) VALUES (?, ?)", (session, key))
+        except sqlite3.Error as e:
+            # Kept pending: retried on the next save
+            print(f"Warning: could not save proxy health: {e}")
+            self.close()
+            return
+        self._dirty.clear()
+        self._totals.clear()
+        self._sticky_changes.clear()
+        self._load()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _score(self, proxy):
+        h = self.health[proxy_key(proxy)]
+        # Unknown proxies rank like an average one so they get tried
+        latency = h.latency if h.latency is not None else config.PROXY_UNKNOWN_LATENCY
+        return latency + h.failures * config.PROXY_FAILURE_PENALTY
+
+    def is_open(self, proxy):
+        return self.health[proxy_key(proxy)].open_until > time.time()
+
+    def ordered(self, session_path=None):
+        """Proxies to try for a session, best first. Open breakers go last."""
+        closed = sorted((p for p in self.proxies if not self.is_open(p)), key=self._score)
+        tripped = sorted((p for p in self.proxies if self.is_open(p)),
+                         key=lambda p: self.health[proxy_key(p)].open_until)
+        if session_path is not None:
+            sticky = self.sticky.get(_session_key(session_path))
+            for i, p in enumerate(closed):
+                if proxy_key(p) == sticky:
+                    closed.insert(0, closed.pop(i))
+                    break
+        # Every breaker open: still hand them out rather than not connecting at all
+        return closed + tripped
+
+    def best(self, session_path=None):
+        ordered = self.ordered(session_path)
+        return ordered[0] if ordered else None
+
+    def _count(self, key, successes=0, failures=0):
+        self._dirty.add(key)
+        totals = self._totals.setdefault(key, [0, 0])
+        totals[0] += successes
+        totals[1] += failures
+
+    def record_success(self, proxy, latency, session_path=None):
+        key = proxy_key(proxy)
+        h = self.health[key]
+        alpha = config.PROXY_EWMA_ALPHA
+        h.latency = latency if h.latency is None else alpha * latency + (1 - alpha) * h.latency
+        h.failures = 0
+        h.successes += 1
+        h.open_until = 0.0
+        self._count(key, successes=1)
+        if session_path is not None:
+            self.sticky[_session_key(session_path)] = key
+            self._sticky_changes[_session_key(session_path)] = key
+        self.save()
+
+    def record_failure(self, proxy, session_path=None):
+        key = proxy_key(proxy)
+        h = self.health[key]
+        h.failures += 1
+        h.total_failures += 1
+        if h.failures >= config.PROXY_BREAKER_THRESHOLD:
+            h.open_until = time.time() + config.PROXY_BREAKER_COOLDOWN
+        self._count(key, failures=1)
+        if session_path is not None and self.sticky.get(_session_key(session_path)) == key:
+            del self.sticky[_session_key(session_path)]
+            self._sticky_changes[_session_key(session_path)] = None
+        self.save()
+
+    def format_report(self):
+        lines = ["Proxies:"]
+        for p in self.proxies:
+            h = self.health[proxy_key(p)]
+            latency = f"{h.latency:.2f}s" if h.latency is not None else "-"
+            state = "OPEN" if self.is_open(p) else "ok"
+            lines.append(f"  {proxy_key(p)}: {state}, latency {latency}, "
+                         f"{h.successes} ok / {h.total_failures} failed")
+        return "\n".join(lines)
+
+
+_manager = None
+
+
+def get_proxy_manager():
+    """Process-wide ProxyManager loaded from config.PROXY_LIST"""
+    global _manager
+    if _manager is None:
+        _manager = ProxyManager()
+        atexit.register(_manager.save, force=True)
+    return _manager
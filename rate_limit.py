@@ -0,0 +1,122 @@
+import time
+import asyncio
+from telethon import errors
+import config
+from metrics import get_metrics
+
+
+def clock():
+    # Follow the event loop clock when there is one, so simulated runs stay consistent
+    try:
+        return asyncio.get_running_loop().time()
+    except RuntimeError:
+        return time.monotonic()
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Per-account and per-chat send limits plus FloodWait/SlowMode cooldowns.
+
+    Accounts are keyed by session path and chats by group link. Cooldowns
+    come straight from Telegram's errors, so an account sits out for exactly
+    the reported duration and is then eligible again.
+    """
+
+    def __init__(self, account_per_minute=None, chat_per_minute=None, burst=None):
+        self.account_rate = (account_per_minute or config.ACCOUNT_SENDS_PER_MINUTE) / 60.0
+        self.chat_rate = (chat_per_minute or config.CHAT_SENDS_PER_MINUTE) / 60.0
+        self.burst = burst or config.RATE_LIMIT_BURST
+        self.account_buckets = {}
+        self.chat_buckets = {}
+        self.cooldowns = {}         # (account, chat or None) -> (until, reason)
+
+    def _bucket(self, buckets, key, rate):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def cooldown_remaining(self, account, chat=None):
+        """Seconds the account must still wait (account-wide or in this chat)"""
+        now = clock()
+        remaining = 0.0
+        for key in ((account, None), (account, chat)):
+            entry = self.cooldowns.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self.cooldowns[key]
+            else:
+                remaining = max(remaining, entry[0] - now)
+        return remaining
+
+    def account_wait(self, account, chat):
+        """Seconds until this account may send to this chat (cooldowns and its own bucket)"""
+        return max(self.cooldown_remaining(account, chat),
+                   self._bucket(self.account_buckets, account, self.account_rate).wait_time())
+
+    def chat_wait(self, chat):
+        return self._bucket(self.chat_buckets, chat, self.chat_rate).wait_time()
+
+    def record_send(self, account, chat):
+        self._bucket(self.account_buckets, account, self.account_rate).take()
+        self._bucket(self.chat_buckets, chat, self.chat_rate).take()
+
+    def handle_error(self, account, chat, error):
+        """Put the account into cooldown for a flood-type error. Returns the cooldown in seconds."""
+        seconds = getattr(error, 'seconds', None) or config.FLOOD_DEFAULT_COOLDOWN
+        if isinstance(error, errors.SlowModeWaitError):
+            # Slow mode only restricts this account in this chat
+            key = (account, chat)
+        else:
+            key = (account, None)
+        self.cooldowns[key] = (clock() + seconds, type(error).__name__)
+        get_metrics().inc('tg_flood_waits_total', kind=type(error).__name__)
+        get_metrics().inc('tg_flood_wait_seconds_total', seconds, kind=type(error).__name__)
+        return seconds
+
+    def status(self):
+        """Active cooldowns: list of dicts with account, chat, remaining seconds and reason"""
+        now = clock()
+        result = []
+        for (account, chat), (until, reason) in list(self.cooldowns.items()):
+            if until <= now:
+                del self.cooldowns[(account, chat)]
+                continue
+            result.append({'account': account, 'chat': chat, 'remaining': until - now, 'reason': reason})
+        return sorted(result, key=lambda c: c['remaining'])
+
+    def format_report(self):
+        active = self.status()
+        if not active:
+            return "Cooldowns: none"
+        lines = [f"Cooldowns: {len(active)} active"]
+        for c in active:
+            scope = f" in {c['chat']}" if c['chat'] else ""
+            lines.append(f"  {c['account']}{scope}: {c['remaining']:.0f}s left ({c['reason']})")
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+import heapq
+import asyncio
+import itertools
+from collections import deque
+import config
+from metrics import get_metrics
+
+
+class DriftStats:
+    """Planned vs. actual dispatch time for one job"""
+
+    def __init__(self, window=200):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, drift):
+        self.count += 1
+        self.total += drift
+        self.max = max(self.max, drift)
+        self.recent.append(drift)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def p95(self):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class SendScheduler:
+    """One heap of pending jobs for the whole process, run by a bounded executor pool.
+
+    A job is any object with a `key` and an async `step()` that does one
+    unit of work (one send) and returns the delay in seconds until it should
+    run again, or None when it is finished. Due jobs are handed to at most
+    `max_concurrent` executors; `min_gap` spaces consecutive dispatches to cap
+    the total send rate of the process.
+    """
+
+    def __init__(self, max_concurrent=None, min_gap=None):
+        self.max_concurrent = max_concurrent or config.MAX_CONCURRENT_SENDS
+        self.min_gap = config.MIN_DISPATCH_GAP if min_gap is None else min_gap
+        self.heap = []
+        self.jobs = {}              # key -> job, for everything scheduled or running
+        self.drift = {}             # key -> DriftStats
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._ready = asyncio.Queue()
+        self._running = 0
+        self._last_dispatch = None
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def add(self, job, delay=0):
+        """Schedule a job to run `delay` seconds from now"""
+        self.jobs[job.key] = job
+        self._push(job, self._now() + delay)
+
+    def remove(self, key):
+        """Stop scheduling a job; an in-flight step is allowed to finish"""
+        return self.jobs.pop(key, None)
+
+    def _push(self, job, at):
+        heapq.heappush(self.heap, (at, next(self._seq), job))
+        get_metrics().set('tg_queue_depth', len(self.heap))
+        self._wakeup.set()
+
+    def pending(self):
+        return len(self.heap)
+
+    def _idle(self):
+        return not self.heap and not self._running and self._ready.empty()
+
+    async def _executor(self):
+        while True:
+            planned, job = await self._ready.get()
+            try:
+                if self.jobs.get(job.key) is not job:
+                    continue  # removed while waiting in the queue
+                stats = self.drift.setdefault(job.key, DriftStats())
+                stats.add(max(0.0, self._now() - planned))
+                try:
+                    delay = await job.step()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[scheduler] Job {job.key} failed: {e}")
+                    delay = None
+                if delay is None:
+                    if self.jobs.get(job.key) is job:
+                        del self.jobs[job.key]
+                elif self.jobs.get(job.key) is job:
+                    self._push(job, self._now() + delay)
+            finally:
+                self._running -= 1
+                self._ready.task_done()
+                self._wakeup.set()
+
+    async def run(self, stop_when_idle=True):
+        """Dispatch due jobs until there is nothing left to run"""
+        executors = [asyncio.create_task(self._executor()) for _ in range(self.max_concurrent)]
+        try:
+            while True:
+                if stop_when_idle and self._idle():
+                    break
+                self._wakeup.clear()
+                if not self.heap:
+                    await self._wakeup.wait()
+                    continue
+
+                planned, _, job = self.heap[0]
+                if self.jobs.get(job.key) is not job:
+                    heapq.heappop(self.heap)  # removed job
+                    continue
+
+                now = self._now()
+                at = planned
+                if self.min_gap and self._last_dispatch is not None:
+                    at = max(at, self._last_dispatch + self.min_gap)
+                if at > now:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), at - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self._running >= self.max_concurrent:
+                    await self._wakeup.wait()
+                    continue
+
+                heapq.heappop(self.heap)
+                get_metrics().set('tg_queue_depth', len(self.heap))
+                self._running += 1
+                self._last_dispatch = now
+                # Drift is measured against the planned time, so rate capping shows up in it
+                self._ready.put_nowait((planned, job))
+        finally:
+            for task in executors:
+                task.cancel()
+            await asyncio.gather(*executors, return_exceptions=True)
+
+    def format_report(self):
+        lines = [f"Scheduler: {len(self.jobs)} jobs, {self.pending()} pending, {self._running} sending"]
+        for key, stats in sorted(self.drift.items()):
+            lines.append(f"  {key}: {stats.count} dispatches, drift mean {stats.mean:.2f}s, "
+                         f"p95 {stats.p95:.2f}s, max {stats.max:.2f}s")
+        return "\n".join(lines)
@@ -5,6 +5,7 @@ import os
 import json
 from datetime import datetime
 from dotenv import load_dotenv
+from metrics import get_metrics
 
 # 加载环境变量
 load_dotenv()
@@ -83,6 +84,7 @@ async def main():
                 # 保存成员信息
                 with open(filename, 'w', encoding='utf-8') as f:
                     json.dump(participants, f, ensure_ascii=False, indent=2)
+                get_metrics().inc('tg_members_seen_total', len(participants), script='scrape_members', group=group_title)
                     
                 print(f"成功保存 {len(participants)} 个成员信息到文件: {filename}")
             else:
@@ -1,16 +1,31 @@
 import os
-import pandas as pd
-from telethon import TelegramClient
+from telethon import TelegramClient, errors
 import asyncio
 import random
+import time
 from telethon.tl.types import ReactionEmoji
 from telethon.tl.functions.messages import SendReactionRequest
-from telethon.tl.functions.channels import JoinChannelRequest
 import argparse
+import itertools
 import sys
 import csv
 import json
 import config
+from client_pool import ClientPool
+from media_cache import MediaCache, send_cached_file
+from message_plan import load_message_plan, MessagePlan
+from media_prep import get_preparer, list_media
+from cursor_store import CursorStore, cursor_key
+from scheduler import SendScheduler
+from rate_limit import RateLimiter, clock
+from account_selector import AccountSelector
+import shard_supervisor
+from identity_cache import get_identity, describe
+from peer_cache import PeerCache
+from proxy_manager import get_proxy_manager, proxy_key
+from metrics import get_metrics
+from batch_writer import buffer_stdout
+from membership_ledger import get_ledger, ensure_joined, JOINED
 
 # Force UTF-8 encoding for Windows console
 if sys.platform.startswith('win'):
@@ -19,6 +34,12 @@ if sys.platform.startswith('win'):
 # Configuration Constants
 DEFAULT_MIN_INTERVAL = 5
 DEFAULT_MAX_INTERVAL = 120
+CYCLE_RESTART_DELAY = 5
+
+# Uploaded-media caches, one per account (session path -> MediaCache)
+media_caches = {}
+# Resolved group peers, one cache per account (session path -> PeerCache)
+peer_caches = {}
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Telegram message sender')
@@ -26,6 +47,16 @@ def parse_args():
     parser.add_argument('--loop', action='store_true', help='Enable continuous message sending mode')
     parser.add_argument('--max-messages', type=int, help='Limit number of messages to send per group')
     parser.add_argument('--prefer-media', action='store_true', help='Prioritize media messages')
+    parser.add_argument('--bootstrap-concurrency', type=int, help='Max sessions to connect in parallel at startup')
+    parser.add_argument('--reset-cursor', action='store_true', help='Start from the first CSV row instead of the saved position')
+    parser.add_argument('--max-concurrent-sends', type=int, help='Max sends in flight at once across all groups')
+    parser.add_argument('--min-send-gap', type=float, help='Minimum seconds between any two sends (caps total send rate)')
+    parser.add_argument('--seek', type=int, metavar='ROW', help='Start from this CSV data row (0-based) and save it as the position')
+    parser.add_argument('--shards', type=int, help='Split groups across N processes (runs a supervisor unless --shard is given)')
+    parser.add_argument('--shard', type=int, help='Run only shard i of --shards N')
+    parser.add_argument('--simulate', action='store_true', help='Dry run on a virtual clock with fake clients; prints a send timeline')
+    parser.add_argument('--duration', default='24h', help='Simulated time for --simulate (e.g. 90m, 24h, 7d)')
+    parser.add_argument('--verbose', action='store_true', help="With --simulate, show the sender's own output")
     return parser.parse_args()
 
 def load_group_config():
@@ -48,29 +79,34 @@ def load_group_config():
         print(f"Error loading config: {e}")
         return {}
 
-def get_message_text(message_data):
-    """Safe extraction of message text content"""
-    # Normalized search for various possible header names for 'content'
-    lower_map = {str(k).strip().lower(): v for k, v in message_data.items()}
-    for k in ('content', 'message_content', 'text', 'message'):
-        v = lower_map.get(k)
-        if v is not None and not pd.isna(v) and str(v).strip() != '':
-            return str(v)
-    return None
-
-def get_message_type(message_data):
-    """Determine message type (text, photo, video, etc.)"""
-    lower_map = {str(k).strip().lower(): v for k, v in message_data.items()}
-    for k in ('type', 'message_type', 'msg_type'):
-        v = lower_map.get(k)
-        if v is not None and not pd.isna(v) and str(v).lower() != 'nan':
-            return str(v).lower()
-    return 'text'
-
-def get_message_meta(message_data, key_name):
-    """Helper to get columns like media_file, id, etc."""
-    lower_map = {str(k).strip().lower(): v for k, v in message_data.items()}
-    return lower_map.get(str(key_name).strip().lower())
+def get_media_cache(session_path):
+    """Get (or load) the uploaded-media cache for an account"""
+    cache = media_caches.get(session_path)
+    if cache is None:
+        account = os.path.basename(session_path).replace('.session', '')
+        cache = MediaCache(account)
+        media_caches[session_path] = cache
+    return cache
+
+def get_peer_cache(session_path):
+    """Get (or load) the resolved-peer cache for an account"""
+    cache = peer_caches.get(session_path)
+    if cache is None:
+        account = os.path.basename(session_path).replace('.session', '')
+        cache = PeerCache(account)
+        peer_caches[session_path] = cache
+    return cache
+
+def format_peer_cache_report():
+    hits = sum(c.hits for c in peer_caches.values())
+    resolves = sum(c.resolves for c in peer_caches.values())
+    return f"Peer cache: {hits} hits, {resolves} resolves"
+
+def format_media_cache_report():
+    hits = sum(c.hits for c in media_caches.values())
+    misses = sum(c.misses for c in media_caches.values())
+    refreshes = sum(c.refreshes for c in media_caches.values())
+    return f"Media cache: {hits} hits, {misses} uploads, {refreshes} refreshed references"
 
 def get_session_files(session_folder):
     """Find .session files in the specified subdirectory under SESSIONS_DIR"""
@@ -87,16 +123,38 @@ async def try_connect(session_path, proxy_config):
         config.API_ID,
         config.API_HASH,
         proxy=proxy_config,
-        connection_retries=None,
-        retry_delay=1
+        # Finite: a dead proxy has to fail so ProxyManager (and the circuit breaker) learn about it
+        connection_retries=config.CONNECT_RETRIES,
+        retry_delay=1,
+        # Never sleep through a FloodWait inside the call: RateLimiter puts the account on cooldown instead
+        flood_sleep_threshold=0
     )
+    proxies = get_proxy_manager()
     try:
         # print(f"Connecting with proxy {proxy_config[1]}...") 
-        await client.connect()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(client.connect(), config.PROXY_CONNECT_TIMEOUT)
+        except asyncio.CancelledError:
+            # Lost the race, bootstrap timed out or shutting down: says nothing bad about the
+            # proxy, so neither its breaker nor the session's sticky proxy are touched
+            raise
+        except Exception:
+            # Connect error or PROXY_CONNECT_TIMEOUT: this is what trips the breaker
+            proxies.record_failure(proxy_config, session_path)
+            raise
+        proxies.record_success(proxy_config, time.monotonic() - started, session_path)
         if await client.is_user_authorized():
             return client
         await client.disconnect()
         return None
+    except asyncio.CancelledError:
+        # Lost a proxy race: don't leave a half-open connection behind
+        try:
+            await client.disconnect()
+        except:
+            pass
+        raise
     except Exception:
         try:
             await client.disconnect()
@@ -104,256 +162,525 @@ async def try_connect(session_path, proxy_config):
             pass
         return None
 
-async def init_clients_for_group(session_folder, group_link):
-    """Initialize all valid sessions for a group and ensure they have joined"""
+async def race_connect(session_path, proxies, stagger=None):
+    """Race proxies for one session, returning (client, proxy) for whichever connects first.
+
+    Proxies start in the given order; the next one is started when the previous
+    one fails or hasn't connected within `stagger` seconds. Losers are cancelled.
+    """
+    if stagger is None:
+        stagger = config.PROXY_RACE_DELAY
+    tasks = {}
+    next_idx = 0
+    winner = (None, None)
+    try:
+        while winner[0] is None and (next_idx < len(proxies) or tasks):
+            if next_idx < len(proxies):
+                proxy = proxies[next_idx]
+                tasks[asyncio.create_task(try_connect(session_path, proxy))] = proxy
+                next_idx += 1
+            # Only wait `stagger` if there is another proxy left to start
+            timeout = stagger if next_idx < len(proxies) else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                proxy = tasks.pop(task)
+                client = task.result()
+                if client is None:
+                    continue
+                if winner[0] is None:
+                    winner = (client, proxy)
+                else:
+                    await client.disconnect()
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                client = await task
+                if client:
+                    await client.disconnect()
+            except (asyncio.CancelledError, Exception):
+                pass
+    return winner
+
+async def reconnect_session(session_path):
+    """New connected client for a pooled session, best proxy first (None if all fail)"""
+    client, _ = await race_connect(session_path, get_proxy_manager().ordered(session_path))
+    return client
+
+async def join_group(client, session_path, group_link, peers):
+    """Make sure the account is in the group. Returns the membership status."""
+    ledger = get_ledger()
+    # The ledger remembers earlier joins, so a restart skips the resolve + join RPCs
+    status = ledger.fresh_status(session_path, group_link)
+    if status is not None:
+        ledger.hits += 1
+        return status
+    # Resolved once per account and persisted, so restarts don't resolve the link again
+    entity = await peers.resolve(client, group_link)
+    return await ensure_joined(client, session_path, group_link, entity, ledger, refresh=True)
+
+async def bootstrap_session(session_file, session_folder, group_link, pool):
+    """Connect, authorize and join one session. Returns a timing record."""
+    name = os.path.basename(session_file)
+    record = {'session': name, 'ok': False, 'proxy': None, 'connect': 0.0, 'join': 0.0, 'membership': None}
+    start = time.monotonic()
+
+    if session_file in pool.entries:
+        # Already connected for another group in this process
+        client = await pool.acquire(session_file)
+        record['proxy'] = 'pooled'
+    else:
+        # Best proxy for this session first (sticky, lowest latency, breakers skipped)
+        client, proxy = await race_connect(session_file, get_proxy_manager().ordered(session_file))
+        record['proxy'] = proxy_key(proxy) if proxy else None
+    record['connect'] = time.monotonic() - start
+
+    if not client:
+        print(f"[{session_folder}] Failed to connect session: {name}")
+        return record
+
+    join_start = time.monotonic()
+    try:
+        record['membership'] = await join_group(client, session_file, group_link, get_peer_cache(session_file))
+    except asyncio.CancelledError:
+        # Bootstrap deadline hit mid-join: don't leave a connection the pool doesn't know about
+        if session_file not in pool.entries:
+            await client.disconnect()
+        raise
+    except Exception as e:
+        print(f"[{session_folder}] Error joining group {group_link}: {e}")
+    record['join'] = time.monotonic() - join_start
+
+    if session_file not in pool.entries:
+        pool.add(session_file, client)
+    record['ok'] = True
+    return record
+
+def format_startup_report(session_folder, records, elapsed):
+    """Summarize bootstrap timings for one folder"""
+    ok = [r for r in records if r['ok']]
+    lines = [f"[{session_folder}] Startup: {len(ok)}/{len(records)} sessions ready in {elapsed:.1f}s"]
+    if ok:
+        connects = sorted(r['connect'] for r in ok)
+        median = connects[len(connects) // 2]
+        lines.append(f"[{session_folder}]   connect median {median:.2f}s, max {connects[-1]:.2f}s; "
+                     f"join max {max(r['join'] for r in ok):.2f}s")
+    for r in sorted(records, key=lambda r: r['session']):
+        status = f"via {r['proxy']}" if r['ok'] else "FAILED"
+        if r['membership'] and r['membership'] != JOINED:
+            status += f", {r['membership']}"
+        lines.append(f"[{session_folder}]   {r['session']}: {status} "
+                     f"(connect {r['connect']:.2f}s, join {r['join']:.2f}s)")
+    return "\n".join(lines)
+
+async def init_clients_for_group(session_folder, group_link, pool, concurrency=None):
+    """Initialize all valid sessions for a group, ensure they have joined and register them in the pool.
+
+    Sessions are bootstrapped in parallel, at most `concurrency` at a time.
+    Returns the list of session paths that are now held by the pool.
+    """
     session_files = get_session_files(session_folder)
-    clients = []
-    
+    semaphore = asyncio.Semaphore(concurrency or config.BOOTSTRAP_CONCURRENCY)
+
     print(f"[{session_folder}] Found {len(session_files)} session files. Initializing...")
-    
-    for session_file in session_files:
-        client = None
-        # Try proxies until one works
-        # Shuffle proxies to distribute load? Or keep order. config.PROXY_LIST is usually short.
-        # Let's just try sequentially or random. Random is better for avoiding same proxy spam if list is long.
-        proxies = list(config.PROXY_LIST)
-        # random.shuffle(proxies) # User requested fixed order: try first, then second.
-        
-        for proxy in proxies:
-            client = await try_connect(session_file, proxy)
-            if client:
-                break
-        
-        if client:
-            # Check/Join Group
+
+    async def bounded(session_file):
+        async with semaphore:
             try:
-                entity = await client.get_entity(group_link)
-                # Just getting entity often works if already joined. 
-                # explicit Join check is expensive, maybe just try JoinChannelRequest catch error?
-                # But 'get_entity' works for public groups even if not joined.
-                # Let's try to join to be safe.
-                try:
-                    await client(JoinChannelRequest(entity))
-                except Exception as e:
-                    if "already participant" not in str(e).lower():
-                        pass # Ignore if already inside or other minor errors
-            except Exception as e:
-                print(f"[{session_folder}] Error joining group {group_link}: {e}")
-                
-            clients.append(client)
-        else:
-            print(f"[{session_folder}] Failed to connect session: {os.path.basename(session_file)}")
+                return await asyncio.wait_for(bootstrap_session(session_file, session_folder, group_link, pool),
+                                              config.BOOTSTRAP_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Every proxy hung: give the slot to the next session instead of holding it forever
+                name = os.path.basename(session_file)
+                print(f"[{session_folder}] Bootstrap of {name} timed out after {config.BOOTSTRAP_TIMEOUT}s")
+                return {'session': name, 'ok': False, 'proxy': None, 'connect': float(config.BOOTSTRAP_TIMEOUT),
+                        'join': 0.0, 'membership': None}
 
-    return clients
+    start = time.monotonic()
+    records = await asyncio.gather(*(bounded(f) for f in session_files))
+    print(format_startup_report(session_folder, records, time.monotonic() - start))
+    print(f"[{session_folder}] {get_ledger().format_report()}")
 
-async def send_message_safe(client, entity, message_data, reply_to=None, media_base_dir=None):
-    """Send a message (text or media) handling errors"""
-    
-    # Get user info for logging
-    try:
-        me = await client.get_me()
-        user_info = f"{me.first_name} (@{me.username} ID:{me.id})"
-    except:
-        user_info = "Unknown User"
+    # Accounts that aren't in the group (banned, waiting for approval, in too many
+    # channels) stay connected (other groups may use them) but don't send here
+    return [f for f, r in zip(session_files, records) if r['ok'] and r['membership'] == JOINED]
+
+# Errors that mean the cached peer or the membership is wrong, as opposed to a network blip
+PEER_ERRORS = (errors.ChannelInvalidError, errors.ChannelPrivateError, errors.ChatIdInvalidError,
+               errors.PeerIdInvalidError, errors.UserNotParticipantError)
 
-    msg_type = get_message_type(message_data)
+async def send_message_safe(client, entity, message, reply_to=None, media_cache=None, user_info="Unknown User"):
+    """Send a compiled PlannedMessage (text or media) handling errors.
+
+    Returns None on success, otherwise the exception that made the send fail.
+    """
     kwargs = {}
     if reply_to:
         kwargs['reply_to'] = reply_to
         
     try:
-        if msg_type == 'text':
-            text = get_message_text(message_data)
-            if text:
-                await client.send_message(entity, text, **kwargs)
-                return True
-                
-        elif msg_type in ['photo', 'video', 'file']:
-            media_path_raw = get_message_meta(message_data, 'media_file')
-            text = get_message_text(message_data) # Caption
-            
-            # Fix: Handle NaN/Float from pandas
-            if pd.isna(media_path_raw):
-                media_path_raw = None
-            else:
-                media_path_raw = str(media_path_raw).strip()
-                if not media_path_raw: 
-                    media_path_raw = None
-
-            # Fallback: if media_file col is empty, try using 'content' column
-            if not media_path_raw and text and ('/' in text or '.' in text): 
-                 # Heuristic: if content looks like a path, use it.
-                 media_path_raw = text
-                 # Since we used text as the path, we shouldn't use it as caption anymore
-                 text = None
-            
-            if not media_path_raw:
-                print(f"[{user_info}] Warning: Media message missing path. Row data: {message_data}")
-                return False
-
-            # Avoid sending the path as a caption if they are identical
-            if text and media_path_raw and text.strip() == media_path_raw.strip():
-                text = None
-                
-            # Resolve Media Path
-            if os.path.isabs(media_path_raw):
-                full_path = media_path_raw
-            else:
-                clean_path = media_path_raw.lstrip('/\\')
-                potential_paths = []
-                if media_base_dir:
-                    potential_paths.append(os.path.join(media_base_dir, clean_path))
-                potential_paths.append(os.path.join(config.BASE_DIR, clean_path))
-                
-                full_path = None
-                for p in potential_paths:
-                    if os.path.exists(p):
-                        full_path = p
-                        break
-            
-            if not full_path or not os.path.exists(full_path):
-                print(f"[{user_info}] Error: Media file not found: {media_path_raw}")
-                return False
-                
-            await client.send_file(entity, full_path, caption=text, **kwargs)
-            return True
+        if message.kind == 'text':
+            await client.send_message(entity, message.text, **kwargs)
+        else:
+            # Media path was resolved when the CSV was compiled; send its preprocessed variant if there is one
+            file_path, extra = await get_preparer().variant(message.media_path, message.kind)
+            await send_cached_file(client, media_cache, entity, file_path, caption=message.text, **extra, **kwargs)
+        return None
             
+    except errors.FloodError:
+        # FloodWait / SlowModeWait: the caller puts the account on cooldown and re-dispatches
+        raise
     except Exception as e:
         print(f"[{user_info}] Send failed: {e}")
-        # If it's a connection error, try to disconnect so we reconnect next time
-        try:
-            await client.disconnect()
-        except:
-            pass
-        return False
-        
-    return False
-
-async def worker(group_key, config_item, args):
-    """Worker task for a single group configuration"""
-    group_link = config_item['group_link']
-    topic_id = config_item.get('topic_id')
-    session_folder = config_item['session_folder']
-    csv_file = config_item['csv_file']
-    media_base_dir = config_item.get('media_base_dir')
-    
-    # Interval configuration
-    min_interval = config_item.get('min_interval', DEFAULT_MIN_INTERVAL)
-    max_interval = config_item.get('max_interval', DEFAULT_MAX_INTERVAL)
-    
-    # Resolve absolute paths
-    if not os.path.isabs(csv_file):
-        csv_file = os.path.join(config.BASE_DIR, csv_file)
-    if media_base_dir and not os.path.isabs(media_base_dir):
-        # Join with BASE_DIR or CSV dir? Usually BASE_DIR relative.
-        media_base_dir = os.path.join(config.BASE_DIR, media_base_dir)
-        
-    print(f"[{group_key}] Starting worker for {group_link} (Topic: {topic_id})")
-    
-    # Load Messages
-    try:
-        df = pd.read_csv(csv_file)
-        messages = df.to_dict('records')
-    except Exception as e:
-        print(f"[{group_key}] Failed to load CSV {csv_file}: {e}")
-        return
+        return e
 
-    # Filter messages if needed
-    if args.max_messages:
-        messages = messages[:args.max_messages]
+class GroupJob:
+    """Sending state for one group_config.json entry, driven by the SendScheduler.
 
-    # Initialize Clients
-    raw_clients = await init_clients_for_group(session_folder, group_link)
-    if not raw_clients:
-        print(f"[{group_key}] No active clients. Aborting.")
-        return
-    
-    # Cache user info
-    clients = [] # List of (client, me)
-    for c in raw_clients:
+    `setup()` loads the CSV and bootstraps the sessions; every `step()` sends
+    one message and returns how long to wait before the next one.
+    """
+
+    def __init__(self, key, config_item, args, pool, cursors, limiter, selector):
+        self.key = key
+        self.args = args
+        self.pool = pool
+        self.cursors = cursors
+        self.limiter = limiter
+        self.selector = selector
+        self._configure(config_item)
+
+        self.plan = None
+        self.clients = {}       # session_path -> Identity
+        self.messages = None    # iterator over the current cycle
+        self.pending = None     # message waiting for an available account
+        self.next_config = None # changed config entry, applied before the next send
+
+    def _configure(self, config_item):
+        """Take settings from a group_config entry (everything except the sessions themselves)"""
+        self.config_item = config_item
+        self.group_link = config_item['group_link']
+        self.topic_id = config_item.get('topic_id')
+        self.session_folder = config_item['session_folder']
+        self.cursor = cursor_key(self.group_link, self.topic_id, config_item['csv_file'])
+
+        # Interval configuration
+        self.min_interval = config_item.get('min_interval', DEFAULT_MIN_INTERVAL)
+        self.max_interval = config_item.get('max_interval', DEFAULT_MAX_INTERVAL)
+        # Minimum seconds before the same account speaks again in this group
+        self.min_account_gap = config_item.get('min_account_gap')
+
+        # Resolve absolute paths
+        self.csv_file = config_item['csv_file']
+        if not os.path.isabs(self.csv_file):
+            self.csv_file = os.path.join(config.BASE_DIR, self.csv_file)
+        self.media_base_dir = config_item.get('media_base_dir')
+        if self.media_base_dir and not os.path.isabs(self.media_base_dir):
+            # Join with BASE_DIR or CSV dir? Usually BASE_DIR relative.
+            self.media_base_dir = os.path.join(config.BASE_DIR, self.media_base_dir)
+
+        # Loop configuration
+        self.should_loop = self.args.loop or config_item.get('loop', False)
+
+    async def setup(self):
+        """Load messages and connect sessions. Returns False if the job can't run."""
+        print(f"[{self.key}] Starting worker for {self.group_link} (Topic: {self.topic_id})")
+
+        # Load and compile messages once; broken rows are reported here, not at send time
         try:
-            me = await c.get_me()
-            clients.append((c, me))
+            self.plan = load_message_plan(self.csv_file, self.media_base_dir)
         except Exception as e:
-            print(f"[{group_key}] Error getting info for a client: {e}. Skipping.")
-    
-    if not clients:
-        print(f"[{group_key}] No healthy clients after check. Aborting.")
-        return
+            print(f"[{self.key}] Failed to load CSV {self.csv_file}: {e}")
+            return False
+        print(f"[{self.key}] {self.plan.format_report()}")
+        self._prepare_media()
 
-    print(f"[{group_key}] Active clients: {len(clients)}")
+        # Resume where the previous run stopped (--seek / --reset-cursor were applied in main)
+        if self.cursors.get(self.cursor):
+            print(f"[{self.key}] Resuming at row {self.cursors.get(self.cursor)}/{self.plan.row_count}")
 
-    # Force stdout to utf-8 for Windows console
-    sys.stdout.reconfigure(encoding='utf-8')
-    
-    # Loop configuration
-    should_loop = args.loop or config_item.get('loop', False)
+        # Initialize Clients
+        sessions = await init_clients_for_group(self.session_folder, self.group_link, self.pool,
+                                                self.args.bootstrap_concurrency)
+        if not sessions:
+            print(f"[{self.key}] No active clients. Aborting.")
+            return False
+
+        # Account identity comes from the per-session cache; get_me() only when it's stale
+        for session_path in sessions:
+            try:
+                c = await self.pool.acquire(session_path)
+                me = await get_identity(c, session_path)
+                if me is None:
+                    raise ValueError("session is not authorized")
+                self.clients[session_path] = me
+                self.selector.add(self.key, session_path, self.min_account_gap)
+            except Exception as e:
+                print(f"[{self.key}] Error getting info for a client: {e}. Skipping.")
+
+        if not self.clients:
+            print(f"[{self.key}] No healthy clients after check. Aborting.")
+            return False
+
+        print(f"[{self.key}] Active clients: {len(self.clients)}")
+        return True
+
+    def _prepare_media(self):
+        """Recompress photos / build video thumbnails for this CSV in the background"""
+        if not config.MEDIA_PREP_BACKGROUND:
+            return
+        if isinstance(self.plan, MessagePlan):
+            paths = sorted({m.media_path for m in self.plan if m.media_path})
+        elif self.media_base_dir:
+            # Streaming plans aren't read ahead: take the whole media folder instead
+            paths = list_media(self.media_base_dir)
+        else:
+            return
+        get_preparer().prepare_in_background(paths)
+
+    def _start_cycle(self):
+        # Simple sequential iteration through CSV rows, starting at the saved cursor
+        start_row = self.cursors.get(self.cursor)
+        if start_row >= self.plan.row_count:
+            start_row = 0
+        self.messages = self.plan.iter_from(start_row)
+        # Limit messages if needed
+        if self.args.max_messages:
+            self.messages = itertools.islice(self.messages, self.args.max_messages)
+
+    def _finish_cycle(self):
+        """End of the CSV (or of a --max-messages batch). Returns the delay before the next cycle."""
+        self.messages = None
+        # A full pass wraps around; a --max-messages batch continues from where it stopped
+        if not self.args.max_messages:
+            self.cursors.set(self.cursor, 0)
+
+        if not self.should_loop:
+            return None
+        print(f"[{self.key}] Cycle finished. Connection stats:\n{self.pool.format_report()}")
+        print(f"[{self.key}] {format_media_cache_report()}")
+        print(f"[{self.key}] {format_peer_cache_report()}")
+        print(f"[{self.key}] Restarting...")
+        return CYCLE_RESTART_DELAY
+
+    def reconfigure(self, config_item):
+        """Queue a changed config entry. It is applied at the start of the next step, so an
+        in-flight send finishes with the settings it started with."""
+        self.next_config = config_item
+
+    def _apply_config(self):
+        item, self.next_config = self.next_config, None
+        previous = self.config_item
+        old_source = (self.csv_file, self.media_base_dir)
+        old_cursor = self.cursor
+        self._configure(item)
 
-    # Main Loop
+        if (self.csv_file, self.media_base_dir) != old_source:
+            try:
+                plan = load_message_plan(self.csv_file, self.media_base_dir)
+            except Exception as e:
+                print(f"[{self.key}] Failed to load CSV {self.csv_file}: {e}. Keeping the previous config.")
+                self._configure(previous)
+                return
+            if self.plan:
+                self.plan.close()
+            self.plan = plan
+            print(f"[{self.key}] {self.plan.format_report()}")
+            self._prepare_media()
+        if self.cursor != old_cursor or (self.csv_file, self.media_base_dir) != old_source:
+            # Different CSV or topic: continue from that entry's own saved position
+            self.messages = None
+            self.pending = None
+
+        self.selector.set_min_gap(self.key, self.min_account_gap)
+        print(f"[{self.key}] Config reloaded: interval {self.min_interval}-{self.max_interval}s, "
+              f"loop={self.should_loop}, csv={os.path.basename(self.csv_file)}")
+
+    async def step(self):
+        """Send the next message. Returns the delay before the next step, or None when done."""
+        if self.next_config is not None:
+            self._apply_config()
+        if self.pending is None:
+            if self.messages is None:
+                self._start_cycle()
+            self.pending = next(self.messages, None)
+            if self.pending is None:
+                return self._finish_cycle()
+        msg = self.pending
+        i = msg.row
+
+        chat_wait = self.limiter.chat_wait(self.group_link)
+        if chat_wait:
+            return chat_wait
+
+        reply_target = self.topic_id # Default reply to topic ID (Thread)
+        tried = set()
+        while True:
+            session_path = self.selector.select(self.key, self.group_link, exclude=tried)
+            if session_path is None:
+                # Everyone is cooling down or spoke too recently: keep the message for later
+                wait = max(1.0, self.selector.next_available(self.key, self.group_link) or 0)
+                print(f"[{self.key}] No available account for msg {i}. Retrying in {wait:.0f}s...")
+                return wait
+            me = self.clients[session_path]
+            tried.add(session_path)
+
+            # The pool keeps connections alive; this only waits if a reconnect is in flight
+            client = await self.pool.acquire(session_path)
+            if client is None:
+                print(f"[{self.key}] {me.first_name} is still reconnecting. Trying another account.")
+                self.selector.record_failure(session_path)
+                continue
+
+            peers = get_peer_cache(session_path)
+            started = clock()
+            send_started = time.monotonic()
+            try:
+                entity = await peers.resolve(client, self.group_link)
+                error = await send_message_safe(client, entity, msg, reply_to=reply_target,
+                                                media_cache=get_media_cache(session_path),
+                                                user_info=describe(me))
+            except errors.FloodError as e:
+                seconds = self.limiter.handle_error(session_path, self.group_link, e)
+                self.selector.record_failure(session_path)
+                print(f"[{self.key}] {me.first_name} got {type(e).__name__} ({seconds}s cooldown). "
+                      f"Re-dispatching msg {i}.")
+                continue
+            except Exception as e:
+                # send_message_safe handles its own errors; this is the peer lookup failing
+                print(f"[{self.key}] Could not resolve {self.group_link} for {me.first_name}: {e}")
+                error = e
+            break
+        success = error is None
+
+        self.pending = None
+        self.cursors.set(self.cursor, i + 1)
+        metrics = get_metrics()
+        metrics.inc('tg_sends_total', group=self.key, account=os.path.basename(session_path),
+                    type=msg.kind, result='ok' if success else 'failed')
+        metrics.observe('tg_send_seconds', time.monotonic() - send_started, group=self.key)
+
+        if success:
+            self.limiter.record_send(session_path, self.group_link)
+            self.selector.record_success(session_path, self.key, clock() - started)
+            # Interval
+            wait = random.uniform(self.min_interval, self.max_interval)
+            print(f"[{self.key}] Sent msg {i}. Waiting {wait:.1f}s...")
+            # Connection stays open; the pool pings it while we wait
+            return wait
+
+        print(f"[{self.key}] Failed to send msg {i}. Skipping delay.")
+        self.selector.record_failure(session_path)
+        if isinstance(error, PEER_ERRORS):
+            # The cached peer is what broke (left/kicked, hash changed): resolve again next time
+            peers.invalidate(self.group_link)
+            # ...and so may the membership: verify it at the next start
+            get_ledger().invalidate(session_path, self.group_link)
+        # Might be a dead connection: let the pool check and reconnect in the background
+        self.pool.report_failure(session_path)
+        return 0
+
+    def close(self):
+        if self.plan:
+            self.plan.close()
+
+async def report_loop(interval, *reporters):
+    """Periodically print scheduling drift, cooldowns, ..."""
     while True:
-        # Round-robin messages? Or random?
-        # Requirement implies "Repeating" content usually, but logic in previous sender was sequential.
-        # Let's stick to simple sequential iteration through CSV rows.
-        
-        for i, msg_data in enumerate(messages):
-            # Select client
-            client, me = random.choice(clients)
-            
-            # Fetch recent to decide interaction (random reply etc) - Optional Feature from previous sender?
-            # User requirement just says "send messages". Simplification: Just send.
-            # But previous sender had complex logic (reply rate etc). Keeping it simple first unless requested.
-            # "Sender script... send messages".
-            # Let's assume direct send to topic/group.
-            
-            reply_target = topic_id # Default reply to topic ID (Thread)
-            
-            # If we want to reply to recent messages (simulating convo), we need to fetch history.
-            # Let's keep it robust: Send to Topic.
-            
-            # me = await client.get_me() # Cached
-            # print(f"[{group_key}] Sending msg {i} via {me.first_name}...")
-            
-            # Ensure client is connected
-            if not client.is_connected():
-                # print(f"[{group_key}] Reconnecting client for {me.first_name}...")
-                try:
-                    await client.connect()
-                except Exception as e:
-                    print(f"[{group_key}] Failed to reconnect {me.first_name}: {e}")
+        await asyncio.sleep(interval)
+        for reporter in reporters:
+            print(reporter.format_report())
+
+async def status_loop(shard, interval, jobs, pool, limiter, selector):
+    """Publish this shard's counters for the supervisor"""
+    while True:
+        states = selector.states.values()
+        shard_supervisor.write_status(shard, {
+            'groups': len(jobs),
+            'sessions': len(pool.entries),
+            'sends': sum(s.sends for s in states),
+            'failures': sum(s.failures for s in states),
+            'cooldowns': len(limiter.status()),
+        })
+        await asyncio.sleep(interval)
+
+def config_mtime():
+    try:
+        return os.stat(config.GROUP_CONFIG_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+async def stop_job(job, jobs, scheduler, pool, selector):
+    """Unschedule a job and disconnect the sessions no other job uses"""
+    scheduler.remove(job.key)
+    job.close()
+    for session_path in job.clients:
+        selector.remove(job.key, session_path)
+        if not any(session_path in other.clients for other in jobs.values()):
+            await pool.remove(session_path)
+    print(f"[{job.key}] Stopped (removed from config)")
+
+async def config_watch_loop(interval, args, jobs, scheduler, pool, selector, new_job):
+    """Apply edits to group_config.json without a restart.
+
+    New entries get a job (sessions already in the pool are reused, not
+    reconnected), removed entries are stopped, and changed entries are
+    updated in place before their next send.
+    """
+    last = config_mtime()
+    while True:
+        await asyncio.sleep(interval)
+        mtime = config_mtime()
+        if mtime == last:
+            continue
+        last = mtime
+        group_config = load_group_config()
+        if not group_config:
+            print("Config reload: file empty or invalid, keeping the running config.")
+            continue
+        target_keys = [k for k in (args.groups or group_config.keys()) if k in group_config]
+        wanted = select_shard(group_config, target_keys, args)
+
+        for key in [k for k in jobs if k not in wanted]:
+            await stop_job(jobs.pop(key), jobs, scheduler, pool, selector)
+
+        for key in wanted:
+            item = group_config[key]
+            job = jobs.get(key)
+            if job is not None and job.clients:
+                current = job.next_config or job.config_item
+                if item == current:
+                    continue
+                if (item['group_link'], item['session_folder']) == (current['group_link'], current['session_folder']):
+                    job.reconfigure(item)
+                    # A finished (non-loop) job only runs again if there is something new to send
+                    if key not in scheduler.jobs and (item.get('loop') or item['csv_file'] != current['csv_file']
+                                                      or item.get('topic_id') != current.get('topic_id')):
+                        scheduler.add(job)
                     continue
+            if job is not None:
+                # Different group or session folder (or it never started): replace the job
+                await stop_job(jobs.pop(key), jobs, scheduler, pool, selector)
 
-            success = await send_message_safe(client, group_link, msg_data, reply_to=reply_target, media_base_dir=media_base_dir)
-            
-            if success:
-                # Interval
-                wait = random.uniform(min_interval, max_interval)
-                print(f"[{group_key}] Sent msg {i}. Waiting {wait:.1f}s...")
-                
-                # If wait time is long, disconnect to save resources and avoid timeouts
-                # Telegram/Proxies often kill idle connections stats > 30s
-                if wait > 30:
-                    try:
-                        await client.disconnect()
-                    except:
-                        pass
-                
-                await asyncio.sleep(wait)
+            job = new_job(key, item)
+            if await job.setup():
+                jobs[key] = job
+                scheduler.add(job)
             else:
-                print(f"[{group_key}] Failed to send msg {i}. Skipping delay.")
-                # If failed, it might be a connection issue. Ensure disconnect so we reconnect next time.
-                try:
-                    await client.disconnect()
-                except:
-                    pass
-                
-        if not should_loop:
-            break
-        print(f"[{group_key}] Cycle finished. Restarting...")
-        await asyncio.sleep(5)
+                job.close()
 
-    # Cleanup
-    for c, _ in clients: # clients is list of tuples (client, me)
-        await c.disconnect()
+def shard_weight(session_folder):
+    return len(get_session_files(session_folder))
+
+def select_shard(group_config, target_keys, args):
+    """Keys of this process's shard (all of them when not sharded)"""
+    if args.shard is None:
+        return list(target_keys)
+    subset = {k: group_config[k] for k in target_keys if k in group_config}
+    keys = shard_supervisor.partition_config(subset, args.shards, shard_weight)[args.shard]
+    print(f"[shard {args.shard}/{args.shards}] Groups: {', '.join(keys) or '(none)'}")
+    return keys
 
 async def main():
     args = parse_args()
@@ -363,21 +690,104 @@ async def main():
         print("No group config found or valid.")
         return
 
-    tasks = []
+    if args.shard is not None and (not args.shards or not 0 <= args.shard < args.shards):
+        print("--shard requires --shards N and 0 <= shard < N.")
+        return
+
+    metrics = get_metrics('sender' if args.shard is None else f"sender.shard{args.shard}")
+    jobs = {}
+    # Reconnects go through the proxy race too, so a dead proxy doesn't keep an account down
+    pool = ClientPool(connect=reconnect_session)
+    if args.shard is None:
+        cursors = CursorStore()
+    else:
+        stem, ext = os.path.splitext(config.CURSOR_FILE)
+        cursors = CursorStore(os.path.join(config.STATE_DIR, f"{stem}.shard{args.shard}{ext}"))
+    scheduler = SendScheduler(max_concurrent=args.max_concurrent_sends, min_gap=args.min_send_gap)
+    limiter = RateLimiter()
+    selector = AccountSelector(limiter)
     
     # keys are 'session_folder' names based on my load_group_config logic
     target_keys = args.groups if args.groups else group_config.keys()
+    missing = [k for k in target_keys if k not in group_config]
+    target_keys = select_shard(group_config, target_keys, args) + missing
     
+    def new_job(key, config_item):
+        return GroupJob(key, config_item, args, pool, cursors, limiter, selector)
+
     for key in target_keys:
         if key in group_config:
-            tasks.append(worker(key, group_config[key], args))
+            jobs[key] = new_job(key, group_config[key])
         else:
             print(f"Config for '{key}' not found.")
             
-    if tasks:
-        await asyncio.gather(*tasks)
-    else:
+    if not jobs:
         print("Nothing to run.")
+        return
+
+    # Once, for the jobs of this start only: jobs added later by the config watcher resume
+    for job in jobs.values():
+        if args.seek is not None:
+            cursors.set(job.cursor, args.seek)
+        elif args.reset_cursor:
+            cursors.reset(job.cursor)
+    if args.seek is not None or args.reset_cursor:
+        cursors.flush()
+
+    # Force stdout to utf-8 for Windows console
+    sys.stdout.reconfigure(encoding='utf-8')
+    # print() from here on is queued and written (console + daily log file) by a background thread
+    log_file = config.SENDER_LOG_FILE
+    if args.shard is not None:
+        stem, ext = os.path.splitext(log_file)
+        log_file = f"{stem}.shard{args.shard}{ext}"
+    stdout = buffer_stdout(log_file)
+
+    reporter = None
+    status = None
+    watcher = None
+    # Counters are kept in memory and copied to METRICS_DB for web_manager's /metrics
+    background = [asyncio.create_task(metrics.run_flusher()),
+                  asyncio.create_task(metrics.watch_loop_lag())]
+    try:
+        ready = await asyncio.gather(*(job.setup() for job in jobs.values()))
+        for job, ok in zip(list(jobs.values()), ready):
+            if ok:
+                scheduler.add(job)
+        reporter = asyncio.create_task(report_loop(config.STATUS_REPORT_INTERVAL, scheduler, limiter, selector))
+        if args.shard is not None:
+            status = asyncio.create_task(status_loop(args.shard, config.SHARD_STATUS_INTERVAL,
+                                                     jobs, pool, limiter, selector))
+        if config.CONFIG_WATCH_INTERVAL:
+            watcher = asyncio.create_task(config_watch_loop(config.CONFIG_WATCH_INTERVAL, args, jobs,
+                                                            scheduler, pool, selector, new_job))
+        await scheduler.run()
+    finally:
+        for task in [reporter, status, watcher] + background:
+            if task:
+                task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        print(scheduler.format_report())
+        print(limiter.format_report())
+        print(get_proxy_manager().format_report())
+        print(selector.format_report())
+        print(f"Connection stats:\n{pool.format_report()}")
+        print(format_media_cache_report())
+        print(format_peer_cache_report())
+        cursors.flush()
+        for job in jobs.values():
+            job.close()
+        get_preparer().close()
+        await pool.close()
+        stdout.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    cli_args = parse_args()
+    if cli_args.simulate:
+        import simulate
+        simulate.run(cli_args)
+    elif cli_args.shards and cli_args.shard is None:
+        # Supervisor mode: one child process per shard
+        shard_supervisor.supervise(os.path.abspath(__file__), sys.argv[1:], cli_args.shards)
+    else:
+        asyncio.run(main())
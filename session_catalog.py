@@ -0,0 +1,138 @@
+import os
+import time
+import config
+
+SORT_KEYS = {
+    'path': lambda s: (s['folder'], s['name']),
+    'name': lambda s: (s['name'], s['folder']),
+    'modified': lambda s: (s['modified'], s['folder'], s['name']),
+}
+
+# Sorted/filtered listings kept per catalog version (oldest dropped first)
+MAX_VIEWS = 64
+
+
+class _Dir:
+    __slots__ = ('mtime', 'sessions', 'subdirs')
+
+    def __init__(self, mtime, sessions, subdirs):
+        self.mtime = mtime
+        self.sessions = sessions
+        self.subdirs = subdirs
+
+
+class SessionCatalog:
+    """In-memory index of the *.session files under SESSIONS_DIR.
+
+    Directories are only re-read when their mtime changes (a file added,
+    removed or renamed in them), and mtimes are checked at most every
+    `check_interval` seconds, so a listing request costs a dict lookup plus
+    the slice it returns. Session files of unchanged directories are
+    re-stat'ed in the same pass, since Telethon writes to a .session without
+    touching its directory. Sorted/filtered views are built once per change.
+    """
+
+    def __init__(self, root=None, check_interval=None):
+        self.root = root or config.SESSIONS_DIR
+        self.check_interval = config.CATALOG_CHECK_INTERVAL if check_interval is None else check_interval
+        self.dirs = {}          # dir relative to root ('' = root) -> _Dir
+        self.version = 0        # bumped whenever the set of sessions changes
+        self._checked = None
+        self._views = {}
+
+    def refresh(self, force=False):
+        """Re-read directories whose mtime changed and re-stat the rest. Returns True if anything changed."""
+        now = time.monotonic()
+        if not force and self._checked is not None and now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+
+        changed = False         # sessions added or removed
+        touched = False         # only modification times moved
+        seen = set()
+        stack = list(self.dirs) or ['']
+        while stack:
+            rel = stack.pop()
+            if rel in seen:
+                continue
+            try:
+                mtime = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+            except OSError:
+                continue  # gone: dropped below with everything else not seen
+            seen.add(rel)
+            known = self.dirs.get(rel)
+            if known is None or known.mtime != mtime:
+                known = self.dirs[rel] = self._read_dir(rel, mtime)
+                changed = True
+            elif self._restat(known):
+                touched = True
+            stack.extend(known.subdirs)
+
+        for rel in [r for r in self.dirs if r not in seen]:
+            del self.dirs[rel]
+            changed = True
+        if changed:
+            self.version += 1
+        if changed or touched:
+            self._views.clear()
+        return changed or touched
+
+    def _restat(self, d):
+        """Refresh `modified` of the sessions in an unchanged directory. Returns True if any moved."""
+        touched = False
+        for s in d.sessions:
+            try:
+                modified = os.stat(os.path.join(self.root, s['path'])).st_mtime
+            except OSError:
+                continue  # removed: the directory's mtime changes and it is re-read next time
+            if modified != s['modified']:
+                s['modified'] = modified
+                touched = True
+        return touched
+
+    def _read_dir(self, rel, mtime):
+        sessions, subdirs = [], []
+        try:
+            entries = list(os.scandir(os.path.join(self.root, rel)))
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdirs.append(os.path.join(rel, entry.name))
+                elif entry.name.endswith('.session'):
+                    sessions.append({
+                        "path": os.path.join(rel, entry.name),
+                        "name": entry.name,
+                        "folder": rel,
+                        "modified": entry.stat().st_mtime,
+                    })
+            except OSError:
+                continue  # removed while we were looking
+        sessions.sort(key=lambda s: s['name'])
+        return _Dir(mtime, sessions, subdirs)
+
+    def sessions(self, folder=None, q=None, sort='path', descending=False):
+        """Sessions in `folder` (and its subfolders), optionally with `q` in the file name, sorted"""
+        self.refresh()
+        key = (folder or '', (q or '').lower(), sort, descending)
+        view = self._views.get(key)
+        if view is None:
+            prefix = os.path.join(folder, '') if folder else None
+            view = [s for rel, d in self.dirs.items()
+                    if prefix is None or rel == folder or rel.startswith(prefix)
+                    for s in d.sessions if not key[1] or key[1] in s['name'].lower()]
+            view.sort(key=SORT_KEYS[sort], reverse=descending)
+            if len(self._views) >= MAX_VIEWS:
+                del self._views[next(iter(self._views))]
+            self._views[key] = view
+        return view
+
+    def folders(self):
+        """Top-level folders with the number of sessions directly inside them"""
+        self.refresh()
+        top = self.dirs.get('')
+        if top is None:
+            return []
+        return [{"name": os.path.basename(rel), "session_count": len(self.dirs[rel].sessions)}
+                for rel in sorted(top.subdirs) if rel in self.dirs]
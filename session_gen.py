@@ -3,8 +3,10 @@ import asyncio
 import sys
 import argparse
 from telethon import TelegramClient, errors
+import time
 import config
 import random
+from proxy_manager import get_proxy_manager, proxy_dict
 
 # Phone Numbers List
 PHONE_NUMBERS = [
@@ -27,18 +29,7 @@ async def try_connect_with_proxy(phone_number, proxy_config, session_dir):
         
         # Create proxy dict for Telethon
         # config.PROXY_LIST elements are tuples: (type, addr, port, rdns, user, pass)
-        # We need to map them correctly.
-        # config.PROXY_LIST example: ("socks5", "50.3.54.17", 443, True, "VYHMOLXmzmCy", "X9FgH374SH")
-        
-        p = proxy_config
-        proxy = {
-            'proxy_type': p[0],
-            'addr': p[1],
-            'port': p[2],
-            'rdns': p[3],
-            'username': p[4],
-            'password': p[5]
-        }
+        proxy = proxy_dict(proxy_config)
         
         print(f"Using proxy: {proxy['addr']}:{proxy['port']}")
 
@@ -49,7 +40,14 @@ async def try_connect_with_proxy(phone_number, proxy_config, session_dir):
             proxy=proxy
         )
         
-        await client.connect()
+        proxies = get_proxy_manager()
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception:
+            proxies.record_failure(proxy_config, session_path)
+            raise
+        proxies.record_success(proxy_config, time.monotonic() - started, session_path)
         
         if not await client.is_user_authorized():
             print(f"Requesting login code for {phone_number}...")
@@ -110,9 +108,9 @@ async def main():
             print("Error: No proxies found in config.PROXY_LIST")
             return
             
-        # Try proxies in order (First then Second...)
+        # Try proxies best first (healthy, lowest latency)
         session_created = False
-        for proxy in config.PROXY_LIST:
+        for proxy in get_proxy_manager().ordered():
             print(f"Trying proxy {proxy[1]} for {phone}...")
             if await try_connect_with_proxy(phone, proxy, target_dir):
                 session_created = True
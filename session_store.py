@@ -0,0 +1,97 @@
+import os
+import time
+import sqlite3
+import config
+
+# Scan result fields kept per session (everything scan_one returns)
+FIELDS = ('status', 'id', 'username', 'first_name', 'last_name', 'phone', 'about', 'photo')
+
+
+def connect(db_path=None):
+    db_path = db_path or config.SESSION_INFO_DB
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    db = sqlite3.connect(db_path, timeout=5)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+               "path TEXT PRIMARY KEY, folder TEXT, status TEXT, id INTEGER, username TEXT, "
+               "first_name TEXT, last_name TEXT, phone TEXT, about TEXT, photo TEXT, scanned_at REAL)")
+    db.execute("CREATE INDEX IF NOT EXISTS sessions_folder ON sessions (folder)")
+    db.execute("CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username)")
+    db.execute("CREATE INDEX IF NOT EXISTS sessions_phone ON sessions (phone)")
+    return db
+
+
+def top_folder(rel_path):
+    """First component of a SESSIONS_DIR-relative path ('' for sessions at the top level)"""
+    parts = rel_path.replace('\\', '/').split('/')
+    return parts[0] if len(parts) > 1 else ''
+
+
+class SessionStore:
+    """Last scan result of every session, so listings don't have to touch Telegram.
+
+    Rows are keyed by the path relative to SESSIONS_DIR and carry the time
+    they were scanned; anything older than SESSION_INFO_MAX_AGE is reported
+    as stale and can be rescanned in the background.
+    """
+
+    def __init__(self, db_path=None, max_age=None):
+        self.db = connect(db_path)
+        self.max_age = max_age or config.SESSION_INFO_MAX_AGE
+
+    def save(self, rel_path, info, scanned_at=None):
+        values = [info.get(f) for f in FIELDS]
+        self.db.execute(f"INSERT OR REPLACE INTO sessions (path, folder, {', '.join(FIELDS)}, scanned_at) "
+                        f"VALUES (?, ?, {', '.join('?' * len(FIELDS))}, ?)",
+                        [rel_path, top_folder(rel_path)] + values + [scanned_at or time.time()])
+        self.db.commit()
+
+    def set_photo(self, rel_path, photo):
+        self.db.execute("UPDATE sessions SET photo = ? WHERE path = ?", (photo, rel_path))
+        self.db.commit()
+
+    def _info(self, row):
+        info = {f: row[f] for f in FIELDS if row[f] is not None}
+        info['scanned_at'] = row['scanned_at']
+        return info
+
+    def get(self, rel_path):
+        row = self.db.execute("SELECT * FROM sessions WHERE path = ?", (rel_path,)).fetchone()
+        return self._info(row) if row else None
+
+    def many(self, rel_paths):
+        """{path: info} for those of `rel_paths` that were scanned before"""
+        rel_paths = list(rel_paths)
+        found = {}
+        for i in range(0, len(rel_paths), 500):
+            chunk = rel_paths[i:i + 500]
+            rows = self.db.execute(f"SELECT * FROM sessions WHERE path IN ({', '.join('?' * len(chunk))})", chunk)
+            found.update((row['path'], self._info(row)) for row in rows)
+        return found
+
+    def paths(self):
+        return [row['path'] for row in self.db.execute("SELECT path FROM sessions")]
+
+    def is_stale(self, info, now=None):
+        return info is None or (now or time.time()) - info['scanned_at'] > self.max_age
+
+    def forget(self, rel_paths):
+        """Drop rows of sessions that no longer exist"""
+        self.db.executemany("DELETE FROM sessions WHERE path = ?", [(p,) for p in rel_paths])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+_store = None
+
+
+def get_session_store():
+    """The process-wide SessionStore"""
+    global _store
+    if _store is None:
+        _store = SessionStore()
+    return _store
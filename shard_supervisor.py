@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import config
+
+
+def partition_config(group_config, shards, weight):
+    """Split config keys into `shards` lists.
+
+    Entries sharing a session folder always land in the same shard, so every
+    session is only ever opened by one process. Folders are placed largest
+    first onto the least loaded shard (`weight(folder)` = number of sessions).
+    """
+    folders = {}
+    for key, item in group_config.items():
+        folders.setdefault(item.get('session_folder', key), []).append(key)
+
+    loads = [0] * shards
+    parts = [[] for _ in range(shards)]
+    for folder in sorted(folders, key=lambda f: (-weight(f), f)):
+        target = loads.index(min(loads))
+        parts[target].extend(folders[folder])
+        loads[target] += max(weight(folder), 1)
+    return parts
+
+
+def status_path(shard):
+    return os.path.join(config.STATE_DIR, f"shard_{shard}.json")
+
+
+def write_status(shard, status):
+    """Called from inside a shard to publish its counters to the supervisor"""
+    os.makedirs(config.STATE_DIR, exist_ok=True)
+    path = status_path(shard)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dict(status, shard=shard, pid=os.getpid(), updated=time.time()), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_status(shard):
+    try:
+        with open(status_path(shard), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_status(shards, procs):
+    now = time.time()
+    lines = ["=== Shards ==="]
+    totals = {'groups': 0, 'sessions': 0, 'sends': 0, 'failures': 0, 'cooldowns': 0}
+    for i in range(shards):
+        proc = procs.get(i)
+        state = "running" if proc and proc.poll() is None else "down"
+        status = read_status(i)
+        if not status:
+            lines.append(f"  shard {i}: {state}, no status yet")
+            continue
+        for k in totals:
+            totals[k] += status.get(k, 0)
+        lines.append(f"  shard {i} (pid {status['pid']}, {state}, {now - status['updated']:.0f}s ago): "
+                     f"{status.get('groups', 0)} groups, {status.get('sessions', 0)} sessions, "
+                     f"{status.get('sends', 0)} sent, {status.get('failures', 0)} failed, "
+                     f"{status.get('cooldowns', 0)} cooling down")
+    lines.append(f"  total: {totals['groups']} groups, {totals['sessions']} sessions, "
+                 f"{totals['sends']} sent, {totals['failures']} failed, {totals['cooldowns']} cooling down")
+    return "\n".join(lines)
+
+
+def _spawn(script, argv, shards, shard):
+    cmd = [sys.executable, script] + argv + ['--shards', str(shards), '--shard', str(shard)]
+    print(f"[supervisor] Starting shard {shard}: {' '.join(cmd)}")
+    return subprocess.Popen(cmd)
+
+
+def restart_argv(argv):
+    """argv without --reset-cursor / --seek N: a restarted shard resumes, it doesn't rewind"""
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--reset-cursor' or arg.startswith('--seek='):
+            continue
+        elif arg == '--seek':
+            skip = True
+        else:
+            result.append(arg)
+    return result
+
+
+def supervise(script, argv, shards, restart=True):
+    """Run one sender process per shard, restart crashed ones and print aggregated status"""
+    procs = {i: _spawn(script, argv, shards, i) for i in range(shards)}
+    resume_argv = restart_argv(argv)
+    backoff = {i: config.SHARD_RESTART_DELAY for i in range(shards)}
+    restart_at = {}     # shard -> monotonic time to respawn a crashed shard
+    next_report = time.monotonic() + config.STATUS_REPORT_INTERVAL
+    try:
+        while procs:
+            time.sleep(1)
+            for i, proc in list(procs.items()):
+                if i in restart_at:
+                    if time.monotonic() >= restart_at[i]:
+                        del restart_at[i]
+                        procs[i] = _spawn(script, resume_argv, shards, i)
+                    continue
+                code = proc.poll()
+                if code is None:
+                    continue
+                if code == 0 or not restart:
+                    print(f"[supervisor] Shard {i} exited with code {code}")
+                    del procs[i]
+                    continue
+                print(f"[supervisor] Shard {i} crashed (code {code}). Restarting in {backoff[i]}s...")
+                restart_at[i] = time.monotonic() + backoff[i]
+                backoff[i] = min(backoff[i] * 2, config.RECONNECT_BACKOFF_MAX)
+            if time.monotonic() >= next_report:
+                print(format_status(shards, procs))
+                next_report = time.monotonic() + config.STATUS_REPORT_INTERVAL
+    except KeyboardInterrupt:
+        print("[supervisor] Stopping shards...")
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        print(format_status(shards, procs))
@@ -0,0 +1,117 @@
+import os
+import re
+import asyncio
+import csv
+import glob
+import shutil
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+import config
+import sender
+from virtual_clock import run_virtual
+from fake_telegram import FakeBehavior, fake_sender
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(text):
+    """'24h', '90m', '2d', '3600' (seconds) -> seconds"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', str(text).lower())
+    if not match:
+        raise ValueError(f"invalid duration '{text}' (use e.g. 3600, 90m, 24h, 2d)")
+    return float(match.group(1)) * _UNITS[match.group(2) or 's']
+
+
+async def _run_for(duration):
+    """sender.main() until it finishes or `duration` virtual seconds pass"""
+    try:
+        await asyncio.wait_for(sender.main(), duration)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _seed_cursors(state_dir):
+    # Start from the live positions, but never write back to them
+    os.makedirs(state_dir, exist_ok=True)
+    stem = os.path.splitext(config.CURSOR_FILE)[0]
+    for path in glob.glob(os.path.join(config.STATE_DIR, f"{stem}*.json")):
+        shutil.copy2(path, state_dir)
+
+
+def _gaps(times):
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def summarize(events, duration):
+    """Per-group cadence, per-account load and bandwidth from the send timeline"""
+    hours = duration / 3600 or 1
+    groups, accounts = {}, {}
+    for e in events:
+        groups.setdefault(e['group'], []).append(e)
+        accounts.setdefault(e['account'], []).append(e)
+
+    lines = [f"Simulated {duration / 3600:.1f}h: {len(events)} sends "
+             f"({len(events) / hours:.1f}/h), {len(accounts)} accounts, {len(groups)} groups", "",
+             "Groups:"]
+    for group, sends in sorted(groups.items()):
+        gaps = _gaps([e['t'] for e in sends])
+        uploaded = sum(e['bytes'] for e in sends)
+        cadence = (f"gap mean {sum(gaps) / len(gaps):.0f}s, min {min(gaps):.0f}s, max {max(gaps):.0f}s"
+                   if gaps else "single send")
+        lines.append(f"  {group}: {len(sends)} sends ({len(sends) / hours:.1f}/h), {cadence}, "
+                     f"media {sum(1 for e in sends if e['kind'] == 'media')}, uploaded {uploaded / 1e6:.1f} MB")
+
+    lines += ["", "Accounts (busiest first):"]
+    busiest = sorted(accounts.items(), key=lambda kv: len(kv[1]), reverse=True)
+    for account, sends in busiest[:20]:
+        per_hour = {}
+        for e in sends:
+            per_hour[int(e['t'] // 3600)] = per_hour.get(int(e['t'] // 3600), 0) + 1
+        lines.append(f"  {account}: {len(sends)} sends, peak {max(per_hour.values())}/h, "
+                     f"groups {len({e['group'] for e in sends})}")
+    if len(busiest) > 20:
+        counts = [len(s) for _, s in busiest]
+        lines.append(f"  ... {len(busiest) - 20} more (min {counts[-1]}, median {counts[len(counts) // 2]})")
+
+    uploaded = sum(e['bytes'] for e in events)
+    lines += ["", f"Bandwidth: {uploaded / 1e6:.1f} MB uploaded, {uploaded / 1e6 / hours * 24:.1f} MB/day projected "
+                  f"(first upload per account; later sends reuse the cached file)"]
+    return "\n".join(lines)
+
+
+def run(args):
+    """sender.py --simulate: run the real scheduler and account selection on a virtual clock"""
+    duration = parse_duration(args.duration)
+    behavior = FakeBehavior(seed=1)
+    group_config = sender.load_group_config()
+    links = {item['group_link']: key for key, item in group_config.items()}
+
+    with tempfile.TemporaryDirectory(prefix='sender_sim_') as root:
+        sandbox = os.path.join(root, 'sandbox')
+        _seed_cursors(os.path.join(sandbox, 'state'))
+        devnull = None if args.verbose else open(os.devnull, 'w', encoding='utf-8')
+        output = contextlib.redirect_stdout(devnull) if devnull else contextlib.nullcontext()
+        try:
+            with fake_sender(sandbox, behavior), output:
+                _, elapsed = run_virtual(_run_for(duration))
+        finally:
+            if devnull:
+                devnull.close()
+
+    start = datetime.now()
+    events = []
+    for t, account, chat, kind, size in behavior.sent:
+        link = behavior.peer_names.get(chat, str(chat))
+        events.append({'t': t, 'at': (start + timedelta(seconds=t)).strftime('%Y-%m-%d %H:%M:%S'),
+                       'group': links.get(link, link), 'account': account, 'kind': kind, 'bytes': size})
+
+    os.makedirs(config.SIMULATION_DIR, exist_ok=True)
+    timeline = os.path.join(config.SIMULATION_DIR, f"timeline_{start.strftime('%Y%m%d_%H%M%S')}.csv")
+    with open(timeline, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['t', 'at', 'group', 'account', 'kind', 'bytes'])
+        writer.writeheader()
+        writer.writerows(events)
+
+    print(summarize(events, min(duration, elapsed)))
+    print(f"\nTimeline: {timeline}")
@@ -5,6 +5,7 @@ import time
 from dotenv import load_dotenv
 import os
 import config
+from proxy_manager import get_proxy_manager
 
 # 加载环境变量
 load_dotenv()
@@ -54,11 +55,14 @@ async def test_proxy(proxy_tuple):
     # 测试Telegram连接
     tg_success, tg_result, status = await test_telegram_proxy(proxy_tuple)
     
+    # 测试结果同样计入共享的代理健康度
     if isinstance(tg_result, float):
         print(f"   ✅ 连接成功 (延迟: {tg_result:.2f}秒)")
         print(f"   状态: {status}")
+        get_proxy_manager().record_success(proxy_tuple, tg_result)
     else:
         print(f"   ❌ 连接失败: {tg_result}")
+        get_proxy_manager().record_failure(proxy_tuple)
     
     return {
         'proxy': f"{addr}:{port}",
@@ -97,5 +101,8 @@ async def main():
                 print(f"{result['proxy']} - {result['status']}")
                 print(f"延迟: {result['result']:.2f}秒")
 
+    print()
+    print(get_proxy_manager().format_report())
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,9 +1,12 @@
 import os
 import asyncio
+import time
 import argparse
 from telethon import TelegramClient
 from dotenv import load_dotenv
 import config
+from identity_cache import get_identity
+from proxy_manager import get_proxy_manager
 
 # 加载环境变量
 load_dotenv()
@@ -31,11 +34,18 @@ async def try_connect_with_proxy(session_file, proxy_config, sessions_dir):
             proxy=proxy_config
         )
         
-        # 尝试连接
-        await client.connect()
+        # 尝试连接（结果计入代理健康度）
+        proxies = get_proxy_manager()
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception:
+            proxies.record_failure(proxy_config, session_path)
+            raise
+        proxies.record_success(proxy_config, time.monotonic() - started, session_path)
         
         if await client.is_user_authorized():
-            me = await client.get_me()
+            me = await get_identity(client, session_path)
             # print(f"[成功] {session_file} 已连接: {me.first_name} (@{me.username})")
             return True, client, f"已授权 (@{me.username})"
         else:
@@ -54,7 +64,8 @@ async def test_session(session_file, sessions_dir):
             return session_file, None, "无代理可用"
 
         print(f"开始测试: {session_file}")
-        for proxy in config.PROXY_LIST:
+        session_path = os.path.join(sessions_dir, session_file.replace('.session', ''))
+        for proxy in get_proxy_manager().ordered(session_path):
             success, client, status = await try_connect_with_proxy(session_file, proxy, sessions_dir)
             if success:
                 if client:
@@ -0,0 +1,69 @@
+import asyncio
+
+
+class _VirtualSelector:
+    """Selector wrapper that jumps the clock instead of sleeping.
+
+    When the loop would block waiting for its next timer and no I/O is ready,
+    time is advanced straight to that timer. Real I/O (and wake-ups from
+    executor threads) still goes through the real selector.
+    """
+
+    def __init__(self, selector, loop):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if events:
+            return events
+        if timeout is None:
+            # Nothing scheduled: only a real event can wake us
+            return self._selector.select(None)
+        if timeout > 0:
+            self._loop.advance(timeout)
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() only moves when every task is waiting on a timer.
+
+    asyncio.sleep(3600) returns immediately in wall-clock terms, so hours of
+    sender scheduling run in seconds. Anything that uses loop.time() (the
+    scheduler, rate_limit.clock(), wait_for timeouts) sees virtual time.
+    """
+
+    def __init__(self, start=0.0):
+        self._virtual_now = start
+        super().__init__()
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self):
+        return self._virtual_now
+
+    def advance(self, seconds):
+        self._virtual_now += seconds
+
+
+def run_virtual(coro, start=0.0):
+    """asyncio.run() on a VirtualClockLoop. Returns (result, virtual seconds elapsed)."""
+    loop = VirtualClockLoop(start)
+    try:
+        asyncio.set_event_loop(loop)
+        result = loop.run_until_complete(coro)
+        return result, loop.time() - start
+    finally:
+        try:
+            # Same cleanup as asyncio.run(): cancel whatever is still running
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -15,6 +15,8 @@ interface SessionInfo {
   about?: string;
   photo?: string;
   message?: string;
+  scanned_at?: number;
+  photo_pending?: boolean;
 }
 
 interface Session {
@@ -22,6 +24,7 @@ interface Session {
   name: string;
   folder: string;
   info?: SessionInfo;
+  stale?: boolean;
   scanning?: boolean;
 }
 
@@ -70,17 +73,19 @@ export default function Home() {
     }
   };
 
-  const fetchSessions = async (folder?: string) => {
+  const fetchSessions = async (folder?: string, refresh = false) => {
     setLoading(true);
     try {
-      const url = folder ? `${API_BASE}/api/sessions?folder=${encodeURIComponent(folder)}` : `${API_BASE}/api/sessions`;
-      const res = await axios.get(url);
-      // Preserve existing info if re-fetching? Or just reset. Let's reset for now to be simple.
-      // Or better: update listing but keep info if path matches.
+      // Rows come with the last cached scan; with refresh (the Refresh button) stale ones
+      // are also rescanned by the backend in the background
+      const params: Record<string, string> = {};
+      if (folder) params.folder = folder;
+      if (refresh) params.refresh = 'true';
+      const res = await axios.get(`${API_BASE}/api/sessions`, { params });
       const newSessions: Session[] = res.data.map((s: any) => ({
         ...s,
         scanning: false,
-        info: undefined
+        info: s.info || undefined
       }));
       setSessions(newSessions);
     } catch (err) {
@@ -91,6 +96,26 @@ export default function Home() {
     }
   };
 
+  // The backend fetches profile photos after the scan returns: poll until the thumbnail is ready
+  const pollPhoto = async (path: string) => {
+    for (let attempt = 0; attempt < 20; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, 1500));
+      try {
+        const res = await axios.get(`${API_BASE}/api/session/photo`, { params: { path } });
+        if (res.data.photo) {
+          setSessions(prev => prev.map(s =>
+            s.path === path && s.info ? { ...s, info: { ...s.info, photo: res.data.photo, photo_pending: false } } : s
+          ));
+          return;
+        }
+        if (!res.data.pending) return;
+      } catch (err) {
+        console.error(err);
+        return;
+      }
+    }
+  };
+
   const scanSession = async (session: Session) => {
     setSessions(prev => prev.map(s => s.path === session.path ? { ...s, scanning: true } : s));
 
@@ -99,6 +124,7 @@ export default function Home() {
       setSessions(prev => prev.map(s =>
         s.path === session.path ? { ...s, scanning: false, info: res.data } : s
       ));
+      if (res.data.photo_pending) pollPhoto(session.path);
     } catch (err) {
       console.error(err);
       setSessions(prev => prev.map(s =>
@@ -107,17 +133,67 @@ export default function Home() {
     }
   };
 
+  // Scan one folder on the backend: sessions are scanned concurrently there and
+  // each result arrives as one JSON line as soon as it is done
+  const streamFolderScan = async (folder: string, paths: string[], pending: Set<string>) => {
+    const res = await fetch(`${API_BASE}/api/folders/${encodeURIComponent(folder)}/scan`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ paths }),
+    });
+    if (!res.ok || !res.body) throw new Error(`Scan of ${folder} failed: ${res.status}`);
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() || '';
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const { path, ...info } = JSON.parse(line);
+        pending.delete(path);
+        setSessions(prev => prev.map(s => s.path === path ? { ...s, scanning: false, info } : s));
+        if (info.photo_pending) pollPhoto(path);
+      }
+    }
+  };
+
   const scanAllSessions = async () => {
-    setScanningAll(true);
-    // Batch process to be kind to the backend
-    const batchSize = 3;
     const sessionsToScan = sessions.filter(s => !s.info || s.info.status !== 'authorized');
+    if (sessionsToScan.length === 0) return;
+    setScanningAll(true);
+    const pending = new Set(sessionsToScan.map(s => s.path));
+    setSessions(prev => prev.map(s => pending.has(s.path) ? { ...s, scanning: true } : s));
 
-    for (let i = 0; i < sessionsToScan.length; i += batchSize) {
-      const batch = sessionsToScan.slice(i, i + batchSize);
-      await Promise.all(batch.map(s => scanSession(s)));
+    // "All Folders" view: one stream per top-level folder; sessions lying
+    // directly in SESSIONS_DIR have no folder and are scanned one by one
+    const byFolder = new Map<string, string[]>();
+    const topLevel: Session[] = [];
+    for (const s of sessionsToScan) {
+      const parts = s.path.split(/[\\/]/);
+      if (parts.length === 1) {
+        topLevel.push(s);
+        continue;
+      }
+      byFolder.set(parts[0], [...(byFolder.get(parts[0]) || []), s.path]);
+    }
+    try {
+      await Promise.all([
+        ...Array.from(byFolder, ([folder, paths]) =>
+          streamFolderScan(folder, paths, pending).catch(err => console.error(err))
+        ),
+        ...topLevel.map(s => scanSession(s).then(() => { pending.delete(s.path); })),
+      ]);
+    } finally {
+      // Anything a stream never reported
+      setSessions(prev => prev.map(s =>
+        pending.has(s.path) ? { ...s, scanning: false, info: { status: 'error', message: 'Network Error' } } : s
+      ));
+      setScanningAll(false);
     }
-    setScanningAll(false);
   };
 
   const openEdit = (session: Session) => {
@@ -181,7 +257,7 @@ export default function Home() {
               ))}
             </select>
             <button
-              onClick={() => fetchSessions(selectedFolder)}
+              onClick={() => fetchSessions(selectedFolder, true)}
               disabled={loading}
               className="flex items-center px-4 py-2 bg-blue-600 text-white rounded-lg hover:bg-blue-700 disabled:opacity-50"
             >
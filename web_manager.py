@@ -1,9 +1,13 @@
 import os
+import json
 import glob
 import asyncio
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Literal
+from fastapi import FastAPI, HTTPException, Request, Response, Form, UploadFile, File, Body, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -11,8 +15,28 @@ from telethon import TelegramClient, functions, types
 import uvicorn
 import config
 import shutil
+from identity_cache import get_identity, save_identity
+from proxy_manager import get_proxy_manager
+from client_pool import LruClientPool
+from session_store import get_session_store
+from session_catalog import SessionCatalog
+from media_prep import make_thumbnail
+import metrics
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    evictor = asyncio.create_task(clients.run_evictor())
+    try:
+        yield
+    finally:
+        evictor.cancel()
+        for task in list(refresh_tasks) + list(photo_tasks.values()):
+            task.cancel()
+        if thumbnail_pool is not None:
+            thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+        await clients.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration - allow all origins for Railway deployment
 origins = ["*"]
@@ -23,15 +47,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
 # Mount static files (photos)
-os.makedirs("static/photos", exist_ok=True)
+os.makedirs(config.PHOTOS_DIR, exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Proxy logic (reused)
 async def get_client(session_path: str):
-    """Create and connect a client for a specific session file, trying proxies in order."""
+    """Create and connect a client for a specific session file, best proxy first."""
     if not config.PROXY_LIST:
         # Try without proxy? Or fail? The previous code implied proxy was required if list existed.
         # If empty list, passing None to proxy usually works for direct connection.
@@ -39,8 +64,9 @@ async def get_client(session_path: str):
         await client.connect()
         return client
 
+    proxies = get_proxy_manager()
     last_exc = None
-    for proxy_conf in config.PROXY_LIST:
+    for proxy_conf in proxies.ordered(session_path):
         try:
             client = TelegramClient(
                 session_path,
@@ -48,15 +74,20 @@ async def get_client(session_path: str):
                 config.API_HASH,
                 proxy=proxy_conf
             )
+            started = time.monotonic()
             await client.connect()
+            proxies.record_success(proxy_conf, time.monotonic() - started, session_path)
             return client
         except Exception as e:
             last_exc = e
+            proxies.record_failure(proxy_conf, session_path)
             # Try next proxy
-            pass
             
     raise Exception(f"Failed to connect with any proxy. Last error: {last_exc}")
 
+# Connected clients are kept between requests, so repeat scans/updates skip the handshake
+clients = LruClientPool(get_client)
+
 class SessionUpdate(BaseModel):
     session_file: str
     first_name: Optional[str] = None
@@ -64,101 +95,232 @@ class SessionUpdate(BaseModel):
     username: Optional[str] = None
     about: Optional[str] = None
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text format for everything sender/monitors/scrapers recorded"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/folders")
 async def list_folders():
     """List all folders in SESSIONS_DIR"""
-    folders = []
-    if os.path.exists(config.SESSIONS_DIR):
-        for item in os.listdir(config.SESSIONS_DIR):
-            item_path = os.path.join(config.SESSIONS_DIR, item)
-            if os.path.isdir(item_path):
-                # Count session files in this folder
-                session_count = len([f for f in os.listdir(item_path) if f.endswith('.session')])
-                folders.append({
-                    "name": item,
-                    "session_count": session_count
-                })
-    folders.sort(key=lambda x: x['name'])
-    return folders
+    return catalog.folders()
+
+# Index of the session files, re-read only when a directory changes
+catalog = SessionCatalog()
+pruned_version = None
+
+# Sessions being rescanned in the background, and the tasks doing it
+refreshing = set()
+refresh_tasks = set()
+# Shared by folder scans and background refreshes, so concurrent requests don't multiply the connections
+scan_semaphore = asyncio.Semaphore(config.WEB_SCAN_CONCURRENCY)
+
+def refresh_in_background(rel_paths):
+    """Rescan sessions without making the caller wait; results land in the session store"""
+    rel_paths = [p for p in rel_paths if p not in refreshing]
+    if not rel_paths:
+        return
+    refreshing.update(rel_paths)
+
+    async def refresh(rel_path):
+        try:
+            async with scan_semaphore:
+                await scan_one(rel_path)
+        finally:
+            refreshing.discard(rel_path)
+
+    for rel_path in rel_paths:
+        task = asyncio.create_task(refresh(rel_path))
+        refresh_tasks.add(task)
+        task.add_done_callback(refresh_tasks.discard)
 
 @app.get("/api/sessions")
-async def list_sessions(folder: str = None):
-    """List all session files in SESSIONS_DIR, optionally filtered by folder"""
-    sessions = []
-    
-    # Determine which directory to scan
-    if folder:
-        scan_dir = os.path.join(config.SESSIONS_DIR, folder)
-    else:
-        scan_dir = config.SESSIONS_DIR
-    
-    if not os.path.exists(scan_dir):
-        return sessions
-    
-    for root, dirs, files in os.walk(scan_dir):
-        for file in files:
-            if file.endswith(".session"):
-                full_path = os.path.join(root, file)
-                rel_path = os.path.relpath(full_path, config.SESSIONS_DIR)
-                sessions.append({
-                    "path": rel_path,
-                    "name": file,
-                    "folder": os.path.dirname(rel_path)
-                })
-    
-    # Sort by folder then name
-    sessions.sort(key=lambda x: (x['folder'], x['name']))
+async def list_sessions(
+    response: Response,
+    folder: str = None,
+    refresh: bool = False,
+    q: str = None,
+    sort: Literal['path', 'name', 'modified'] = 'path',
+    order: Literal['asc', 'desc'] = 'asc',
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+):
+    """List session files in SESSIONS_DIR, optionally filtered by folder and name.
+
+    Served from the in-memory catalog: `offset`/`limit` select a page and the
+    X-Total-Count header carries the number of matching sessions. Each row
+    has the last scan result from the session store (or None) and whether it
+    is stale; with refresh=true stale rows are rescanned in the background.
+    """
+    global pruned_version
+    matches = catalog.sessions(folder, q, sort, order == 'desc')
+    response.headers["X-Total-Count"] = str(len(matches))
+    sessions = [dict(s) for s in matches[offset:offset + limit if limit else None]]
+
+    store = get_session_store()
+    if pruned_version != catalog.version:
+        # Session files were added/removed: drop rows of the ones that are gone
+        pruned_version = catalog.version
+        listed = {s['path'] for s in catalog.sessions()}
+        gone = [p for p in store.paths() if p not in listed]
+        if gone:
+            store.forget(gone)
+    cached = store.many(s['path'] for s in sessions)
+    now = time.time()
+    for s in sessions:
+        s['info'] = cached.get(s['path'])
+        s['stale'] = store.is_stale(s['info'], now)
+    if refresh:
+        refresh_in_background([s['path'] for s in sessions if s['stale']])
     return sessions
 
-@app.post("/api/session/scan")
-async def scan_session(data: dict):
-    """Connect to session and get user info"""
-    rel_path = data.get("path")
-    if not rel_path:
-        raise HTTPException(status_code=400, detail="Path required")
-        
+async def scan_one(rel_path):
+    """Connect to one session (path relative to SESSIONS_DIR) and get user info"""
     full_path = os.path.join(config.SESSIONS_DIR, rel_path)
     
     # Telethon client init takes path w/o extension usually
     session_path_no_ext = os.path.splitext(full_path)[0]
     
-    client = await get_client(session_path_no_ext)
-    
     try:
-        if not await client.is_user_authorized():
-            await client.disconnect()
-            return {"status": "unauthorized"}
-            
-        me = await client.get_me()
-        
-        # Download profile photo
-        photo_path = f"static/photos/{me.id}.jpg"
-        # Always re-download to be fresh? Or check exist? Let's check exist for speed.
-        if not os.path.exists(photo_path):
-            await client.download_profile_photo(me, file=photo_path)
-            
-        # Get full info for About (Bio)
-        full_user = await client(functions.users.GetFullUserRequest(me))
-        about = full_user.full_user.about
-            
-        info = {
-            "status": "authorized",
-            "id": me.id,
-            "username": me.username,
-            "first_name": me.first_name,
-            "last_name": me.last_name,
-            "phone": me.phone,
-            "about": about,
-            # Return absolute URL or relative to backend
-            "photo": f"http://127.0.0.1:8000/{photo_path}" if os.path.exists(photo_path) else None
-        }
+        async with clients.session(session_path_no_ext) as client:
+            if not await client.is_user_authorized():
+                info = {"status": "unauthorized"}
+                get_session_store().save(rel_path, info)
+                return info
+
+            # One request gives the bio and the current user; a scan is an explicit
+            # refresh, so the cached identity is replaced rather than read
+            full_user = await client(functions.users.GetFullUserRequest(types.InputUserSelf()))
+            about = full_user.full_user.about
+            me = next(u for u in full_user.users if u.id == full_user.full_user.id)
+            save_identity(full_path, me)
+
+            # Thumbnails are named after the photo id, so a new profile photo gets a new URL
+            photo = full_user.full_user.profile_photo
+            photo_stem = f"{me.id}_{photo.id}" if isinstance(photo, types.Photo) else None
+            thumb = find_thumb(photo_stem) if photo_stem else None
+
+            info = {
+                "status": "authorized",
+                "id": me.id,
+                "username": me.username,
+                "first_name": me.first_name,
+                "last_name": me.last_name,
+                "phone": me.phone,
+                "about": about,
+                "photo": photo_url(thumb) if thumb else None,
+                # Not downloaded yet: fetched in the background, poll /api/session/photo
+                "photo_pending": bool(photo_stem and not thumb),
+            }
     except Exception as e:
+        # Not stored: a failed connect says nothing about the account, keep the last good scan
         return {"status": "error", "message": str(e)}
-    finally:
-        await client.disconnect()
-        
+
+    get_session_store().save(rel_path, info)
+    if info["photo_pending"]:
+        fetch_photo_in_background(rel_path, session_path_no_ext, photo_stem)
     return info
 
+# Profile photos being downloaded/thumbnailed (rel_path -> task), and the worker pool
+photo_tasks = {}
+thumbnail_pool = None
+
+def find_thumb(stem):
+    """Existing thumbnail for a photo (.webp, or .jpg when Pillow is missing)"""
+    for ext in ('.webp', '.jpg'):
+        path = os.path.join(config.THUMBS_DIR, stem + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def photo_url(thumb_path):
+    # Return absolute URL or relative to backend
+    return f"http://127.0.0.1:8000/api/photos/{os.path.basename(thumb_path)}"
+
+def fetch_photo_in_background(rel_path, session_path, stem):
+    if rel_path not in photo_tasks:
+        task = photo_tasks[rel_path] = asyncio.create_task(fetch_photo(rel_path, session_path, stem))
+        task.add_done_callback(lambda t: photo_tasks.pop(rel_path, None))
+
+async def fetch_photo(rel_path, session_path, stem):
+    """Download the full profile photo, thumbnail it in the worker pool and store its URL"""
+    global thumbnail_pool
+    try:
+        async with clients.session(session_path) as client:
+            original = await client.download_profile_photo(
+                'me', file=os.path.join(config.PHOTOS_DIR, f"{stem}.jpg"))
+        if not original:
+            return
+        if thumbnail_pool is None:
+            thumbnail_pool = ProcessPoolExecutor(max_workers=config.THUMBNAIL_WORKERS)
+        thumb = await asyncio.get_running_loop().run_in_executor(
+            thumbnail_pool, make_thumbnail, original, os.path.join(config.THUMBS_DIR, stem),
+            config.THUMBNAIL_SIDE)
+        get_session_store().set_photo(rel_path, photo_url(thumb))
+    except Exception as e:
+        print(f"Could not fetch profile photo for {rel_path}: {e}")
+
+@app.get("/api/session/photo")
+async def session_photo(path: str):
+    """Photo URL of a scanned session once its thumbnail is ready"""
+    info = get_session_store().get(path)
+    return {"photo": info.get("photo") if info else None, "pending": path in photo_tasks}
+
+@app.get("/api/photos/{name}")
+async def get_photo(name: str, request: Request):
+    """Profile photo thumbnails. File names change with the photo, so they can be cached forever."""
+    if os.path.basename(name) != name or not name.endswith(('.webp', '.jpg')):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(config.THUMBS_DIR, name)
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Not found")
+    headers = {
+        "ETag": f'"{os.path.splitext(name)[0]}-{st.st_size}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers)
+
+@app.post("/api/session/scan")
+async def scan_session(data: dict):
+    """Connect to session and get user info"""
+    rel_path = data.get("path")
+    if not rel_path:
+        raise HTTPException(status_code=400, detail="Path required")
+    return await scan_one(rel_path)
+
+@app.post("/api/folders/{name}/scan")
+async def scan_folder(name: str, data: dict = Body(None)):
+    """Scan every session of a folder concurrently, streaming one NDJSON line per session as it finishes.
+
+    An optional {"paths": [...]} body limits the scan to those sessions.
+    """
+    if not os.path.isdir(os.path.join(config.SESSIONS_DIR, name)):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    paths = [s['path'] for s in catalog.sessions(name)]
+    if data and data.get('paths') is not None:
+        wanted = set(data['paths'])
+        paths = [p for p in paths if p in wanted]
+
+    async def stream():
+        async def bounded(rel_path):
+            async with scan_semaphore:
+                return {"path": rel_path, **(await scan_one(rel_path))}
+
+        tasks = [asyncio.create_task(bounded(p)) for p in paths]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done, ensure_ascii=False) + "\n"
+        finally:
+            # Browser went away: don't keep scanning for nobody
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.post("/api/session/update")
 async def update_session(
     session_path: str = Form(...),
@@ -171,50 +333,50 @@ async def update_session(
     full_path = os.path.join(config.SESSIONS_DIR, session_path)
     session_path_no_ext = os.path.splitext(full_path)[0]
     
-    client = await get_client(session_path_no_ext)
-    
     try:
-        if not await client.is_user_authorized():
-            raise HTTPException(status_code=401, detail="Session unauthorized")
-            
-        # Update Profile (Name/About)
-        if first_name is not None or last_name is not None or about is not None:
-             await client(functions.account.UpdateProfileRequest(
-                 first_name=first_name if first_name else "",
-                 last_name=last_name if last_name else "", 
-                 about=about if about else ""
-             ))
-             
-        # Update Username
-        if username is not None:
-            # Check if username changed? Or just try update
-            # Error if username taken
-            try:
-                await client(functions.account.UpdateUsernameRequest(username=username))
-            except Exception as e:
-                # If username invalid or taken
-                return JSONResponse(status_code=400, content={"status": "error", "message": f"Username error: {str(e)}"})
-            
-        # Update Profile Photo
-        if file:
-            # Save temp file
-            temp_filename = f"temp_{file.filename}"
-            with open(temp_filename, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-                
-            # Upload
-            uploaded = await client.upload_file(temp_filename)
-            await client(functions.photos.UploadProfilePhotoRequest(file=uploaded))
-            
-            # Cleanup
-            os.remove(temp_filename)
-            
+        async with clients.session(session_path_no_ext) as client:
+            if not await client.is_user_authorized():
+                raise HTTPException(status_code=401, detail="Session unauthorized")
+
+            # Update Profile (Name/About)
+            if first_name is not None or last_name is not None or about is not None:
+                 await client(functions.account.UpdateProfileRequest(
+                     first_name=first_name if first_name else "",
+                     last_name=last_name if last_name else "",
+                     about=about if about else ""
+                 ))
+
+            # Update Username
+            if username is not None:
+                # Check if username changed? Or just try update
+                # Error if username taken
+                try:
+                    await client(functions.account.UpdateUsernameRequest(username=username))
+                except Exception as e:
+                    # If username invalid or taken
+                    return JSONResponse(status_code=400, content={"status": "error", "message": f"Username error: {str(e)}"})
+
+            # Update Profile Photo
+            if file:
+                # Save temp file
+                temp_filename = f"temp_{file.filename}"
+                with open(temp_filename, "wb") as buffer:
+                    shutil.copyfileobj(file.file, buffer)
+
+                # Upload
+                uploaded = await client.upload_file(temp_filename)
+                await client(functions.photos.UploadProfilePhotoRequest(file=uploaded))
+
+                # Cleanup
+                os.remove(temp_filename)
+
+            # Names/username may have changed: refresh the cached identity
+            await get_identity(client, full_path, refresh=True)
+
         return {"status": "success", "message": "Updated successfully"}
-        
+
     except Exception as e:
         return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
-    finally:
-        await client.disconnect()
 
 if __name__ == "__main__":
     uvicorn.run("web_manager:app", host="127.0.0.1", port=8000, reload=True)